@@ -0,0 +1,193 @@
+'''
+BulkCodec module.
+
+Offline decoding of large buffers of concatenated VM201 frames, e.g. months
+of captured status traffic, in array operations instead of one packet at a
+time:
+    - find the <STX><LEN> frame boundaries,
+    - validate the ETX byte and the checksum of every frame,
+    - extract the output, timer and input bits of all CMD_STATUS frames
+      into columnar arrays.
+
+NumPy is optional. Without it the same results are computed with a Python
+loop, which is some hundred times slower but needs nothing extra.
+
+    frames = scan(buffer)
+    statuses = decode_status(buffer)
+    print statuses.output[statuses.input == 1]
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from PacketCodec import COMMANDS, MAX_GENERIC_TCP_PACKET_SIZE, \
+    MIN_GENERIC_TCP_PACKET_SIZE
+from PacketLog import RX
+
+
+STX = ord(COMMANDS['STX'])
+ETX = ord(COMMANDS['ETX'])
+CMD_STATUS = ord(COMMANDS['CMD_STATUS'])
+LEN_CMD_STATUS = COMMANDS['LEN_CMD_STATUS']
+
+# Columns; numpy arrays, or array.array without numpy.
+Frames = namedtuple('Frames', 'offset length cmd valid')
+Statuses = namedtuple('Statuses', 'offset output timer input')
+
+
+def scan(buffer):
+    '''
+    Find all frames in buffer, and validate them.
+
+    A frame is <STX><LEN> with LEN in range, and an ETX at its last byte.
+    The first frame starts at the first such candidate; every next frame at
+    the first candidate at or after the end of the one before, so a 0x02
+    data byte inside a frame is never taken for the start of another frame.
+    Bytes between frames are skipped.
+
+    Unlike FrameReader, which takes every <STX><LEN> as a frame, a candidate
+    without its ETX is skipped: garbage that looks like <STX><LEN> does not
+    swallow the frame behind it, and the scan resyncs on the next 0x02.
+
+    @param buffer: str, bytearray, mmap or numpy uint8 array.
+    @return: Frames of offset, length, command byte and whether the checksum
+             is valid, one entry per frame.
+    '''
+
+    if np is None:
+        return scan_python(buffer)
+
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    n = len(data)
+
+    offset = np.flatnonzero(data[:-1] == STX)
+    length = data[offset + 1].astype(np.intp)
+    fits = (length >= MIN_GENERIC_TCP_PACKET_SIZE) & \
+        (length <= MAX_GENERIC_TCP_PACKET_SIZE) & (offset + length <= n)
+    offset, length = offset[fits], length[fits]
+    end = offset + length
+
+    framed = data[end - 1] == ETX
+    offset, length, end = offset[framed], length[framed], end[framed]
+
+    # The frame after a frame is the first candidate at or after its end.
+    # Follow that chain from the first candidate; by pointer doubling, so in
+    # log2(m) array operations instead of m Python steps.
+    m = len(offset)
+    if m:
+        jump = np.empty(m + 1, dtype=np.intp)
+        jump[:m] = np.searchsorted(offset, end)
+        jump[m] = m
+        keep = np.zeros(m + 1, dtype=bool)
+        keep[0] = True
+        steps = 1
+        while steps <= m:
+            # keep holds the first `steps` frames; add the next `steps`.
+            keep[jump[keep]] = True
+            jump = jump[jump]
+            steps *= 2
+        keep = keep[:m]
+        offset, length, end = offset[keep], length[keep], end[keep]
+
+    # The sum of all bytes but the ETX is 0 mod 256; uint8 sums wrap mod 256,
+    # so the sum of each frame is a difference of two running sums.
+    running = np.zeros(n + 1, dtype=np.uint8)
+    np.cumsum(data, dtype=np.uint8, out=running[1:])
+    valid = running[end - 1] == running[offset]
+
+    return Frames(offset, length, data[offset + 2], valid)
+
+
+def scan_python(buffer):
+    ''' scan() without numpy '''
+    data = bytearray(buffer)
+    n = len(data)
+    offsets, lengths, cmds, valid = \
+        array('l'), array('B'), array('B'), array('B')
+
+    i = 0
+    while i < n - 1:
+        length = data[i+1]
+        if data[i] != STX or length < MIN_GENERIC_TCP_PACKET_SIZE or \
+                length > MAX_GENERIC_TCP_PACKET_SIZE or i + length > n or \
+                data[i+length-1] != ETX:
+            i += 1
+            continue
+        offsets.append(i)
+        lengths.append(length)
+        cmds.append(data[i+2])
+        valid.append(sum(data[i:i+length-1]) & 0xFF == 0)
+        i += length
+
+    return Frames(offsets, lengths, cmds, valid)
+
+
+def decode_status(buffer, frames=None, validate=True):
+    '''
+    Extract all CMD_STATUS frames as columns.
+
+    @param frames: result of scan(buffer); scanned if None.
+    @param validate: skip frames with an invalid checksum.
+    @return: Statuses of offset, output, timer and input bits.
+    '''
+
+    if frames is None:
+        frames = scan(buffer)
+
+    if np is None:
+        data = bytearray(buffer)
+        columns = Statuses(array('l'), array('B'), array('B'), array('B'))
+        for offset, length, cmd, valid in zip(*frames):
+            if cmd != CMD_STATUS or length != LEN_CMD_STATUS or \
+                    (validate and not valid):
+                continue
+            columns.offset.append(offset)
+            columns.output.append(data[offset+3])
+            columns.timer.append(data[offset+4])
+            columns.input.append(data[offset+5])
+        return columns
+
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    status = (frames.cmd == CMD_STATUS) & (frames.length == LEN_CMD_STATUS)
+    if validate:
+        status &= frames.valid
+    offset = frames.offset[status]
+    return Statuses(offset, data[offset + 3], data[offset + 4],
+                    data[offset + 5])
+
+
+def capture_stream(path, direction=RX, stream=None):
+    '''
+    All bytes of one direction of a PacketCapture, concatenated.
+
+    @param stream: int; the bytes of this stream only. None concatenates
+                   every stream, one after another, so the frames of two
+                   connections are never interleaved.
+    @return: bytearray; input for scan and decode_status.
+    '''
+
+    from PacketCapture import CaptureReader
+
+    reader = CaptureReader(path)
+    try:
+        # One pass over the records; the data is sliced stream by stream.
+        chunks = dict()
+        for timestamp, record_stream, record_direction, offset, length in \
+                reader.records(direction, stream):
+            chunks.setdefault(record_stream, list()).append((offset, length))
+        data = bytearray()
+        for record_stream in sorted(chunks):
+            for offset, length in chunks[record_stream]:
+                data += reader.data(offset, length)
+    finally:
+        reader.close()
+    return data
@@ -0,0 +1,137 @@
+'''
+ChannelState class.
+
+The VM201 Ethernet Relay Card has 8 relays (Channels) and 1 input Channel.
+The state of all of them is three bitmasks, exactly as in a CMD_STATUS:
+    output status bits 7...0 = channels 8...1 ; bit=0 OFF; bit=1 ON
+    output timer status bits 7...0 = timer channels 8...1 ; bit=0 DISABLED
+    input status bit 0 = input channel;  bit=0 OFF; bit=1 ON
+ChannelState keeps these as ints in __slots__, so tracking thousands of
+cards costs a few bytes per card rather than nine objects with a __dict__.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from struct import Struct
+
+
+PACKED = Struct('BBB')
+
+# Sending these twice has the same effect as sending them once.
+IDEMPOTENT_COMMANDS = ['CMD_ON', 'CMD_OFF', 'CMD_UPDATE', 'CMD_PULSE',
+                       'CMD_TMR_ENA', 'CMD_TMR_DIS']
+
+
+def mask_of_channels(channel_ids):
+    '''
+    Return int channel mask; bits 7...0 = channels 8...1
+
+    @raise ValueError: a channel id is not 1...8; e.g. 9, the input.
+    '''
+
+    mask = 0
+    for channel_id in channel_ids:
+        if not 1 <= channel_id <= 8:
+            raise ValueError('Channel {0!r} is not 1...8'.format(channel_id))
+        mask |= 1 << (channel_id - 1)
+    return mask
+
+
+def channels_of_mask(mask):
+    ''' Return list of channel numbers (1-8) of which the bit is set '''
+    return [i + 1 for i in range(8) if mask >> i & 1]
+
+
+def apply_command(cmd, mask, output, timer):
+    '''
+    Predict the effect of cmd on the vm201 output and timer status.
+
+    @param cmd: CMD_FULL_NAME, as given in the COMMANDS dict.
+    @param mask: int; channel bits 7...0 = channels 8...1
+    @param output, timer: int; output and timer status bits before cmd.
+    @return: tuple (output, timer) of status bits after cmd.
+    '''
+
+    if cmd == 'CMD_ON' or cmd == 'CMD_PULSE':
+        # A pulse switches ON now; the OFF is a CMD_STATUS of its own later.
+        output |= mask
+    elif cmd == 'CMD_OFF':
+        output &= ~mask & 0xFF
+    elif cmd == 'CMD_TOGGLE':
+        output ^= mask
+    elif cmd == 'CMD_UPDATE':
+        output = mask
+    elif cmd == 'CMD_TMR_ENA':
+        timer |= mask
+    elif cmd == 'CMD_TMR_DIS':
+        timer &= ~mask & 0xFF
+    elif cmd == 'CMD_TMR_TOGGLE':
+        timer ^= mask
+
+    return output, timer
+
+
+class ChannelState(object):
+    __slots__ = ('output', 'timer', 'input')
+
+    def __init__(self, output=0, timer=0, input=0):
+        self.output = output
+        self.timer = timer
+        self.input = input
+
+    @classmethod
+    def from_status(cls, message):
+        ''' @param message: PacketCodec.Status '''
+        return cls(message.output, message.timer, message.input)
+
+    @classmethod
+    def unpack(cls, s):
+        return cls(*PACKED.unpack(s))
+
+    def pack(self):
+        ''' Three bytes: output, timer, input; as in a CMD_STATUS '''
+        return PACKED.pack(self.output, self.timer, self.input)
+
+    def __eq__(self, other):
+        return isinstance(other, ChannelState) and \
+            self.output == other.output and self.timer == other.timer and \
+            self.input == other.input
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.output | self.timer << 8 | self.input << 16
+
+    def __repr__(self):
+        return 'ChannelState(output={0:08b}, timer={1:08b}, input={2})'\
+            .format(self.output, self.timer, self.input)
+
+    def is_on(self, channel_id):
+        ''' Output channels 1-8; channel 9 is the input channel '''
+        if channel_id == 9:
+            return bool(self.input & 1)
+        return bool(self.output >> (channel_id - 1) & 1)
+
+    def timer_enabled(self, channel_id):
+        return bool(self.timer >> (channel_id - 1) & 1)
+
+    def copy(self):
+        return ChannelState(self.output, self.timer, self.input)
+
+    def apply(self, cmd, mask):
+        ''' Return the ChannelState predicted after cmd on channel mask '''
+        output, timer = apply_command(cmd, mask, self.output, self.timer)
+        return ChannelState(output, timer, self.input)
+
+    def diff(self, other):
+        '''
+        Bits that differ between self and other.
+
+        @return: tuple (output mask, timer mask, input mask); XOR of the bits.
+        '''
+
+        return (self.output ^ other.output, self.timer ^ other.timer,
+                self.input ^ other.input)
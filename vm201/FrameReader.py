@@ -0,0 +1,129 @@
+'''
+FrameReader class.
+
+Buffered reader that cuts the TCP byte stream of the VM201 into packets.
+TCP does not preserve packet boundaries: one recv may return half a packet,
+or nine CMD_NAME packets and a CMD_STATUS at once. Frames are therefore split
+on <STX><LEN> instead of trusting socket.recv(LEN_CMD_...) to return exactly
+one packet.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from socket import error
+
+from PacketLog import RX
+
+
+STX = 0x02
+MIN_GENERIC_TCP_PACKET_SIZE = 5
+MAX_GENERIC_TCP_PACKET_SIZE = 22
+
+
+class FrameReader(object):
+    def __init__(self, sock, size=4096, capture=None):
+        self.socket = sock
+        # Optional CaptureStream; gets every chunk exactly as received.
+        self.capture = capture
+
+        # Reusable receive buffer; bytes in [start, end) are not yet consumed.
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def pending(self):
+        ''' Number of received bytes that have not been returned as frame '''
+        return self.end - self.start
+
+    def fill(self):
+        '''
+        Read whatever the socket has available with a single recv syscall.
+
+        @return: int; number of bytes read. Zero if the peer closed.
+        '''
+
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif len(self.buffer) - self.end < MAX_GENERIC_TCP_PACKET_SIZE:
+            # Move the partial frame to the front of the buffer.
+            pending = self.end - self.start
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+
+        nbytes = self.socket.recv_into(self.view[self.end:])
+        if self.capture is not None and nbytes:
+            self.capture.record(RX, self.buffer[self.end:self.end+nbytes])
+        self.end += nbytes
+        return nbytes
+
+    def next_frame_offset(self):
+        '''
+        Find the next complete frame in the buffer without touching the socket.
+        The frame stays in self.buffer, at the returned offset, until the next
+        call of fill(); decode it in place with PacketCodec.decode_from.
+
+        @return: int offset of the frame in self.buffer, or None if the buffer
+                 does not (yet) hold a complete packet.
+        '''
+
+        buf = self.buffer
+        while self.end - self.start >= 2:
+            length = buf[self.start+1]
+            if buf[self.start] != STX or \
+                    length < MIN_GENERIC_TCP_PACKET_SIZE or \
+                    length > MAX_GENERIC_TCP_PACKET_SIZE:
+                # Not at a packet boundary: skip bytes until we resync on STX.
+                self.start += 1
+                continue
+
+            if self.end - self.start < length:
+                return None
+
+            offset = self.start
+            self.start += length
+            return offset
+
+        return None
+
+    def next_frame(self):
+        '''
+        Cut the next complete frame from the buffer; do not touch the socket.
+
+        @return: str containing the bytes of one packet, or None if the buffer
+                 does not (yet) hold a complete packet.
+        '''
+
+        offset = self.next_frame_offset()
+        if offset is None:
+            return None
+        return bytes(self.buffer[offset:offset+self.buffer[offset+1]])
+
+    def read_frame_offset(self):
+        '''
+        Return the offset in self.buffer of the next complete frame; block on
+        the socket until one arrives. Honours the socket timeout.
+        '''
+
+        while True:
+            offset = self.next_frame_offset()
+            if offset is not None:
+                return offset
+            if not self.fill():
+                raise error('Connection closed by the vm201.')
+
+    def read_frame(self):
+        '''
+        Return the next complete frame; block on the socket until one arrives.
+        Honours the timeout set on the socket (raises socket.timeout).
+        '''
+
+        offset = self.read_frame_offset()
+        return bytes(self.buffer[offset:offset+self.buffer[offset+1]])
+
+    def frames(self):
+        ''' Generator yielding complete frames as they arrive '''
+        while True:
+            yield self.read_frame()
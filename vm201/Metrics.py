@@ -0,0 +1,224 @@
+'''
+Metrics class.
+
+Latency histograms and counters of VM201 cards, per card:
+    vm201_command_seconds{card, command}    connect, login, status, CMD_ON, ...
+    vm201_command_errors_total{card, command}
+    vm201_packets_total{card, direction}    direction is rx or tx
+    vm201_bytes_total{card, direction}
+    vm201_timeouts_total{card}
+    vm201_checksum_errors_total{card}
+    vm201_length_errors_total{card}         undecodable packets
+    vm201_reconnects_total{card}
+    vm201_codec_seconds{operation}          only if profile; encode, decode
+
+Read them with snapshot() (a dict), as Prometheus text with prometheus(), or
+over HTTP with serve(): GET /metrics and GET /metrics.json on a local port;
+see MetricsServer.
+
+Give one Metrics to every VM201RelayCard, VM201Session or VM201Fleet that
+should report; without one, nothing is measured and nothing is paid.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock, Thread
+from time import time
+
+
+DEFAULT_PORT = 9762
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+DIRECTIONS = ('rx', 'tx')
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        # counts[i] is the number of values <= BUCKETS[i] and > BUCKETS[i-1];
+        # the last one counts the values above the largest bucket.
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        ''' Upper bound of the bucket that holds quantile q; None if empty '''
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Timer(object):
+    ''' Context manager; observes the seconds spent in its block '''
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, self.labels, time() - self.start)
+        if exc_type is not None:
+            self.metrics.increment(self.name.replace('_seconds', '_errors') +
+                                   '_total', self.labels)
+        return False
+
+
+def format_labels(labels):
+    ''' ('card', '10.0.0.2:9760'), ... -> {card="10.0.0.2:9760",...} '''
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(key, value)
+                          for key, value in labels) + '}'
+
+
+def timed(command=None):
+    '''
+    Decorator for methods of VM201RelayCard: observe their latency in
+    vm201_command_seconds, if the card has metrics.
+
+    @param command: label of the command; None takes the cmd argument of
+                    the method, e.g. of set_channels; given first or by name.
+    '''
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            label = command
+            if label is None:
+                label = args[0] if args else kwargs['cmd']
+            with self.metrics.timer('vm201_command_seconds',
+                                    self.labels + (('command', label),)):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Metrics(object):
+    def __init__(self, profile=False):
+        '''
+        @param profile: time every encode and decode too; this costs two
+                        time() calls per packet.
+        '''
+
+        self.profile = profile
+        self.counters = dict()
+        self.histograms = dict()
+        self.lock = Lock()
+
+    def increment(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name, labels=()):
+        return Timer(self, name, labels)
+
+    def packet(self, labels, direction, nbytes):
+        ''' Count one packet of nbytes; direction is PacketLog.RX or TX '''
+        labels = labels + (('direction', DIRECTIONS[direction]),)
+        packets = ('vm201_packets_total', labels)
+        size = ('vm201_bytes_total', labels)
+        with self.lock:
+            self.counters[packets] = self.counters.get(packets, 0) + 1
+            self.counters[size] = self.counters.get(size, 0) + nbytes
+
+    def snapshot(self):
+        '''
+        The pull API.
+
+        @return: dict with 'counters': {'name{labels}': value} and
+                 'histograms': {'name{labels}': dict of count, sum, mean,
+                 p50, p90 and p99 in seconds}.
+        '''
+
+        with self.lock:
+            counters = dict((name + format_labels(labels), value)
+                            for (name, labels), value
+                            in self.counters.items())
+            histograms = dict()
+            for (name, labels), histogram in self.histograms.items():
+                histograms[name + format_labels(labels)] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'mean': histogram.sum / histogram.count,
+                    'p50': histogram.quantile(0.50),
+                    'p90': histogram.quantile(0.90),
+                    'p99': histogram.quantile(0.99)}
+        return {'counters': counters, 'histograms': histograms}
+
+    def prometheus(self):
+        ''' All metrics in the Prometheus text exposition format '''
+        lines = list()
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append('# TYPE {0} counter'.format(name))
+                    typed.add(name)
+                lines.append('{0}{1} {2}'.format(name, format_labels(labels),
+                                                 value))
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append('# TYPE {0} histogram'.format(name))
+                    typed.add(name)
+                seen = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    seen += count
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, format_labels(labels + (('le', bound),)), seen))
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, format_labels(labels + (('le', '+Inf'),)),
+                    histogram.count))
+                lines.append('{0}_sum{1} {2!r}'.format(
+                    name, format_labels(labels), histogram.sum))
+                lines.append('{0}_count{1} {2}'.format(
+                    name, format_labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        ''' Serve /metrics and /metrics.json from a background thread '''
+        # Not imported at the top; the HTTP modules double the startup time
+        # of a one-shot script that never serves.
+        from MetricsServer import MetricsHandler, MetricsServer
+
+        server = MetricsServer((host, port), MetricsHandler)
+        server.metrics = self
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
@@ -0,0 +1,41 @@
+'''
+MetricsServer class.
+
+HTTP endpoint of a Metrics: GET /metrics in the Prometheus text format, and
+GET /metrics.json with Metrics.snapshot(). Started by Metrics.serve().
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import json
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class MetricsServer(HTTPServer):
+    allow_reuse_address = True
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics = self.server.metrics
+        if self.path == '/metrics':
+            body = metrics.prometheus()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body = json.dumps(metrics.snapshot(), indent=2, sort_keys=True)
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; do not write a line to stderr for each.
+        pass
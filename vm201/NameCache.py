@@ -0,0 +1,61 @@
+'''
+NameCache class.
+
+On-disk warm-start cache of the channel names of VM201 cards, keyed by host
+and port. Names almost never change, so a VM201RelayCard can show them
+before the login completes; the cache is only rewritten when a name changed.
+The names are stored as JSON, without the garbage chars the firmware adds.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import json
+import os
+
+
+class NameCache(object):
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.expanduser('~/.vm201_names.json')
+        self.path = path
+
+        # '{host}:{port}' -> {'channel': name}
+        self.cards = dict()
+        self.load()
+
+    def key(self, host, port):
+        return '{0}:{1}'.format(host, port)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.cards = json.load(f)
+        except (IOError, ValueError):
+            # No cache yet, or a corrupt one: start cold.
+            self.cards = dict()
+
+    def save(self):
+        # Write and rename, so a crash never leaves half a cache behind.
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.cards, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+
+    def get(self, host, port):
+        '''
+        @return: dict int channel -> str name; empty if unknown.
+        '''
+
+        names = self.cards.get(self.key(host, port), dict())
+        return dict((int(channel), str(name))
+                    for channel, name in names.items())
+
+    def update(self, host, port, names):
+        '''
+        @param names: dict int channel -> str name.
+        '''
+
+        self.cards[self.key(host, port)] = dict(
+            (str(channel), name) for channel, name in names.items())
@@ -0,0 +1,312 @@
+'''
+PacketCapture class.
+
+Compact binary capture of the exact byte streams between clients and VM201
+cards, and a replay tool for it. The received bytes are recorded as returned
+by each recv, so garbage between frames and fragmented frames are kept as
+they arrived; sent packets are recorded as encoded.
+
+One capture is shared by any number of connections, e.g. all cards of a
+VM201Fleet. Every connection records into its own stream, so the chunks of
+different sockets, or of one card before and after a reconnect, are never
+mixed up into one byte stream.
+
+File format: the magic 'VM201CAP', a version byte, then records of
+    <timestamp: double><stream: unsigned int><direction: byte>
+    <length: unsigned short><raw bytes>
+all little-endian; direction is PacketLog.RX or TX, or OPEN for the first
+record of a stream, with the 'host:port' of its card as raw bytes.
+
+Replay memory-maps the capture, so gigabytes of traffic are never read into
+memory at once, and feeds the received bytes through a VM201RelayCard via a
+simulated socket; at full speed, or in real time:
+
+    python PacketCapture.py capture.vm201cap [--speed 1.0] [--print]
+                                             [--stream N]
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import mmap
+from itertools import count
+from socket import error
+from struct import Struct
+from threading import Lock
+from time import sleep, time
+
+from PacketLog import DIRECTIONS, RX
+
+
+MAGIC = 'VM201CAP'
+VERSION = 2
+FILE_HEADER = Struct('<8sB')
+RECORD_HEADER = Struct('<dIBH')
+
+# Direction of the record that starts a stream.
+OPEN = 2
+RECORD_TYPES = DIRECTIONS + ('open',)
+
+
+class PacketCapture(object):
+    ''' Appends records to a capture file; shared by any number of sockets '''
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            last = 0
+        else:
+            # Appending to an earlier capture: continue its stream numbers,
+            # after its last complete record.
+            reader = CaptureReader(path)
+            try:
+                last, end = 0, FILE_HEADER.size
+                for timestamp, stream, direction, offset, length in \
+                        reader.records():
+                    last, end = max(last, stream), offset + length
+                torn = end < len(reader.map)
+            finally:
+                reader.close()
+            if torn:
+                self.file.truncate(end)
+        self.streams = count(last + 1)
+        self.lock = Lock()
+
+    def stream(self, label=''):
+        '''
+        Start a new stream; one per connection.
+
+        @param label: str; e.g. 'host:port' of the card.
+        @return: CaptureStream to record the traffic of the connection.
+        '''
+
+        with self.lock:
+            stream = next(self.streams)
+        self.record(OPEN, label, stream)
+        return CaptureStream(self, stream)
+
+    def record(self, direction, data, stream=0):
+        '''
+        @param direction: RX, TX or OPEN.
+        @param data: str or bytearray; at most 65535 bytes.
+        @param stream: int; 0 for traffic of no particular connection.
+        '''
+
+        header = RECORD_HEADER.pack(time(), stream, direction, len(data))
+        with self.lock:
+            self.file.write(header)
+            self.file.write(data)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class CaptureStream(object):
+    ''' The records of one connection; given to its FrameReader '''
+
+    __slots__ = ('capture', 'stream')
+
+    def __init__(self, capture, stream):
+        self.capture = capture
+        self.stream = stream
+
+    def record(self, direction, data):
+        self.capture.record(direction, data, self.stream)
+
+
+class CaptureReader(object):
+    ''' Memory-mapped, read-only view of a capture file '''
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{0} is not a VM201 capture (version {1})'
+                             .format(path, VERSION))
+
+    def records(self, direction=None, stream=None):
+        '''
+        Generator of the records; the data stays in the map until sliced.
+
+        @param direction: RX, TX or OPEN to skip the others; None for all.
+        @param stream: int to skip the other streams; None for all.
+        @return: (timestamp, stream, direction, offset of the data, length)
+                 tuples.
+        '''
+
+        data = self.map
+        offset = FILE_HEADER.size
+        end = len(data)
+        while offset + RECORD_HEADER.size <= end:
+            timestamp, record_stream, record_direction, length = \
+                RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > end:
+                # Truncated by a crash while recording.
+                return
+            if (direction is None or direction == record_direction) and \
+                    (stream is None or stream == record_stream):
+                yield timestamp, record_stream, record_direction, offset, \
+                    length
+            offset += length
+
+    def streams(self):
+        ''' @return: list of (stream, label, timestamp) tuples, in order '''
+        return [(stream, self.data(offset, length), timestamp)
+                for timestamp, stream, direction, offset, length
+                in self.records(OPEN)]
+
+    def data(self, offset, length):
+        return self.map[offset:offset+length]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class ReplaySocket(object):
+    '''
+    Stands in for the socket of a VM201RelayCard: recv_into returns the
+    received bytes of one stream of a capture, chunk by chunk as they were
+    received.
+    '''
+
+    def __init__(self, reader, speed=None, stream=None):
+        '''
+        @param speed: None for full speed; 1.0 for real time, 2.0 for twice
+                      as fast, ...
+        @param stream: int; None only for a capture of a single stream.
+        '''
+
+        self.reader = reader
+        self.records = reader.records(RX, stream)
+        self.speed = speed
+        self.first = None
+        self.started = None
+        self.pending = ''
+        self.sent = 0
+
+    def recv_into(self, view, nbytes=0):
+        if not self.pending:
+            try:
+                timestamp, stream, direction, offset, length = \
+                    next(self.records)
+            except StopIteration:
+                return 0
+            if self.speed is not None:
+                if self.first is None:
+                    self.first, self.started = timestamp, time()
+                due = self.started + (timestamp - self.first) / self.speed
+                if due > time():
+                    sleep(due - time())
+            self.pending = self.reader.data(offset, length)
+
+        size = min(len(self.pending), nbytes or len(view))
+        view[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def send(self, data):
+        # The vm201 in the capture answered already; nothing to send to.
+        self.sent += len(data)
+        return len(data)
+
+    def sendall(self, data):
+        self.send(data)
+
+    def gettimeout(self):
+        return None
+
+    def settimeout(self, timeout):
+        pass
+
+    def setblocking(self, flag):
+        pass
+
+    def close(self):
+        pass
+
+
+def replay(path, speed=None, card=None, stream=None):
+    '''
+    Feed the received bytes of a capture through a VM201RelayCard.
+
+    @param speed: None for full speed; 1.0 for real time.
+    @param card: VM201RelayCard to feed, e.g. with a Printer or Metrics; a
+                 quiet one if None.
+    @param stream: int; replay this stream only. None replays every stream,
+                   one after another, each through a fresh FrameReader.
+    @return: tuple (card, list of the decoded messages, seconds).
+    '''
+
+    from FrameReader import FrameReader
+    from VM201RelayCard import VM201RelayCard
+
+    if card is None:
+        card = VM201RelayCard('replay', verbose=False)
+    reader = CaptureReader(path)
+    if stream is None:
+        # Stream 0 holds the records of no particular connection.
+        streams = [0] + [number for number, label, timestamp
+                         in reader.streams()]
+    else:
+        streams = [stream]
+
+    messages = list()
+    start = time()
+    try:
+        for number in streams:
+            card.socket = ReplaySocket(reader, speed, number)
+            card.reader = FrameReader(card.socket)
+            try:
+                while True:
+                    messages.append(card.receive_message())
+            except error:
+                # recv_into returned 0: the end of the stream.
+                pass
+    finally:
+        reader.close()
+    return card, messages, time() - start
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    parser = argparse.ArgumentParser(description='Replay a VM201 capture')
+    parser.add_argument('capture')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='1.0 replays in real time; default full speed')
+    parser.add_argument('--print', dest='show', action='store_true',
+                        help='print every record')
+    parser.add_argument('--stream', type=int, default=None,
+                        help='only this stream; default all, one by one')
+    args = parser.parse_args()
+
+    if args.show:
+        reader = CaptureReader(args.capture)
+        for timestamp, stream, direction, offset, length in \
+                reader.records(stream=args.stream):
+            print '{0:.6f} {1} {2} {3}'.format(
+                timestamp, stream, RECORD_TYPES[direction],
+                reader.data(offset, length).encode('hex'))
+        reader.close()
+
+    card, messages, seconds = replay(args.capture, args.speed,
+                                     stream=args.stream)
+    counts = Counter(message.cmd for message in messages)
+    for cmd, count in sorted(counts.items()):
+        print '{0:<20} {1}'.format(cmd, count)
+    print '{0} frames in {1:.3f}s; {2:.0f} frames/s'.format(
+        len(messages), seconds, len(messages) / max(seconds, 1e-9))
+    print card
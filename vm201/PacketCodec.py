@@ -0,0 +1,307 @@
+'''
+PacketCodec module.
+
+Compiled encoder/decoder for the VM201 TCP protocol. The layout of every
+packet type is a precompiled struct.Struct, command bytes are found with a
+dict lookup, and all packets without free-form data (CMD_STATUS_REQ,
+CMD_CLOSED, and the 256 possible channel masks of CMD_ON, CMD_OFF, ...) are
+built once; the masks of a command when it is first sent, so a one-shot
+script does not pay for all of them at import. Decoded packets are named
+tuples.
+
+decode_from() and decode_many() read the fields straight out of a bytearray
+or memoryview with Struct.unpack_from, so no per-packet string or per-byte
+list is created on the receive path.
+
+Generic packets: <STX><LEN><CMD><data_1>...<data_n><CHECKSUM><ETX>
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from collections import namedtuple
+from string import ascii_letters
+from struct import Struct, error as struct_error
+
+
+# Pre-defined commands stated in the protocol.
+COMMANDS = {'STX': '\x02',
+            'ETX': '\x03',
+            'CMD_AUTH': 'A',
+            'LEN_CMD_AUTH': 5,
+            'CMD_USERNAME': 'U',
+            'LEN_CMD_USERNAME': 14,
+            'CMD_PASSWORD': 'W',
+            'LEN_CMD_PASSWORD': 14,
+            'CMD_LOGGED_IN': 'L',
+            'LEN_CMD_LOGGED_IN': 5,
+            'CMD_ACCESS_DENIED': 'X',
+            'LEN_CMD_ACCESS_DENIED': 5,
+            'CMD_CLOSED': 'C',
+            'LEN_CMD_CLOSED': 5,
+            'CMD_NAME': 'N',
+            'LEN_CMD_NAME': 22,
+            'CMD_STATUS_REQ': 'R',
+            'LEN_CMD_STATUS_REQ': 5,
+            'CMD_STATUS': 'S',
+            'LEN_CMD_STATUS': 8,
+            'CMD_ON': 'O',
+            'LEN_CMD_ON': 6,
+            'CMD_OFF': 'F',
+            'LEN_CMD_OFF': 6,
+            'CMD_TOGGLE': 'T',
+            'LEN_CMD_TOGGLE': 6,
+            'CMD_PULSE': 'P',
+            'LEN_CMD_PULSE': 8,
+            'CMD_UPDATE': 'V',
+            'LEN_CMD_UPDATE': 6,
+            'CMD_TMR_ENA': 'E',
+            'LEN_CMD_TMR_ENA': 6,
+            'CMD_TMR_DIS': 'D',
+            'LEN_CMD_TMR_DIS': 6,
+            'CMD_TMR_TOGGLE': 'G',
+            'LEN_CMD_TMR_TOGGLE': 6
+            }
+
+# Reverse lookup: command byte -> CMD_FULL_NAME.
+BYTE_TO_COMMAND = dict((value, key) for key, value in COMMANDS.items()
+                       if key.startswith('CMD_'))
+
+CONTROL_COMMANDS = ['CMD_AUTH', 'CMD_LOGGED_IN', 'CMD_ACCESS_DENIED',
+                    'CMD_CLOSED', 'CMD_STATUS_REQ']
+CREDENTIAL_COMMANDS = ['CMD_USERNAME', 'CMD_PASSWORD']
+MASK_COMMANDS = ['CMD_ON', 'CMD_OFF', 'CMD_TOGGLE', 'CMD_UPDATE',
+                 'CMD_TMR_ENA', 'CMD_TMR_DIS', 'CMD_TMR_TOGGLE']
+
+# CMD_PULSE: pulse time 1...99 in units of seconds, minutes or hours.
+PULSE_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+MIN_GENERIC_TCP_PACKET_SIZE = 5
+MAX_GENERIC_TCP_PACKET_SIZE = 22
+
+
+class PacketError(ValueError):
+    ''' Raised when a packet cannot be decoded '''
+    pass
+
+
+# Decoded packets. The first field is always the CMD_FULL_NAME.
+Control = namedtuple('Control', 'cmd')
+Credentials = namedtuple('Credentials', 'cmd text')
+Status = namedtuple('Status', 'cmd output timer input')
+Switch = namedtuple('Switch', 'cmd channels')
+Pulse = namedtuple('Pulse', 'cmd channels time unit')
+
+
+# There appears to be buggy behaviour in the VM201 firmware: the channel
+# names might have seemingly random chars added. Only letters are kept.
+NOT_A_LETTER = ''.join(chr(i) for i in range(256)
+                       if chr(i) not in ascii_letters)
+
+
+class Name(namedtuple('Name', 'cmd channel raw')):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.raw.translate(None, NOT_A_LETTER)
+
+
+# Layout of every packet, including <STX><LEN><CMD> and <CHECKSUM><ETX>.
+CONTROL = Struct('BBcBB')
+CREDENTIALS = Struct('BBc9sBB')
+NAME = Struct('BBcB16sBB')
+STATUS = Struct('BBcBBBBB')
+SWITCH = Struct('BBcBBB')
+PULSE = Struct('BBcBBcBB')
+
+# <pulsetime><units> of a CMD_PULSE; they follow the channel mask.
+PULSE_TIME = Struct('Bc')
+
+# <STX><LEN><CMD> of a packet that is still in the receive buffer.
+HEADER = Struct('BBc')
+
+# All bytes but the ETX, per packet length; their sum must be 0 mod 256.
+CHECKSUMMED = dict((length, Struct('{0}B'.format(length - 1)))
+                   for length in range(MIN_GENERIC_TCP_PACKET_SIZE,
+                                       MAX_GENERIC_TCP_PACKET_SIZE + 1))
+
+DECODERS = {'CMD_NAME': (NAME, Name),
+            'CMD_STATUS': (STATUS, Status),
+            'CMD_PULSE': (PULSE, Pulse)}
+for cmd in CONTROL_COMMANDS:
+    DECODERS[cmd] = (CONTROL, Control)
+for cmd in CREDENTIAL_COMMANDS:
+    DECODERS[cmd] = (CREDENTIALS, Credentials)
+for cmd in MASK_COMMANDS:
+    DECODERS[cmd] = (SWITCH, Switch)
+
+
+def checksum(s):
+    '''
+    Two-complement of the sum of all previous bytes in the packet.
+
+    @param s: string of bytes; len(s) = number of bytes.
+    @return: checksum one byte stored in a string.
+    '''
+
+    return chr(-sum(bytearray(s)) & 0xFF)
+
+
+def checksum_is_valid(packet):
+    ''' The last byte is ETX; secondlast byte is the checksum '''
+    return sum(bytearray(packet[:-1])) & 0xFF == 0
+
+
+def checksum_is_valid_from(buffer, offset=0):
+    ''' checksum_is_valid for the packet at offset in buffer; no copying '''
+    length = HEADER.unpack_from(buffer, offset)[1]
+    return sum(CHECKSUMMED[length].unpack_from(buffer, offset)) & 0xFF == 0
+
+
+def build(cmd, data_x=''):
+    ''' Build a packet from scratch: <STX><LEN><CMD><data_x><CHECKSUM><ETX> '''
+    head = COMMANDS['STX'] + chr(COMMANDS['LEN_'+cmd]) + COMMANDS[cmd]
+    head += data_x
+    return head + checksum(head) + COMMANDS['ETX']
+
+
+class MaskFrames(dict):
+    ''' cmd -> list of its packets for the 256 masks; built on first use '''
+
+    def __missing__(self, cmd):
+        if cmd not in MASK_COMMANDS:
+            raise KeyError(cmd)
+        frames = self[cmd] = [build(cmd, chr(mask)) for mask in range(256)]
+        return frames
+
+
+# Every packet without free-form data, built once.
+FRAMES = dict((cmd, build(cmd)) for cmd in CONTROL_COMMANDS)
+MASK_FRAMES = MaskFrames()
+
+
+def encode(cmd, data_x=''):
+    '''
+    Encode a TCP packet given a cmd.
+
+    @param cmd: CMD_FULL_NAME, as given in the COMMANDS dict.
+    @param data_x: optional data bytes.
+    @return: string containing the bytes; TCP packet ready to transmit.
+    '''
+
+    if len(data_x) == 1 and cmd in MASK_COMMANDS:
+        return MASK_FRAMES[cmd][ord(data_x)]
+    if not data_x and cmd in FRAMES:
+        return FRAMES[cmd]
+    if cmd in CREDENTIAL_COMMANDS:
+        # data_x is padded with zeros until it has length 9. Credentials read
+        # from a JSON config are unicode.
+        if isinstance(data_x, unicode):
+            data_x = data_x.encode('latin-1')
+        data_x += (9 - len(data_x)) * '\x00'
+    return build(cmd, data_x)
+
+
+def encode_mask(cmd, mask):
+    ''' Precomputed packet for one of MASK_COMMANDS with int channel mask '''
+    return MASK_FRAMES[cmd][mask]
+
+
+def pulse_data(time, unit='s'):
+    '''
+    The bytes after the channel mask of a CMD_PULSE.
+
+    @param time: int; pulse time 1...99.
+    @param unit: 's'= seconds; 'm' = minutes; 'h' = hours
+    @return: string of two bytes.
+    @raise PacketError: time or unit out of range.
+    '''
+
+    if not 1 <= time <= 99:
+        raise PacketError('Pulse time must be 1...99, not {0}'.format(time))
+    if unit not in PULSE_UNITS:
+        raise PacketError('Pulse unit must be s, m or h, not {0!r}'
+                          .format(unit))
+    # From JSON the unit is unicode; struct packs a 'c' from str only.
+    return PULSE_TIME.pack(time, str(unit))
+
+
+def decode(packet):
+    '''
+    Decode a TCP packet. The checksum is not verified; see checksum_is_valid.
+
+    @param packet: string containing the bytes of exactly one packet.
+    @return: named tuple; Control, Credentials, Name, Status, Switch or Pulse.
+    @raise PacketError: unknown command byte or wrong length for command.
+    '''
+
+    try:
+        cmd = BYTE_TO_COMMAND[packet[2]]
+    except (KeyError, IndexError):
+        raise PacketError('Unknown command in packet {0!r}'.format(packet))
+
+    layout, message = DECODERS[cmd]
+    try:
+        fields = layout.unpack(packet)
+    except struct_error:
+        raise PacketError('Error: expected: {0} bytes in {1}; got: {2} bytes.'
+                          .format(layout.size, cmd, len(packet)))
+
+    return message._make((cmd,) + fields[3:-2])
+
+
+def decode_from(buffer, offset=0):
+    '''
+    Decode the packet at offset in buffer without copying it first.
+    The checksum is not verified; see checksum_is_valid_from.
+
+    @param buffer: str, bytearray or memoryview holding at least one packet.
+    @param offset: int; index of the <STX> of the packet in buffer.
+    @return: named tuple; Control, Credentials, Name, Status, Switch or Pulse.
+    @raise PacketError: unknown command byte or wrong length for command.
+    '''
+
+    stx, length, cmd_byte = HEADER.unpack_from(buffer, offset)
+    try:
+        cmd = BYTE_TO_COMMAND[cmd_byte]
+    except KeyError:
+        raise PacketError('Unknown command byte {0!r}'.format(cmd_byte))
+
+    layout, message = DECODERS[cmd]
+    if length != layout.size:
+        raise PacketError('Error: expected: {0} bytes in {1}; got: {2} bytes.'
+                          .format(layout.size, cmd, length))
+
+    return message._make((cmd,) + layout.unpack_from(buffer, offset)[3:-2])
+
+
+def decode_many(buffer, validate=True):
+    '''
+    Walk all packets in a buffer of concatenated packets without copying.
+    Bytes that are not at a <STX><LEN> boundary are skipped, as are packets
+    with an invalid checksum (if validate) or unknown command; a trailing
+    incomplete packet is ignored.
+
+    @param buffer: str, bytearray or memoryview.
+    @return: generator of named tuples, as returned by decode_from.
+    '''
+
+    end = len(buffer)
+    offset = 0
+    while end - offset >= 3:
+        stx, length, cmd_byte = HEADER.unpack_from(buffer, offset)
+        if stx != 2 or length < MIN_GENERIC_TCP_PACKET_SIZE or \
+                length > MAX_GENERIC_TCP_PACKET_SIZE:
+            offset += 1
+            continue
+        if end - offset < length:
+            return
+
+        if not validate or checksum_is_valid_from(buffer, offset):
+            try:
+                yield decode_from(buffer, offset)
+            except PacketError:
+                pass
+        offset += length
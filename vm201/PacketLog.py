@@ -0,0 +1,174 @@
+'''
+PacketLog class.
+
+Fixed-size, preallocated ring buffer of every packet sent and received:
+timestamp, direction, command byte and raw bytes. Recording a packet only
+copies a few bytes into the ring; a background thread formats the records
+and appends them to a rotating JSON-lines file. Full packet tracing thus
+costs next to nothing on the path that sends and receives packets, and the
+history is kept for post-mortems even when the Printer is quiet.
+
+One line per packet:
+    {"t": 1413021600.123, "dir": "rx", "cmd": "S", "raw": "0208530501..."}
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import os
+from array import array
+from threading import Event, Lock, Thread
+from time import time
+
+
+DEFAULT_PATH = os.path.expanduser('~/.vm201_packets.jsonl')
+
+RX, TX = 0, 1
+DIRECTIONS = ('rx', 'tx')
+
+# MAX_GENERIC_TCP_PACKET_SIZE; longer frames are truncated in the log.
+SLOT_SIZE = 22
+
+
+class PacketLog(object):
+    def __init__(self, path=DEFAULT_PATH, size=4096, max_bytes=10*1024*1024,
+                 backups=3, interval=0.5):
+        '''
+        @param path: JSON-lines file; None keeps the history in memory only.
+        @param size: number of packets the ring holds between two flushes.
+        @param max_bytes, backups: rotate to path.1 ... path.backups.
+        @param interval: seconds between two flushes of the background thread.
+        '''
+
+        self.path = path
+        self.size = size
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+
+        # Preallocated columns of the ring.
+        self.timestamps = array('d', [0.0]) * size
+        self.directions = bytearray(size)
+        self.cmds = bytearray(size)
+        self.lengths = bytearray(size)
+        self.raw = bytearray(size * SLOT_SIZE)
+
+        # Records [tail, head) are not yet written to the file.
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.lock = Lock()
+
+        self.stopped = Event()
+        self.thread = None
+
+    def record(self, direction, buffer, offset=0, length=None):
+        '''
+        Copy one packet into the ring; this is all the hot path pays.
+
+        @param direction: RX or TX.
+        @param buffer: str, bytearray or memoryview holding the packet.
+        @param offset: int; index of the <STX> of the packet in buffer.
+        @param length: int; defaults to len(buffer) - offset.
+        '''
+
+        if length is None:
+            length = len(buffer) - offset
+        length = min(length, SLOT_SIZE)
+
+        with self.lock:
+            slot = self.head % self.size
+            start = slot * SLOT_SIZE
+            self.timestamps[slot] = time()
+            self.directions[slot] = direction
+            self.raw[start:start+length] = buffer[offset:offset+length]
+            self.cmds[slot] = self.raw[start+2] if length > 2 else 0
+            self.lengths[slot] = length
+            self.head += 1
+
+    def records(self):
+        '''
+        Take all records that were not taken before, oldest first.
+
+        @return: list of (timestamp, direction, cmd byte, raw bytes) tuples.
+        '''
+
+        with self.lock:
+            if self.head - self.tail > self.size:
+                # The producer lapped us; the oldest records are gone.
+                self.dropped += self.head - self.tail - self.size
+                self.tail = self.head - self.size
+
+            taken = list()
+            for index in xrange(self.tail, self.head):
+                slot = index % self.size
+                start = slot * SLOT_SIZE
+                taken.append((self.timestamps[slot], self.directions[slot],
+                              self.cmds[slot],
+                              bytes(self.raw[start:start+self.lengths[slot]])))
+            self.tail = self.head
+
+        return taken
+
+    def flush(self):
+        ''' Append all new records to the file; run by the background thread '''
+        if self.path is None:
+            return
+        taken = self.records()
+        if not taken:
+            return
+
+        # Imported here, in the background thread; not by every script that
+        # only needs RX and TX.
+        import json
+
+        lines = ''.join(json.dumps({'t': timestamp,
+                                    'dir': DIRECTIONS[direction],
+                                    'cmd': chr(cmd),
+                                    'raw': raw.encode('hex')}) + '\n'
+                        for timestamp, direction, cmd, raw in taken)
+
+        self.rotate(len(lines))
+        with open(self.path, 'a') as f:
+            f.write(lines)
+
+    def rotate(self, incoming):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists('{0}.{1}'.format(self.path, i)):
+                os.rename('{0}.{1}'.format(self.path, i),
+                          '{0}.{1}'.format(self.path, i + 1))
+        if self.backups:
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def start(self):
+        ''' Start flushing to the file from a background thread '''
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def close(self):
+        ''' Stop the background thread and write the remaining records '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+        else:
+            self.flush()
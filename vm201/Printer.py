@@ -1,9 +1,10 @@
 from sys import stdout
+from time import time
 
 
 # issues: explicit locations. Should add parameters.
 class Printer(object):
-    def __init__(self, verbose=True):
+    def __init__(self, verbose=True, fps=20):
         # self.row, self.col = 2, 1
         self.verbose = verbose
         if not verbose:
@@ -17,29 +18,56 @@ class Printer(object):
 
         self.msg_counter = 0
 
-        stdout.write('\033[2J')  # Clear entire screen.
-        stdout.write('\033[{0};{1}H'.format(self.state_row, self.state_col))
-        stdout.write('System State\n')
-
-        stdout.write('\033[{0};{1}H'.format(self.log_row, self.log_col))
-        stdout.write('TCP Packet Log\n')
-
-        stdout.write('\033[{0};{1}H'.format(self.state_row+1, self.state_col))
-        stdout.write('-'*31)
-        stdout.write('\033[{0};{1}H'.format(self.log_row+1, self.log_col))
-        stdout.write('-'*14 + '\n')
-
-        stdout.write('\033[{0};{1}H'.format(self.help_row, self.help_col))
-        stdout.write('The following commands may be issued:\n')
-        # stdout.write('\tHELP\n')
-        stdout.write('\tCMD_STATUS\n')
-        stdout.write('\tCMD_ON channel_number (1-8)\n')
-        stdout.write('\tCMD_OFF channel_number (1-8)\n')
-        stdout.write('\tCMD_TOGGLE channel_numer (1-8)\n')
-        stdout.write('\tCMD_TMR_ENA channel_number (1-8)\n')
-        stdout.write('\tCMD_TMR_DIS channel_number (1-8)\n')
-        stdout.write('\tCMD_TMR_TOGGLE channel_numer (1-8)\n')
-        stdout.write('\tQUIT\n')
+        # Escape sequences and text are collected in a frame buffer, and
+        # written to stdout at most fps times per second with a single write.
+        self.fps = fps
+        self.frame = list()
+        self.last_render = 0.0
+
+        # What is on screen now versus what should be on screen next.
+        self.state_lines = list()
+        self.next_state = None
+        self.log_lines = dict()
+        self.next_log = dict()
+
+        self.write('\033[2J')  # Clear entire screen.
+        self.move(self.state_row, self.state_col)
+        self.write('System State\n')
+
+        self.move(self.log_row, self.log_col)
+        self.write('TCP Packet Log\n')
+
+        self.move(self.state_row+1, self.state_col)
+        self.write('-'*31)
+        self.move(self.log_row+1, self.log_col)
+        self.write('-'*14 + '\n')
+
+        self.move(self.help_row, self.help_col)
+        self.write('The following commands may be issued:\n')
+        # self.write('\tHELP\n')
+        self.write('\tCMD_STATUS\n')
+        self.write('\tCMD_ON channel_number (1-8)\n')
+        self.write('\tCMD_OFF channel_number (1-8)\n')
+        self.write('\tCMD_TOGGLE channel_numer (1-8)\n')
+        self.write('\tCMD_TMR_ENA channel_number (1-8)\n')
+        self.write('\tCMD_TMR_DIS channel_number (1-8)\n')
+        self.write('\tCMD_TMR_TOGGLE channel_numer (1-8)\n')
+        self.write('\tQUIT\n')
+        self.flush()
+
+    def write(self, s):
+        ''' Append s to the frame buffer; nothing is written to stdout yet '''
+        self.frame.append(s)
+
+    def move(self, row, col):
+        self.frame.append('\033[{0};{1}H'.format(row, col))
+
+    def flush(self):
+        ''' Write the frame buffer to stdout in one go '''
+        if self.frame:
+            stdout.write(''.join(self.frame))
+            stdout.flush()
+            del self.frame[:]
 
     # http://www.darkcoding.net/software/pretty-command-line-console-output-on
     # -unix-in-python-and-go-lang/
@@ -48,29 +76,70 @@ class Printer(object):
         if not self.verbose:
             return
 
-        stdout.write('\033[{0}A'.format(self.table_len))
-        stdout.write('\033[0J')
-        stdout.flush()
+        self.write('\033[{0}A'.format(self.table_len))
+        self.write('\033[0J')
+        self.state_lines = list()
+        self.log_lines = dict()
+        self.flush()
 
     def add_tcp_msg(self, msg):
-        # There is an off by one in the log when it renews after %
         if not self.verbose:
             return
         msg_position = 5 + self.msg_counter % int(self.help_row - 5)
-        stdout.write('\033[{0};{1}H'.format(msg_position, self.log_col))
-        stdout.write('\033[K')
-        if self.msg_counter >= int(self.help_row - 5):
-            stdout.write('\033[{0};{1}H'.format(msg_position-1, self.log_col))
-            stdout.write('\033[K')
-        stdout.write('Msg {0}: {1}\n'.format(self.msg_counter, msg))
-        stdout.write('\033[54;1H')
-        stdout.write('\033[K')
+        self.next_log[msg_position] = 'Msg {0}: {1}'\
+            .format(self.msg_counter, msg)
         self.msg_counter += 1
+        self.render()
 
     def update_state(self, table):
         if not self.verbose:
             return
-        stdout.write('\033[4;1H')
-        stdout.write(table)
-        stdout.write('\033[54;1H')
-        stdout.write('\033[K')
+        self.next_state = table
+        self.render()
+
+    def render(self, force=False):
+        '''
+        Repaint what changed since the last repaint: log lines that were
+        overwritten and the part of each table line that differs.
+
+        @param force: bool; ignore the fps limit, e.g. before waiting for input.
+        '''
+
+        if not self.verbose:
+            return
+
+        now = time()
+        if not force and now - self.last_render < 1.0 / self.fps:
+            return
+        self.last_render = now
+
+        for row in sorted(self.next_log):
+            text = self.next_log[row]
+            if self.log_lines.get(row) != text:
+                self.move(row, self.log_col)
+                self.write('\033[K')
+                self.write(text)
+                self.log_lines[row] = text
+        self.next_log.clear()
+
+        if self.next_state is not None:
+            lines = self.next_state.split('\n')
+            for i in range(max(len(lines), len(self.state_lines))):
+                new = lines[i] if i < len(lines) else ''
+                old = self.state_lines[i] if i < len(self.state_lines) else ''
+                if new == old:
+                    continue
+                # Skip the unchanged start of the line; redraw the rest only.
+                start = 0
+                while start < min(len(new), len(old)) and \
+                        new[start] == old[start]:
+                    start += 1
+                self.move(4 + i, self.state_col + start)
+                self.write(new[start:].ljust(len(old) - start))
+            self.state_lines = lines
+            self.next_state = None
+
+        if self.frame:
+            self.write('\033[54;1H')
+            self.write('\033[K')
+        self.flush()
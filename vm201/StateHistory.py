@@ -0,0 +1,439 @@
+'''
+StateHistory class.
+
+Append-only on-disk history of the channel state of many VM201 cards, for
+energy accounting and incident review. A record is written only when the
+state of a card changed, so a fleet that is polled every second but switched
+a few times a day costs a few records a day.
+
+File format: the magic 'VM201HIS', a version byte, then fixed-size records
+    <timestamp: double><card: unsigned short><output: byte><timer: byte>
+    <input: byte><flags: byte>
+all little-endian, in order of time. The card names are in path + '.cards',
+one per line; the card number is the line number. A record torn by a crash
+is cut off when the history is opened again, so the next one goes where it
+should have.
+
+Records have a fixed size, so any record is found without reading the ones
+in front of it. A sparse index keeps the time of every INDEX_EVERY-th record
+in memory; a query by time bisects the index and then the records of one
+block. Every keyframe records (more with many cards), the state of all cards
+is written once more, flagged KEYFRAME, so "state of card X at time T" never
+has to look back further than that.
+
+record() only puts the state in a list; a background thread writes the
+records, so it can be called from a control loop at fleet polling rates:
+
+    history = StateHistory('history.vm201his').start()
+    history.watch(card)                       # VM201RelayCard
+    fleet.run(...); history.record_results(results)   # VM201Fleet
+    print history.state_at('192.168.1.100:9760', time() - 3600)
+    print history.duty_cycle('192.168.1.100:9760', start, end)
+
+    python StateHistory.py history.vm201his [--card CARD] [--at T]
+                                            [--start T] [--end T] [--duty]
+
+The command line opens the history read-only, so it can be queried while a
+fleet writes to it; it sees the records written by the time it was opened.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+from struct import Struct
+from threading import Event, Lock, Thread
+from time import time
+
+from ChannelState import ChannelState
+
+
+MAGIC = 'VM201HIS'
+VERSION = 1
+FILE_HEADER = Struct('<8sB')
+RECORD = Struct('<dHBBBB')
+
+# Flag of the records that repeat a state; they are no transition.
+KEYFRAME = 1
+
+INDEX_EVERY = 1024
+
+
+class StateHistory(object):
+    def __init__(self, path, interval=0.5, keyframe=4096, readonly=False):
+        '''
+        @param path: history file; created if it does not exist.
+        @param interval: seconds between two writes of the background thread.
+        @param keyframe: records between two keyframes, at least; and at least
+                         four times the number of cards.
+        @param readonly: only query; nothing is created, cut off or written,
+                         and record() raises RuntimeError.
+        @raise IOError: readonly, and the history does not exist.
+        '''
+
+        self.path = path
+        self.interval = interval
+        self.keyframe = keyframe
+        self.readonly = readonly
+
+        if readonly:
+            if not os.path.exists(path):
+                raise IOError('{0} does not exist'.format(path))
+            self.file = self.names_file = None
+            names = list()
+            if os.path.exists(path + '.cards'):
+                with open(path + '.cards') as f:
+                    names = f.readlines()
+        else:
+            # Shorter than a header: new, or torn in a crash while created.
+            if not os.path.exists(path) or \
+                    os.path.getsize(path) < FILE_HEADER.size:
+                with open(path, 'wb') as f:
+                    f.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.file = open(path, 'ab')
+            self.names_file = open(path + '.cards', 'a+')
+            self.names_file.seek(0)
+            names = list(self.names_file)
+
+        # Card names and numbers; a card gets a number when first recorded.
+        self.names = [line.rstrip('\n') for line in names]
+        self.numbers = dict((name, i) for i, name in enumerate(self.names))
+
+        # Written by the background thread only.
+        self.count = 0
+        self.index = array('d')
+        self.since_keyframe = 0
+        self.written = dict()     # card number -> state as written
+        self.last_time = 0.0
+
+        # Shared with record(); under lock.
+        self.lock = Lock()
+        self.pending = list()
+        self.last = dict()        # card number -> state as recorded
+        self.new_names = list()
+
+        self.write_lock = Lock()
+        self.load()
+
+        self.stopped = Event()
+        self.thread = None
+
+    def load(self):
+        ''' Rebuild the index and the last state of every card '''
+        size = os.path.getsize(self.path)
+        if size < FILE_HEADER.size:
+            # Read-only, and torn while created: no records yet.
+            return
+
+        with open(self.path, 'rb') as f:
+            magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{0} is not a VM201 history (version '
+                             '{1})'.format(self.path, VERSION))
+
+        self.count = (size - FILE_HEADER.size) // RECORD.size
+        end = FILE_HEADER.size + self.count * RECORD.size
+        if size > end and not self.readonly:
+            # The tail of a record that was being written in a crash.
+            self.file.truncate(end)
+        if not self.count:
+            return
+
+        with open(self.path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for i in xrange(0, self.count, INDEX_EVERY):
+                    self.index.append(self.read(data, i)[0])
+
+                # Back to the last keyframe, then forward to the end.
+                i = self.count - 1
+                while i >= 0 and not self.read(data, i)[5] & KEYFRAME:
+                    i -= 1
+                while i > 0 and self.read(data, i - 1)[5] & KEYFRAME:
+                    i -= 1
+                self.since_keyframe = 0
+                for j in xrange(max(i, 0), self.count):
+                    timestamp, card, output, timer, input, flags = \
+                        self.read(data, j)
+                    self.written[card] = ChannelState(output, timer, input)
+                    if not flags & KEYFRAME:
+                        self.since_keyframe += 1
+                self.last_time = self.read(data, self.count - 1)[0]
+            finally:
+                data.close()
+        self.last = dict(self.written)
+
+    @staticmethod
+    def read(data, i):
+        return RECORD.unpack_from(data, FILE_HEADER.size + i * RECORD.size)
+
+    def record(self, card, state, timestamp=None):
+        '''
+        Note the state of a card; written only if it changed. Cheap: a dict
+        lookup and a list append.
+
+        @param card: str name; e.g. 'host:port'.
+        @param state: ChannelState.
+        @param timestamp: unix time; now if None. Kept in order: a time
+                          before the previous record counts as that time.
+        @raise RuntimeError: the history was opened read-only.
+        '''
+
+        if self.readonly:
+            raise RuntimeError('{0} is opened read-only.'.format(self.path))
+        with self.lock:
+            number = self.numbers.get(card)
+            if number is None:
+                number = self.numbers[card] = len(self.names)
+                self.names.append(card)
+                self.new_names.append(card)
+            elif self.last.get(number) == state:
+                return
+            self.last[number] = state
+            self.pending.append((time() if timestamp is None else timestamp,
+                                 number, state))
+
+    def on_status(self, card, old_state, new_state):
+        ''' Callback for VM201RelayCard.on_status; see watch() '''
+        self.record('{0}:{1}'.format(card.host, card.port), new_state)
+
+    def watch(self, card):
+        '''
+        Record every CMD_STATUS of a VM201RelayCard. Chained to whoever
+        listened to the card before, e.g. a VM201Gateway or VM201Watcher.
+        '''
+
+        on_status_before = card.on_status
+
+        def on_status(card, old_state, new_state):
+            if on_status_before is not None:
+                on_status_before(card, old_state, new_state)
+            self.on_status(card, old_state, new_state)
+        card.on_status = on_status
+
+    def record_results(self, results):
+        ''' Record the CardResults of a VM201Fleet run; the failed ones not '''
+        now = time()
+        for result in results:
+            if result.ok and result.state is not None:
+                self.record(str(result.card), result.state, now)
+
+    def append(self, chunks, timestamp, number, state, flags=0):
+        if self.count % INDEX_EVERY == 0:
+            self.index.append(timestamp)
+        chunks.append(RECORD.pack(timestamp, number, state.output,
+                                  state.timer, state.input, flags))
+        self.count += 1
+
+    def flush(self):
+        ''' Write the pending records; run by the background thread '''
+        if self.readonly:
+            return
+        # Queries flush too; take and write under one lock to keep the order.
+        with self.write_lock:
+            with self.lock:
+                pending, self.pending = self.pending, list()
+                new_names, self.new_names = self.new_names, list()
+
+            if new_names:
+                # Names first; a record never refers to an unknown card.
+                self.names_file.write(''.join(name + '\n'
+                                              for name in new_names))
+                self.names_file.flush()
+            if not pending:
+                return
+
+            chunks = list()
+            for timestamp, number, state in pending:
+                timestamp = max(timestamp, self.last_time)
+                self.last_time = timestamp
+                self.append(chunks, timestamp, number, state)
+                self.written[number] = state
+                self.since_keyframe += 1
+
+                if self.since_keyframe >= max(self.keyframe,
+                                              4 * len(self.written)):
+                    for card, card_state in sorted(self.written.items()):
+                        self.append(chunks, timestamp, card, card_state,
+                                    KEYFRAME)
+                    self.since_keyframe = 0
+
+            self.file.write(''.join(chunks))
+            self.file.flush()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def start(self):
+        ''' Start writing from a background thread '''
+        if self.readonly:
+            raise RuntimeError('{0} is opened read-only.'.format(self.path))
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def close(self):
+        ''' Stop the background thread and write the remaining records '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+        else:
+            self.flush()
+        if not self.readonly:
+            self.file.close()
+            self.names_file.close()
+
+    # Queries; they see everything recorded so far.
+
+    def view(self):
+        ''' @return: tuple (mmap of the file, number of records) '''
+        self.flush()
+        with self.write_lock:
+            count = self.count
+        if not count:
+            # A torn header may leave an empty file, which cannot be mapped.
+            return mmap.mmap(-1, 1), 0
+        with open(self.path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), count
+
+    def find(self, data, count, timestamp):
+        ''' Number of the first record at or after timestamp '''
+        block = bisect_left(self.index, timestamp)
+        low = max(block - 1, 0) * INDEX_EVERY
+        high = min(block * INDEX_EVERY, count)
+        while low < high:
+            middle = (low + high) // 2
+            if self.read(data, middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def state_at(self, card, timestamp):
+        '''
+        @param card: str name, as given to record.
+        @return: ChannelState of card at timestamp; None if unknown then.
+        '''
+
+        number = self.numbers.get(card)
+        if number is None:
+            return None
+
+        data, count = self.view()
+        try:
+            # The last record at or before timestamp.
+            i = self.find(data, count, timestamp)
+            while i < count and self.read(data, i)[0] <= timestamp:
+                i += 1
+            in_keyframe = False
+            for j in xrange(i - 1, -1, -1):
+                record = self.read(data, j)
+                if record[1] == number:
+                    return ChannelState(*record[2:5])
+                if record[5] & KEYFRAME:
+                    in_keyframe = True
+                elif in_keyframe:
+                    # A keyframe holds every card known then; not this one.
+                    return None
+            return None
+        finally:
+            data.close()
+
+    def transitions(self, start=None, end=None, card=None):
+        '''
+        Generator of the changes of state in [start, end).
+
+        @param start, end: unix times; None for the first and last record.
+        @param card: str name to filter on; None for all cards.
+        @return: (timestamp, card name, ChannelState) tuples, in order.
+        '''
+
+        number = None
+        if card is not None:
+            number = self.numbers.get(card)
+            if number is None:
+                return
+
+        data, count = self.view()
+        try:
+            i = 0 if start is None else self.find(data, count, start)
+            for j in xrange(i, count):
+                timestamp, record_card, output, timer, input, flags = \
+                    self.read(data, j)
+                if end is not None and timestamp >= end:
+                    return
+                if flags & KEYFRAME or \
+                        (number is not None and record_card != number):
+                    continue
+                yield (timestamp, self.names[record_card],
+                       ChannelState(output, timer, input))
+        finally:
+            data.close()
+
+    def duty_cycle(self, card, start, end):
+        '''
+        Fraction of the time in [start, end) that each relay was ON; time
+        before the first record of the card does not count.
+
+        @return: list of 8 floats, for channels 1...8; None if never known.
+        '''
+
+        on = [0.0] * 8
+        known = 0.0
+        state, since = self.state_at(card, start), start
+        for timestamp, name, new_state in self.transitions(start, end, card):
+            if state is not None:
+                for i in range(8):
+                    if state.output >> i & 1:
+                        on[i] += timestamp - since
+                known += timestamp - since
+            state, since = new_state, timestamp
+        if state is not None:
+            for i in range(8):
+                if state.output >> i & 1:
+                    on[i] += end - since
+            known += end - since
+
+        if not known:
+            return None
+        return [seconds / known for seconds in on]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Query a VM201 history')
+    parser.add_argument('history')
+    parser.add_argument('--card', default=None)
+    parser.add_argument('--at', type=float, default=None,
+                        help='print the state of --card at this unix time')
+    parser.add_argument('--start', type=float, default=None)
+    parser.add_argument('--end', type=float, default=None)
+    parser.add_argument('--duty', action='store_true',
+                        help='print the duty cycle of --card per relay')
+    args = parser.parse_args()
+
+    history = StateHistory(args.history, readonly=True)
+    if args.at is not None:
+        print history.state_at(args.card, args.at)
+    elif args.duty:
+        start = args.start or 0.0
+        end = args.end or time()
+        duty = history.duty_cycle(args.card, start, end)
+        for channel, fraction in enumerate(duty or [], 1):
+            print 'channel {0}: {1:.1%}'.format(channel, fraction)
+    else:
+        for timestamp, card, state in history.transitions(
+                args.start, args.end, args.card):
+            print '{0:.3f} {1} {2!r}'.format(timestamp, card, state)
+    history.close()
@@ -6,10 +6,13 @@ TCP packet handler to decode and encode packets; calculate and verify checksum.
 Author: Timo Halbesma
 Date: October 11th, 2014
 Version: 2.0: Implemented decode; added encode.
+Version: 3.0: Delegate to the compiled PacketCodec; decode returns messages.
 '''
 
-import sys
-import struct
+from time import time
+
+import PacketCodec
+from PacketLog import RX, TX
 
 
 # https://stackoverflow.com/questions/2184181/decoding-tcp-packets-using-python
@@ -28,65 +31,132 @@ class TCPPacketHandler(object):
         @return: chechsum one byte stored in a string.
         '''
 
-        return struct.pack('1B', (-(sum(ord(c) for c in s) % 256) & 0xFF))
+        return PacketCodec.checksum(s)
 
     def checksum_is_valid(self, packet):
         ''' The last byte is ETX; secondlast byte is the checksum'''
 
-        return packet[-2] == self.calculate_checksum(packet[:-2])
+        return PacketCodec.checksum_is_valid(packet)
 
     def decode(self, vm201, packet):
         '''
         Decode a TCP packet to obtain CMD and data_x
 
         @param packet: string containing the bytes; TCP packet received.
-        @return: list of integer values of the bytes. If checksum fails: None.
+        @return: named tuple from PacketCodec; its cmd is None if the packet
+                 could not be decoded.
         '''
 
-        cmd_byte = packet[2]
-        length = ord(packet[1])
-
-        vm201.display.add_tcp_msg('Received {0}'
-                                  .format(vm201.lookup(cmd_byte)))
+        metrics = vm201.metrics
+        if metrics is not None:
+            metrics.packet(vm201.labels, RX, len(packet))
+            start = time()
 
         if not self.checksum_is_valid(packet):
             msg = 'Error: in TCPPacketHandler.decode(); invalid checksum!'
             vm201.display.add_tcp_msg(msg)
             vm201.display.add_tcp_msg(packet.split())
+            if metrics is not None:
+                metrics.increment('vm201_checksum_errors_total', vm201.labels)
             # sys.exit()
 
-        if len(packet) != length:
-            msg = 'Error: expected: {0} bytes in packet; got: {1} bytes.'\
-                  .format(length, len(packet))
-            vm201.display.add_tcp_msg(msg)
-            # sys.exit()
+        if vm201.packet_log is not None:
+            vm201.packet_log.record(RX, packet)
+
+        try:
+            message = PacketCodec.decode(packet)
+        except PacketCodec.PacketError, e:
+            vm201.display.add_tcp_msg(str(e))
+            if metrics is not None:
+                metrics.increment('vm201_length_errors_total', vm201.labels)
+            return PacketCodec.Control(None)
+
+        if metrics is not None and metrics.profile:
+            metrics.observe('vm201_codec_seconds',
+                            (('operation', 'decode'),), time() - start)
+
+        if vm201.display.verbose:
+            vm201.display.add_tcp_msg('Received {0}'.format(message.cmd))
+        return message
+
+    def decode_from(self, vm201, buffer, offset, skip=()):
+        '''
+        Decode the TCP packet at offset in buffer without copying it.
+
+        @param buffer: bytearray or memoryview; e.g. FrameReader.buffer.
+        @param offset: int; index of the <STX> of the packet in buffer.
+        @param skip: CMD_FULL_NAMEs of packets that are counted and logged,
+                     but not decoded; e.g. names that are known already.
+        @return: named tuple from PacketCodec; its cmd is None if the packet
+                 could not be decoded. A Control for a skipped packet.
+        '''
 
-        return list(struct.unpack('B'*length, packet))
+        metrics = vm201.metrics
+        if metrics is not None:
+            length = PacketCodec.HEADER.unpack_from(buffer, offset)[1]
+            metrics.packet(vm201.labels, RX, length)
+            start = time()
+
+        if not PacketCodec.checksum_is_valid_from(buffer, offset):
+            msg = 'Error: in TCPPacketHandler.decode_from(); invalid checksum!'
+            vm201.display.add_tcp_msg(msg)
+            if metrics is not None:
+                metrics.increment('vm201_checksum_errors_total', vm201.labels)
+
+        if vm201.packet_log is not None:
+            length = PacketCodec.HEADER.unpack_from(buffer, offset)[1]
+            vm201.packet_log.record(RX, buffer, offset, length)
+
+        if skip:
+            cmd = PacketCodec.BYTE_TO_COMMAND.get(
+                PacketCodec.HEADER.unpack_from(buffer, offset)[2])
+            if cmd in skip:
+                return PacketCodec.Control(cmd)
+
+        try:
+            message = PacketCodec.decode_from(buffer, offset)
+        except PacketCodec.PacketError, e:
+            vm201.display.add_tcp_msg(str(e))
+            if metrics is not None:
+                metrics.increment('vm201_length_errors_total', vm201.labels)
+            return PacketCodec.Control(None)
+
+        if metrics is not None and metrics.profile:
+            metrics.observe('vm201_codec_seconds',
+                            (('operation', 'decode'),), time() - start)
+
+        if vm201.display.verbose:
+            vm201.display.add_tcp_msg('Received {0}'.format(message.cmd))
+        return message
 
     def encode(self, vm201, cmd, data_x='', channel_id=''):
         '''
         Encode a TCP packet given a cmd.
         Generic packets: <STX><LEN><CMD><data_1>...<data_n><CHECKSUM><ETX>
 
-        @param cmd: CMD_FULL_NAME, as given in 'VM201.commands' dict.
+        @param cmd: CMD_FULL_NAME, as given in 'PacketCodec.COMMANDS' dict.
         @param data_x: optional data bytes.
         @ return string containing the bytes; TCP packet ready to transmit.
         '''
 
-        stx = vm201.commands['STX']
-        length = struct.pack('1B', vm201.commands['LEN_'+cmd])
-        cmd_byte = vm201.commands[cmd]
-
-        # bool('') -> False. Encode called without data_x -> skip this block.
-        if cmd == 'CMD_USERNAME' or cmd == 'CMD_PASSWORD':
-            # data_x is padded with zeros until it has length 9.
-            data_x += (9 - len(data_x)) * '\x00'
-
-        # If data_x is not given, adding data_x = '' does not alter checksum.
-        checksum = self.calculate_checksum(stx + length + cmd_byte + data_x)
-        etx = vm201.commands['ETX']
-
-        vm201.display.add_tcp_msg('Sending {0} {1}'.format(cmd, channel_id))
-
-        # If data_x is not given, adding data_x = '' does not alter packet.
-        return stx + length + cmd_byte + data_x + checksum + etx
+        # No string formatting on the hot path unless it is displayed.
+        if vm201.display.verbose:
+            vm201.display.add_tcp_msg('Sending {0} {1}'
+                                      .format(cmd, channel_id))
+
+        metrics = vm201.metrics
+        if metrics is not None and metrics.profile:
+            start = time()
+            packet = PacketCodec.encode(cmd, data_x)
+            metrics.observe('vm201_codec_seconds',
+                            (('operation', 'encode'),), time() - start)
+        else:
+            packet = PacketCodec.encode(cmd, data_x)
+
+        if metrics is not None:
+            metrics.packet(vm201.labels, TX, len(packet))
+        if vm201.packet_log is not None:
+            vm201.packet_log.record(TX, packet)
+        if vm201.capture_stream is not None:
+            vm201.capture_stream.record(TX, packet)
+        return packet
@@ -0,0 +1,327 @@
+'''
+VM201CommandQueue class.
+
+One queue per card in front of a VM201Session, for many producers at once:
+manual commands, schedulers, scripts. Commands are not sent one packet per
+call in arrival order; whatever is pending when the card may be sent to again
+is merged into the net change of every output and timer bit, and only that
+is sent, in one pipelined burst:
+    TOGGLE 1 and TOGGLE 1       -> nothing
+    ON 1, 2 and OFF 2           -> ON 1, OFF 2
+    ON 3 while 3 is ON already  -> nothing
+The net change is applied to the state of the card just before sending and
+sent as ON/OFF masks (or one CMD_UPDATE), so retrying after a lost
+connection never toggles a channel twice.
+
+Every command is put in a lane. A lane says how long a command may linger
+in the queue to be merged with later ones; manual commands are sent at
+once, scheduled ones wait a little. Within a burst the packets of the most
+urgent lane go first. The firmware is protected by a rate limit: on average
+at most rate packets per second, in bursts of at most burst packets. While
+the queue waits for the rate limit, more commands pile up and are merged,
+and every pending command goes out in the next burst, so none is starved.
+
+CMD_PULSE is not merged; it is sent on its own, in arrival order.
+
+    queue = VM201CommandQueue(session).start()
+    queue.submit('CMD_ON', [1, 2], SCHEDULED)
+    queue.submit('CMD_OFF', [2], MANUAL).wait()
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from threading import Condition, Event, Thread
+from time import time
+
+from ChannelState import channels_of_mask, mask_of_channels
+from PacketCodec import pulse_data
+from VM201Reconciler import DesiredState, plan
+from VM201RelayCard import VM201Error
+
+
+# Lanes; a lower number is more urgent.
+MANUAL, AUTOMATIC, SCHEDULED = 0, 1, 2
+
+# Seconds a command of each lane may wait to be merged with later ones.
+LINGER = {MANUAL: 0.0, AUTOMATIC: 0.05, SCHEDULED: 0.25}
+
+OUTPUT_COMMANDS = {'CMD_ON': 'on', 'CMD_OFF': 'off', 'CMD_TOGGLE': 'toggle',
+                   'CMD_UPDATE': 'update'}
+TIMER_COMMANDS = {'CMD_TMR_ENA': 'on', 'CMD_TMR_DIS': 'off',
+                  'CMD_TMR_TOGGLE': 'toggle'}
+
+
+class NetChange(object):
+    '''
+    Net effect of a run of switch commands on 8 bits: every bit is forced
+    ON, forced OFF, flipped, or left alone.
+    '''
+
+    __slots__ = ('on', 'off', 'flip')
+
+    def __init__(self):
+        self.on = 0
+        self.off = 0
+        self.flip = 0
+
+    def add(self, operation, mask):
+        ''' @param operation: 'on', 'off', 'toggle' or 'update' '''
+        if operation == 'on':
+            self.on |= mask
+            self.off &= ~mask
+            self.flip &= ~mask
+        elif operation == 'off':
+            self.off |= mask
+            self.on &= ~mask
+            self.flip &= ~mask
+        elif operation == 'toggle':
+            forced = self.on | self.off
+            self.on, self.off = (self.on & ~mask) | (self.off & mask), \
+                (self.off & ~mask) | (self.on & mask)
+            self.flip ^= mask & ~forced
+        elif operation == 'update':
+            self.on = mask
+            self.off = ~mask & 0xFF
+            self.flip = 0
+
+    def touched(self):
+        return self.on | self.off | self.flip
+
+    def apply(self, bits):
+        ''' @return: bits after the change '''
+        return ((bits & ~self.off) | self.on) ^ self.flip
+
+
+class QueuedCommand(object):
+    __slots__ = ('cmd', 'mask', 'pulse', 'lane', 'due', 'done', 'error')
+
+    def __init__(self, cmd, mask, pulse, lane, due):
+        self.cmd = cmd
+        self.mask = mask
+        self.pulse = pulse
+        self.lane = lane
+        self.due = due
+        self.done = Event()
+        # VM201Error if the command could not be sent.
+        self.error = None
+
+    def wait(self, timeout=None):
+        '''
+        Wait until the command is sent, and the card confirmed the change.
+
+        @return: False if timeout passed first.
+        @raise VM201Error: the command could not be sent.
+        '''
+
+        if not self.done.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+def coalesce(commands):
+    '''
+    Merge switch commands into the net change of the output and timer bits.
+
+    @param commands: list of QueuedCommand, in arrival order; no pulses.
+    @return: tuple (output NetChange, timer NetChange, priorities), where
+             priorities is a function(cmd, mask) -> the most urgent lane of
+             the commands that touched those bits.
+    '''
+
+    output, timer = NetChange(), NetChange()
+    touched = list()
+    for command in commands:
+        if command.cmd in TIMER_COMMANDS:
+            timer.add(TIMER_COMMANDS[command.cmd], command.mask)
+            touched.append((True, command.mask, command.lane))
+        else:
+            operation = OUTPUT_COMMANDS[command.cmd]
+            output.add(operation, command.mask)
+            touched.append((False, 0xFF if operation == 'update'
+                            else command.mask, command.lane))
+
+    def priority(cmd, mask):
+        is_timer = cmd in TIMER_COMMANDS
+        if cmd == 'CMD_UPDATE':
+            mask = 0xFF
+        return min(lane for timer_bits, bits, lane in touched
+                   if timer_bits == is_timer and bits & mask)
+    return output, timer, priority
+
+
+class VM201CommandQueue(object):
+    def __init__(self, session, rate=10.0, burst=8, linger=None):
+        '''
+        @param session: VM201Session of the card.
+        @param rate: packets per second to the card, on average.
+        @param burst: packets that may be sent at once after a quiet period.
+        @param linger: dict lane -> seconds; defaults to LINGER.
+        '''
+
+        self.session = session
+        self.rate = rate
+        self.burst = burst
+        self.linger = dict(LINGER)
+        self.linger.update(linger or dict())
+
+        # Token bucket; may go below zero by the size of the last burst.
+        self.tokens = float(burst)
+        self.refilled = time()
+
+        self.pending = list()
+        self.condition = Condition()
+        self.running = False
+        self.thread = None
+
+        # Packets sent and commands submitted; their ratio is the gain.
+        self.packets = 0
+        self.submitted = 0
+
+    def submit(self, cmd, channel_ids, lane=SCHEDULED, pulse=None):
+        '''
+        @param cmd: CMD_FULL_NAME; a switch, timer or pulse command.
+        @param channel_ids: iterable of int channel numbers (1-8).
+        @param lane: MANUAL, AUTOMATIC, SCHEDULED, or any int; lower first.
+        @param pulse: tuple (time, unit) for CMD_PULSE.
+        @return: QueuedCommand; wait() on it for the result.
+        @raise PacketError: pulse time or unit out of range.
+        @raise ValueError: a channel is not 1...8; it would never be sent.
+        '''
+
+        # Fail here, not in the thread that sends.
+        mask = mask_of_channels(channel_ids)
+        if cmd == 'CMD_PULSE':
+            pulse_data(*pulse)
+        elif cmd not in OUTPUT_COMMANDS and cmd not in TIMER_COMMANDS:
+            raise ValueError('{0} cannot be queued'.format(cmd))
+
+        command = QueuedCommand(cmd, mask, pulse, lane,
+                                time() + self.linger.get(lane, 0.0))
+        with self.condition:
+            self.pending.append(command)
+            self.submitted += 1
+            self.condition.notify()
+        return command
+
+    def pulse(self, channel_ids, time, unit='s', lane=SCHEDULED):
+        return self.submit('CMD_PULSE', channel_ids, lane, (time, unit))
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def next_batch(self):
+        '''
+        Wait until a command is due and the rate limit allows a burst, then
+        take the commands to merge: all pending ones up to the first pulse,
+        or that pulse on its own.
+
+        @return: list of QueuedCommand; empty if stopped.
+        '''
+
+        with self.condition:
+            while self.running:
+                now = time()
+                self.refill(now)
+                wait = None
+                if self.pending:
+                    wait = min(command.due for command in self.pending) - now
+                    if self.tokens < 1:
+                        wait = max(wait, (1 - self.tokens) / self.rate)
+                if wait is None or wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+                batch = list()
+                for command in self.pending:
+                    if command.cmd == 'CMD_PULSE':
+                        batch = batch or [command]
+                        break
+                    batch.append(command)
+                del self.pending[:len(batch)]
+                return batch
+        return list()
+
+    def send(self, batch):
+        ''' Send the net change of batch in one pipelined burst '''
+        if batch[0].cmd == 'CMD_PULSE':
+            switch = self.pulse_switch(batch[0])
+        else:
+            switch = self.net_switch(batch)
+        sent = self.session.call(switch)
+        with self.condition:
+            self.tokens -= sent
+            self.packets += sent
+
+    def pulse_switch(self, command):
+        def switch(card):
+            pipeline = card.pipeline()
+            pipeline.pulse(channels_of_mask(command.mask), *command.pulse)
+            pipeline.execute(self.session.timeout)
+            return 1
+        return switch
+
+    def net_switch(self, batch):
+        output, timer, priority = coalesce(batch)
+        desired = list()
+
+        def switch(card):
+            # Apply the change to the state once; a retry after a lost
+            # connection only completes what the first attempt did not.
+            if not desired:
+                state = card.state
+                desired.append(DesiredState(
+                    output.touched(), output.apply(state.output),
+                    timer.touched(), timer.apply(state.timer)))
+
+            packets = sorted((priority(cmd, mask), cmd, mask)
+                             for cmd, mask in plan(card.state, desired[0]))
+            if packets:
+                pipeline = card.pipeline()
+                for lane, cmd, mask in packets:
+                    pipeline.set_channels(cmd, channels_of_mask(mask))
+                pipeline.execute(self.session.timeout)
+            return len(packets)
+        return switch
+
+    def run(self):
+        while self.running:
+            batch = self.next_batch()
+            if not batch:
+                continue
+            try:
+                self.send(batch)
+            except VM201Error, e:
+                for command in batch:
+                    command.error = e
+                self.session.display.add_tcp_msg('Queue: {0}'.format(e))
+            for command in batch:
+                command.done.set()
+
+    def start(self):
+        ''' Send from a background thread '''
+        self.running = True
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        ''' Stop after the burst in progress; pending commands fail '''
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        with self.condition:
+            pending, self.pending = self.pending, list()
+        for command in pending:
+            command.error = VM201Error('Queue stopped.')
+            command.done.set()
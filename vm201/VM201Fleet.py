@@ -0,0 +1,304 @@
+'''
+VM201Fleet class.
+
+Drive many VM201 Ethernet Relay Cards concurrently from one event loop.
+Every card gets a non-blocking connection that walks through the protocol
+(login, initial status, commands, CMD_CLOSED) as its packets arrive, so
+switching a whole fleet takes about as long as the slowest card.
+
+NB this code base is Python 2, hence the event loop is asyncore.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import asyncore
+from socket import AF_INET, SOCK_STREAM, error, gethostbyname
+from socket import IPPROTO_TCP, TCP_NODELAY
+from struct import pack
+from sys import exc_info
+from time import time
+
+from FrameReader import FrameReader
+from PacketCodec import COMMANDS
+from TCPPacketHandler import TCPPacketHandler
+from Printer import Printer
+from ChannelState import ChannelState, mask_of_channels
+
+
+class FleetCard(object):
+    def __init__(self, host, port=9760, username=None, password=None):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+
+        # Resolved once; reused for every run of the fleet.
+        self.ip = None
+
+    def __str__(self):
+        return '{0}:{1}'.format(self.host, self.port)
+
+
+class CardResult(object):
+    def __init__(self, card):
+        self.card = card
+        self.ok = False
+        self.error = None
+        self.state = None  # ChannelState after the last CMD_STATUS
+        self.elapsed = None
+
+    def __str__(self):
+        if not self.ok:
+            return '{0}: error={1}'.format(self.card, self.error)
+        return '{0}: output={1:08b}, timer={2:08b}, input={3}, ' \
+            'elapsed={4:.3f}s'.format(self.card, self.state.output,
+                                      self.state.timer, self.state.input,
+                                      self.elapsed)
+
+
+class CardConnection(asyncore.dispatcher):
+    '''
+    One card in the event loop. States:
+        'LOGIN'     waiting for CMD_AUTH/CMD_LOGGED_IN/CMD_ACCESS_DENIED
+        'STATUS'    logged in; waiting for the initial CMD_STATUS
+        'SWITCHING' commands sent; waiting for the CMD_STATUS updates
+        'CLOSING'   CMD_CLOSED sent; waiting for the vm201 to close
+        'DONE'      result is final; removed from the event loop
+    '''
+
+    def __init__(self, fleet_map, card, commands, deadline, packet_log=None,
+                 metrics=None, capture=None):
+        asyncore.dispatcher.__init__(self, map=fleet_map)
+
+        # Duck-type VM201RelayCard for the TCPPacketHandler.
+        self.commands = COMMANDS
+        self.display = Printer(verbose=False)
+        self.tcp_handler = TCPPacketHandler()
+        self.packet_log = packet_log
+        self.metrics = metrics
+        self.labels = (('card', str(card)),)
+        self.capture_stream = None
+        if capture is not None:
+            self.capture_stream = capture.stream(str(card))
+
+        self.card = card
+        self.todo = commands
+        self.deadline = deadline
+        self.started = time()
+        self.result = CardResult(card)
+
+        self.state = 'LOGIN'
+        self.expected_status = 0
+        self.out = ''
+
+        try:
+            if card.ip is None:
+                card.ip = gethostbyname(card.host)
+            self.create_socket(AF_INET, SOCK_STREAM)
+            self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+            self.connect((card.ip, card.port))
+        except error, e:
+            self.fail('Could not connect: {0}'.format(e))
+            return
+
+        self.reader = FrameReader(self.socket, capture=self.capture_stream)
+
+    def send_packet(self, cmd, data_x=''):
+        self.out += self.tcp_handler.encode(self, cmd, data_x)
+
+    def finish(self):
+        self.result.ok = self.result.error is None
+        self.result.elapsed = time() - self.started
+        self.state = 'DONE'
+        if self.metrics is not None:
+            labels = self.labels + (('command', 'fleet_session'),)
+            self.metrics.observe('vm201_command_seconds', labels,
+                                 self.result.elapsed)
+            if not self.result.ok:
+                self.metrics.increment('vm201_command_errors_total', labels)
+        if self.socket is not None:
+            self.close()
+
+    def fail(self, msg):
+        if self.result.error is None:
+            self.result.error = msg
+        self.finish()
+
+    def start_closing(self):
+        self.send_packet('CMD_CLOSED')
+        self.state = 'CLOSING'
+
+    def handle_message(self, message):
+        cmd = message.cmd
+
+        if cmd == 'CMD_AUTH':
+            if self.card.username is None or self.card.password is None:
+                self.fail('Error: no username and/or password specified!')
+                return
+            self.send_packet('CMD_USERNAME', self.card.username)
+            self.send_packet('CMD_PASSWORD', self.card.password)
+        elif cmd == 'CMD_LOGGED_IN':
+            self.state = 'STATUS'
+        elif cmd == 'CMD_ACCESS_DENIED':
+            self.fail('Authentication failed.')
+        elif cmd == 'CMD_STATUS':
+            self.result.state = ChannelState.from_status(message)
+            if self.state == 'STATUS':
+                self.send_commands()
+            elif self.state == 'SWITCHING':
+                self.expected_status -= 1
+                if self.expected_status <= 0:
+                    self.start_closing()
+        elif cmd == 'CMD_CLOSED':
+            if self.state == 'CLOSING':
+                self.finish()
+            else:
+                self.fail('Connection closed by the vm201.')
+
+    def send_commands(self):
+        '''
+        The vm201 only sends a CMD_STATUS if a command changes the status,
+        so predict how many updates to wait for before closing the session.
+        '''
+
+        state = self.result.state
+        if callable(self.todo):
+            # Commands that depend on the state the card is in.
+            self.todo = self.todo(state)
+        for command in self.todo:
+            # (cmd, mask) or (cmd, mask, bytes after the mask); e.g. CMD_PULSE.
+            cmd, mask = command[:2]
+            self.send_packet(cmd, pack('B', mask) + ''.join(command[2:]))
+            new_state = state.apply(cmd, mask)
+            if new_state != state:
+                self.expected_status += 1
+            state = new_state
+
+        if self.expected_status:
+            self.state = 'SWITCHING'
+        else:
+            self.start_closing()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return not self.connected or bool(self.out)
+
+    def handle_connect(self):
+        pass
+
+    def handle_read(self):
+        try:
+            nbytes = self.reader.fill()
+        except error, e:
+            self.fail('Error in recv: {0}'.format(e))
+            return
+
+        if not nbytes:
+            if self.state == 'CLOSING':
+                self.finish()
+            else:
+                self.fail('Connection closed by the vm201.')
+            return
+
+        buffer = self.reader.buffer
+        offset = self.reader.next_frame_offset()
+        while offset is not None and self.state != 'DONE':
+            # The fleet has no use for the channel names.
+            self.handle_message(self.tcp_handler.decode_from(
+                self, buffer, offset, ('CMD_NAME',)))
+            offset = self.reader.next_frame_offset()
+
+    def handle_write(self):
+        sent = self.send(self.out)
+        self.out = self.out[sent:]
+
+    def handle_close(self):
+        if self.state == 'CLOSING':
+            self.finish()
+        else:
+            self.fail('Connection closed by the vm201.')
+
+    def handle_error(self):
+        # asyncore calls this from within the except clause.
+        self.fail('Error: {0}'.format(exc_info()[1]))
+
+
+class VM201Fleet(object):
+    def __init__(self, timeout=10.0, packet_log=None, metrics=None,
+                 capture=None):
+        # Per-card timeout for a complete session, in seconds.
+        self.timeout = timeout
+        # Optional PacketLog shared by all cards.
+        self.packet_log = packet_log
+        # Optional Metrics shared by all cards.
+        self.metrics = metrics
+        # Optional PacketCapture shared by all cards.
+        self.capture = capture
+        self.cards = list()
+
+    def add_card(self, host, port=9760, username=None, password=None):
+        card = FleetCard(host, port, username, password)
+        self.cards.append(card)
+        return card
+
+    def run(self, commands, timeout=None):
+        '''
+        Connect to, login to, and send commands to all cards concurrently.
+
+        @param commands: list of (CMD_FULL_NAME, int channel mask) tuples.
+        @param timeout: seconds per card; defaults to self.timeout.
+        @return: list of CardResult, in the order the cards were added.
+        '''
+
+        return self.run_cards([(card, commands) for card in self.cards],
+                              timeout)
+
+    def run_cards(self, jobs, timeout=None):
+        '''
+        As run, but with different commands per card.
+
+        @param jobs: list of (FleetCard, commands) tuples; commands as in run,
+                     optionally with a third element: the data bytes after
+                     the mask, e.g. PacketCodec.pulse_data for CMD_PULSE.
+                     Or a function that is given the ChannelState of the
+                     initial CMD_STATUS and returns the commands.
+        @return: list of CardResult, in the order of jobs.
+        '''
+
+        if timeout is None:
+            timeout = self.timeout
+
+        fleet_map = dict()
+        deadline = time() + timeout
+        connections = [CardConnection(fleet_map, card, commands, deadline,
+                                      self.packet_log, self.metrics,
+                                      self.capture)
+                       for card, commands in jobs]
+
+        while fleet_map:
+            now = time()
+            for connection in fleet_map.values():
+                if now > connection.deadline:
+                    if self.metrics is not None:
+                        self.metrics.increment('vm201_timeouts_total',
+                                               connection.labels)
+                    connection.fail('Timeout after {0}s in state {1}'
+                                    .format(timeout, connection.state))
+            if not fleet_map:
+                break
+            wait = min(max(deadline - now, 0.0), 0.1)
+            asyncore.loop(timeout=wait, map=fleet_map, use_poll=True, count=1)
+
+        return [connection.result for connection in connections]
+
+    def on_off_toggle(self, cmd, channel_ids, timeout=None):
+        ''' Send one cmd for the given channels to every card in the fleet '''
+        return self.run([(cmd, mask_of_channels(channel_ids))], timeout)
+
+    def status(self, timeout=None):
+        ''' Login to every card and return its status; nothing is switched '''
+        return self.run([], timeout)
@@ -0,0 +1,342 @@
+'''
+VM201Gateway class.
+
+Local daemon that holds a single persistent VM201Session per card, and serves
+any number of local clients. The VM201 firmware only handles a few TCP
+clients at once; scripts and dashboards talk to the gateway instead, so they
+no longer fight over the card, and login and channel names are done once.
+
+Clients send one JSON object per line and get one JSON object per line back:
+    {"op": "cards"}
+    {"op": "status", "card": "garden"}                 cached, no packet sent
+    {"op": "status", "card": "garden", "fresh": true}  sends CMD_STATUS_REQ
+    {"op": "set", "card": "garden", "cmd": "CMD_ON", "channels": [1, 2]}
+    {"op": "pulse", "card": "garden", "channels": [3], "time": 5, "unit": "s"}
+    {"op": "subscribe"}                                 or with "card"
+Answers are {"ok": true, ...} or {"ok": false, "error": "..."}. After a
+subscribe, the gateway writes an {"event": "status", ...} line for every
+change of the channel state, until the client hangs up.
+
+The cards are given in a JSON config file:
+    {"garden": {"host": "192.168.1.100", "port": 9760,
+                "username": "user", "password": "pass"}}
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import json
+from Queue import Empty, Full, Queue
+from socket import error, socket, AF_INET, SOCK_STREAM
+from SocketServer import StreamRequestHandler, ThreadingTCPServer
+from threading import Event, Lock, Thread
+
+from Metrics import Metrics
+from VM201RelayCard import VM201Error
+from VM201Session import VM201Session
+
+
+DEFAULT_PORT = 9761
+
+SWITCH_COMMANDS = ['CMD_ON', 'CMD_OFF', 'CMD_TOGGLE', 'CMD_UPDATE',
+                   'CMD_TMR_ENA', 'CMD_TMR_DIS', 'CMD_TMR_TOGGLE']
+
+
+class GatewayCard(object):
+    ''' One card: its session, and a thread that watches the socket '''
+
+    def __init__(self, gateway, name, session):
+        self.gateway = gateway
+        self.name = name
+        self.session = session
+        self.session.card.on_status = self.on_status
+
+        self.stopped = Event()
+        self.thread = None
+
+    def as_dict(self):
+        card = self.session.card
+        answer = {'card': self.name,
+                  'connected': self.session.is_connected(),
+                  'names': [card.names[i] for i in range(1, 10)],
+                  'output': None, 'timer': None, 'input': None}
+        state = card.state
+        if state is not None:
+            answer.update({'output': state.output, 'timer': state.timer,
+                           'input': state.input})
+        return answer
+
+    def on_status(self, card, old_state, new_state):
+        if new_state != old_state:
+            event = self.as_dict()
+            event['event'] = 'status'
+            self.gateway.publish(self.name, event)
+
+    def run(self):
+        '''
+        Pick up what the vm201 sends unasked (input changes, ends of pulses)
+        as soon as it arrives, and send keepalives when the card is quiet.
+        '''
+
+        session = self.session
+        session.watch(self.stopped,
+                      lambda: min(session.keepalive_interval, 1.0),
+                      session.keepalive, label=self.name)
+
+    def start(self):
+        self.stopped.clear()
+        self.session.stopped.clear()
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        # Ends the backoff of a reconnect in progress too.
+        self.session.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.session.lock:
+            self.session.card.disconnect(self.session.timeout)
+
+
+class GatewayHandler(StreamRequestHandler):
+    ''' One local client; one JSON request per line '''
+
+    def handle(self):
+        gateway = self.server.gateway
+        for line in iter(self.rfile.readline, ''):
+            try:
+                request = json.loads(line)
+                if request.get('op') == 'subscribe':
+                    self.subscribe(gateway, request.get('card'))
+                    return
+                answer = gateway.handle(request)
+            except ValueError, e:
+                answer = {'ok': False, 'error': 'Bad request: {0}'.format(e)}
+            self.write(answer)
+
+    def write(self, answer):
+        self.wfile.write(json.dumps(answer, sort_keys=True) + '\n')
+        self.wfile.flush()
+
+    def subscribe(self, gateway, card_name):
+        queue = gateway.subscribe(card_name)
+        try:
+            self.write({'ok': True})
+            while not gateway.stopped.is_set():
+                try:
+                    event = queue.get(timeout=1.0)
+                except Empty:
+                    continue
+                if event is None:
+                    # Dropped for falling behind.
+                    return
+                self.write(event)
+        except error:
+            # The client hung up.
+            pass
+        finally:
+            gateway.unsubscribe(queue)
+
+
+class GatewayServer(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class VM201Gateway(object):
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, backlog=100):
+        '''
+        @param host, port: local address to serve the clients on.
+        @param backlog: events a subscriber may fall behind before it is
+                        disconnected; a slow client never blocks a card.
+        '''
+
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+
+        self.cards = dict()
+        self.subscribers = dict()
+        self.lock = Lock()
+
+        # Optional Metrics, given to the session of every card added.
+        self.metrics = None
+
+        self.server = None
+        self.thread = None
+        self.stopped = Event()
+
+    def add_card(self, name, host, port=9760, username=None, password=None,
+                 **session_options):
+        '''
+        @param name: str; the name clients use for this card.
+        @param session_options: passed on to VM201Session.
+        '''
+
+        session_options.setdefault('metrics', self.metrics)
+        session = VM201Session(host, port, username, password, False,
+                               **session_options)
+        card = GatewayCard(self, name, session)
+        self.cards[name] = card
+        return card
+
+    def load_config(self, path):
+        with open(path) as f:
+            config = json.load(f)
+        for name, card in sorted(config.items()):
+            self.add_card(name, card['host'], card.get('port', 9760),
+                          card.get('username'), card.get('password'))
+
+    def subscribe(self, card_name=None):
+        ''' @return: Queue of events of card_name; of all cards if None '''
+        queue = Queue(self.backlog)
+        with self.lock:
+            self.subscribers[queue] = card_name
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers.pop(queue, None)
+
+    def publish(self, card_name, event):
+        ''' Fan event out to every subscriber of card_name '''
+        with self.lock:
+            subscribers = self.subscribers.items()
+        for queue, name in subscribers:
+            if name is not None and name != card_name:
+                continue
+            try:
+                queue.put_nowait(event)
+            except Full:
+                self.unsubscribe(queue)
+                # Make room for the None that tells the handler to stop.
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    pass
+                queue.put_nowait(None)
+
+    def handle(self, request):
+        '''
+        Execute one request of a client.
+
+        @param request: dict, as described in the module docstring.
+        @return: dict; the answer for the client.
+        '''
+
+        op = request.get('op')
+        if op == 'cards':
+            return {'ok': True, 'cards': sorted(self.cards)}
+
+        card = self.cards.get(request.get('card'))
+        if card is None:
+            return {'ok': False,
+                    'error': 'Unknown card {0!r}'.format(request.get('card'))}
+        session = card.session
+
+        try:
+            if op == 'status':
+                if request.get('fresh') or session.state is None:
+                    session.status()
+            elif op == 'set':
+                cmd = request.get('cmd')
+                if cmd not in SWITCH_COMMANDS:
+                    return {'ok': False,
+                            'error': 'Unknown command {0!r}'.format(cmd)}
+                session.set_channels(cmd, request.get('channels', []))
+            elif op == 'pulse':
+                session.pulse(request.get('channels', []), request['time'],
+                              request.get('unit', 's'))
+            else:
+                return {'ok': False, 'error': 'Unknown op {0!r}'.format(op)}
+        except (KeyError, TypeError, ValueError), e:
+            # ValueError covers PacketError, and channels out of 1...8.
+            return {'ok': False, 'error': 'Bad request: {0}'.format(e)}
+        except VM201Error, e:
+            return {'ok': False, 'error': str(e)}
+
+        answer = card.as_dict()
+        answer['ok'] = True
+        return answer
+
+    def start(self):
+        ''' Start watching the cards, and serve the clients from a thread '''
+        self.stopped.clear()
+        for card in self.cards.values():
+            card.start()
+
+        self.server = GatewayServer((self.host, self.port), GatewayHandler)
+        self.server.gateway = self
+        # The actual port, if port 0 was given.
+        self.port = self.server.server_address[1]
+
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = self.thread = None
+        for card in self.cards.values():
+            card.stop()
+
+
+class GatewayClient(object):
+    ''' Minimal client for scripts: one JSON request, one JSON answer '''
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.connect((host, port))
+        self.rfile = self.socket.makefile('r')
+
+    def request(self, op, **params):
+        params['op'] = op
+        self.socket.sendall(json.dumps(params) + '\n')
+        return json.loads(self.rfile.readline())
+
+    def events(self, card=None):
+        ''' Subscribe, and yield every status event as a dict '''
+        self.request('subscribe', card=card)
+        for line in iter(self.rfile.readline, ''):
+            yield json.loads(line)
+
+    def close(self):
+        self.rfile.close()
+        self.socket.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from time import sleep
+
+    parser = argparse.ArgumentParser(description='VM201 gateway daemon')
+    parser.add_argument('config', help='JSON file: name -> host, port, '
+                                       'username, password')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve Prometheus /metrics on this local port')
+    args = parser.parse_args()
+
+    gateway = VM201Gateway(args.host, args.port)
+    if args.metrics_port is not None:
+        gateway.metrics = Metrics()
+        gateway.metrics.serve(args.metrics_port)
+    gateway.load_config(args.config)
+    gateway.start()
+    print 'Serving {0} cards on {1}:{2}'.format(len(gateway.cards),
+                                                gateway.host, gateway.port)
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        gateway.stop()
@@ -0,0 +1,211 @@
+'''
+VM201Pipeline class.
+
+Pipelined commands for one VM201RelayCard. Where the card methods send one
+command and wait for its answer, a pipeline writes a burst of commands back
+to back and matches the answers to the commands afterwards. Login, status,
+a few switches and another status thus take about one round trip instead of
+one per command.
+
+    pipeline = VM201Pipeline(card)
+    pipeline.login()
+    pipeline.status()
+    pipeline.set_channels('CMD_ON', [1, 2])
+    pipeline.set_channels('CMD_OFF', [3])
+    pipeline.status()
+    replies = pipeline.execute()
+
+The vm201 answers in order and the protocol has no request ids, so answers
+are matched to the oldest pending command. A switch is only answered if it
+changes the status; whether it does is known once every command in front of
+it is answered, so the expected answer is predicted at that moment. At most
+window commands are in flight, so the small receive buffer of the firmware
+is never overrun.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from collections import deque
+from socket import error
+from socket import timeout as timeout_error
+from struct import pack
+from time import time
+
+from ChannelState import mask_of_channels
+from PacketCodec import pulse_data
+from VM201RelayCard import LoginError, VM201Error
+
+
+class PipelineRequest(object):
+    __slots__ = ('cmd', 'mask', 'packet', 'expect', 'reply')
+
+    def __init__(self, cmd, packet, expect=None, mask=0):
+        '''
+        @param packet: bytes to send; may hold several packets, or none.
+        @param expect: list of CMD_FULL_NAME of the answers, in order; None
+                       for a switch, which is answered only if it changes the
+                       status.
+        '''
+
+        self.cmd = cmd
+        self.mask = mask
+        self.packet = packet
+        self.expect = expect
+        # Named tuple from PacketCodec of the last answer; None if none.
+        self.reply = None
+
+
+class VM201Pipeline(object):
+    def __init__(self, card, window=8):
+        '''
+        @param card: VM201RelayCard; connected, or opened with open_socket()
+                     for a pipelined login.
+        @param window: maximum number of commands sent but not yet answered.
+        '''
+
+        self.card = card
+        self.window = window
+        self.requests = list()
+
+    def add(self, request):
+        self.requests.append(request)
+        return request
+
+    def login(self):
+        '''
+        Send the credentials at once, without waiting for the CMD_AUTH. The
+        answer is CMD_LOGGED_IN, then the channel names and a CMD_STATUS.
+        '''
+
+        card = self.card
+        packet = ''
+        if card.username is not None and card.password is not None:
+            packet = card.tcp_handler.encode(card, 'CMD_USERNAME',
+                                             card.username) + \
+                card.tcp_handler.encode(card, 'CMD_PASSWORD', card.password)
+        return self.add(PipelineRequest('CMD_LOGGED_IN', packet,
+                                        ['CMD_LOGGED_IN', 'CMD_STATUS']))
+
+    def status(self):
+        packet = self.card.tcp_handler.encode(self.card, 'CMD_STATUS_REQ')
+        return self.add(PipelineRequest('CMD_STATUS_REQ', packet,
+                                        ['CMD_STATUS']))
+
+    def set_channels(self, cmd, channel_ids):
+        channel_ids = list(channel_ids)
+        mask = mask_of_channels(channel_ids)
+        packet = self.card.tcp_handler.encode(self.card, cmd, pack('B', mask),
+                                              channel_ids)
+        return self.add(PipelineRequest(cmd, packet, mask=mask))
+
+    def pulse(self, channel_ids, time, unit='s'):
+        channel_ids = list(channel_ids)
+        mask = mask_of_channels(channel_ids)
+        data_x = pack('B', mask) + pulse_data(time, unit)
+        packet = self.card.tcp_handler.encode(self.card, 'CMD_PULSE', data_x,
+                                              channel_ids)
+        return self.add(PipelineRequest('CMD_PULSE', packet, mask=mask))
+
+    def switch(self, cmd, mask, extra=''):
+        '''
+        A switch given as in VM201Fleet.run: a mask, and the data bytes
+        after it, if any; e.g. PacketCodec.pulse_data for CMD_PULSE.
+        '''
+
+        packet = self.card.tcp_handler.encode(self.card, cmd,
+                                              pack('B', mask) + extra)
+        return self.add(PipelineRequest(cmd, packet, mask=mask))
+
+    def complete(self, in_flight):
+        ''' Drop the commands at the head that expect no (more) answers '''
+        state = self.card.state
+        while in_flight:
+            head = in_flight[0]
+            if head.expect is None:
+                # Everything in front of the switch is answered, so the
+                # state is the one the vm201 applies the switch to.
+                if state is None or state.apply(head.cmd, head.mask) != state:
+                    head.expect = ['CMD_STATUS']
+                else:
+                    head.expect = []
+            if head.expect:
+                return
+            in_flight.popleft()
+
+    def match(self, in_flight, message):
+        ''' Assign message to the oldest command that waits for it '''
+        if not in_flight:
+            return
+
+        head = in_flight[0]
+        if message.cmd == head.expect[0]:
+            head.expect.pop(0)
+            head.reply = message
+        elif message.cmd == 'CMD_ACCESS_DENIED' and \
+                head.cmd == 'CMD_LOGGED_IN':
+            self.card.fail('Authentication failed.', LoginError)
+        elif message.cmd == 'CMD_CLOSED':
+            self.card.fail('Connection closed by the vm201.')
+
+    def execute(self, timeout=3.0):
+        '''
+        Send all commands, at most window at a time, and match the answers.
+
+        @param timeout: seconds for the complete pipeline.
+        @return: list with the last answer of each command, in order; None
+                 for switches that did not change the status.
+        @raise VM201Error: connection lost or closed by the vm201.
+        @raise LoginError: username and password were refused.
+        @raise socket.timeout: not all answers arrived within timeout.
+        '''
+
+        card = self.card
+        started = time()
+        requests, self.requests = self.requests, list()
+        todo = deque(requests)
+        in_flight = deque()
+        deadline = time() + timeout
+        previous = card.socket.gettimeout()
+
+        try:
+            while todo or in_flight:
+                burst = list()
+                while todo and len(in_flight) < self.window:
+                    request = todo.popleft()
+                    burst.append(request.packet)
+                    in_flight.append(request)
+                if burst:
+                    card.socket.sendall(''.join(burst))
+
+                self.complete(in_flight)
+                if not in_flight:
+                    continue
+
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise timeout_error('timed out')
+                card.socket.settimeout(remaining)
+
+                offset = card.reader.read_frame_offset()
+                self.match(in_flight, card.handle_frame(offset))
+                self.complete(in_flight)
+        except timeout_error:
+            if card.metrics is not None:
+                card.metrics.increment('vm201_timeouts_total', card.labels)
+            raise
+        except error, e:
+            card.fail('Error in pipeline: {0}'.format(e))
+        finally:
+            if card.socket is not None:
+                card.socket.settimeout(previous)
+
+        if card.metrics is not None:
+            card.metrics.observe('vm201_command_seconds',
+                                 card.labels + (('command', 'pipeline'),),
+                                 time() - started)
+        card.save_names()
+        if card.display.verbose:
+            card.display.update_state(str(card))
+        return [request.reply for request in requests]
@@ -0,0 +1,243 @@
+'''
+VM201Reconciler class.
+
+Declarative control of many VM201 cards: give the desired output and timer
+state of the channels of every card, and the reconciler brings the cards
+there. Per card and per pass it logs in, reads the CMD_STATUS once, and sends
+only the mask packets for the bits that differ; a card that is already in the
+desired state gets no switch packet at all. Passes are idempotent, so they
+can run on a loop, and a fleet that drifted (a manual switch, a power cut, an
+expired pulse) converges at the next pass.
+
+Channels that are not given are left alone. Differences are fixed with
+CMD_ON/CMD_OFF and CMD_TMR_ENA/CMD_TMR_DIS masks, at most one packet of each,
+or with a single CMD_UPDATE if all eight outputs are given. Toggles would save
+a packet now and then, but a toggle sent twice, or after someone else
+switched the channel, switches it the wrong way.
+
+The desired state is given in a JSON config file, the VM201Gateway config
+with "output" and "timer" per card:
+    {"garden": {"host": "192.168.1.100", "port": 9760,
+                "username": "user", "password": "pass",
+                "output": {"1": true, "2": false}, "timer": {"1": false}}}
+
+    python VM201Reconciler.py config.json [--interval 60] [--once]
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import json
+from threading import Event, Thread
+from time import time
+
+from ChannelState import mask_of_channels
+from VM201Fleet import VM201Fleet
+
+
+class DesiredState(object):
+    __slots__ = ('output_mask', 'output', 'timer_mask', 'timer')
+
+    def __init__(self, output_mask=0, output=0, timer_mask=0, timer=0):
+        '''
+        @param output_mask, timer_mask: int; the channels that are given.
+        @param output, timer: int; desired bits of the given channels.
+        '''
+
+        self.output_mask = output_mask
+        self.output = output & output_mask
+        self.timer_mask = timer_mask
+        self.timer = timer & timer_mask
+
+    @classmethod
+    def from_dicts(cls, output=None, timer=None):
+        '''
+        @param output, timer: dict of channel number (1-8; int or str, as in
+                              JSON) -> bool; None for no channels.
+        '''
+
+        masks = list()
+        for channels in (output or dict(), timer or dict()):
+            given = [int(channel_id) for channel_id in channels]
+            wanted = [int(channel_id) for channel_id, on in channels.items()
+                      if on]
+            masks.extend([mask_of_channels(given), mask_of_channels(wanted)])
+        return cls(*masks)
+
+    @classmethod
+    def of_channels(cls, channel_ids, on):
+        ''' All channel_ids ON, or all OFF; the timers are left alone '''
+        mask = mask_of_channels(channel_ids)
+        return cls(mask, mask if on else 0)
+
+    def __repr__(self):
+        return 'DesiredState(output={0:08b}/{1:08b}, timer={2:08b}/{3:08b})'\
+            .format(self.output, self.output_mask, self.timer,
+                    self.timer_mask)
+
+    def is_met(self, state):
+        ''' @param state: ChannelState '''
+        return not plan(state, self)
+
+
+def plan(state, desired):
+    '''
+    The fewest mask packets that take a card from state to desired.
+
+    @param state: ChannelState, as read from the card.
+    @param desired: DesiredState.
+    @return: list of (CMD_FULL_NAME, int channel mask) tuples; empty if the
+             card is in the desired state already.
+    '''
+
+    commands = list()
+
+    output = (state.output ^ desired.output) & desired.output_mask
+    if output and desired.output_mask == 0xFF:
+        commands.append(('CMD_UPDATE', desired.output))
+    elif output:
+        if output & desired.output:
+            commands.append(('CMD_ON', output & desired.output))
+        if output & ~desired.output:
+            commands.append(('CMD_OFF', output & ~desired.output & 0xFF))
+
+    timer = (state.timer ^ desired.timer) & desired.timer_mask
+    if timer & desired.timer:
+        commands.append(('CMD_TMR_ENA', timer & desired.timer))
+    if timer & ~desired.timer:
+        commands.append(('CMD_TMR_DIS', timer & ~desired.timer & 0xFF))
+
+    return commands
+
+
+class VM201Reconciler(object):
+    def __init__(self, fleet=None, timeout=10.0, interval=60.0,
+                 packet_log=None, metrics=None):
+        '''
+        @param fleet: VM201Fleet to switch the cards with; created if None.
+        @param timeout: seconds per card per pass.
+        @param interval: seconds between the starts of two passes of
+                         serve_forever.
+        '''
+
+        if fleet is None:
+            fleet = VM201Fleet(timeout, packet_log, metrics)
+        self.fleet = fleet
+        self.interval = interval
+
+        # FleetCard -> DesiredState
+        self.desired = dict()
+        # FleetCard -> commands sent in the last pass; None if not logged in.
+        self.sent = dict()
+
+        # Called with the list of CardResult of every pass, if not None.
+        self.on_results = None
+
+        self.stopped = Event()
+        self.thread = None
+
+    def add_card(self, host, port=9760, username=None, password=None,
+                 output=None, timer=None):
+        '''
+        @param output, timer: dict of channel number -> bool; see
+                              DesiredState.from_dicts.
+        @return: FleetCard
+        '''
+
+        card = self.fleet.add_card(host, port, username, password)
+        self.desired[card] = DesiredState.from_dicts(output, timer)
+        return card
+
+    def set_desired(self, card, output=None, timer=None):
+        ''' Replace the desired state of card; applied at the next pass '''
+        self.desired[card] = DesiredState.from_dicts(output, timer)
+
+    def load_config(self, path):
+        with open(path) as f:
+            config = json.load(f)
+        for name, card in sorted(config.items()):
+            self.add_card(card['host'], card.get('port', 9760),
+                          card.get('username'), card.get('password'),
+                          card.get('output'), card.get('timer'))
+
+    def planner(self, card):
+        ''' Function for VM201Fleet.run_cards; plans when the status is in '''
+        desired = self.desired[card]
+
+        def commands(state):
+            self.sent[card] = plan(state, desired)
+            return self.sent[card]
+        return commands
+
+    def reconcile(self, timeout=None):
+        '''
+        One pass: bring every card into its desired state.
+
+        @return: list of CardResult, in the order the cards were added; the
+                 commands sent to each card are in self.sent.
+        '''
+
+        cards = [card for card in self.fleet.cards if card in self.desired]
+        for card in cards:
+            self.sent[card] = None
+        results = self.fleet.run_cards([(card, self.planner(card))
+                                        for card in cards], timeout)
+        if self.on_results is not None:
+            self.on_results(results)
+        return results
+
+    def serve_forever(self):
+        while not self.stopped.is_set():
+            started = time()
+            self.reconcile()
+            self.stopped.wait(max(0.0, started + self.interval - time()))
+
+    def start(self):
+        ''' Reconcile from a background thread, every interval seconds '''
+        self.stopped.clear()
+        self.thread = Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Keep VM201 cards in the state given in a config file')
+    parser.add_argument('config', help='JSON file: name -> host, port, '
+                        'username, password, output and timer')
+    parser.add_argument('--interval', type=float, default=60.0,
+                        help='seconds between two passes')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='seconds per card per pass')
+    parser.add_argument('--once', action='store_true',
+                        help='one pass, then exit')
+    args = parser.parse_args()
+
+    reconciler = VM201Reconciler(timeout=args.timeout,
+                                 interval=args.interval)
+    reconciler.load_config(args.config)
+
+    def report(results):
+        for result in results:
+            sent = reconciler.sent.get(result.card)
+            print '{0}; sent: {1}'.format(result, ', '.join(
+                '{0} {1:08b}'.format(cmd, mask) for cmd, mask in sent or [])
+                or 'nothing')
+    reconciler.on_results = report
+
+    if args.once:
+        reconciler.reconcile()
+    else:
+        try:
+            reconciler.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -9,76 +9,64 @@ Version: 2.0: Read TCP responses; send TCP packet to login and request status.
 '''
 
 
-from sys import exit
+from errno import EAGAIN, EWOULDBLOCK
 from socket import socket, AF_INET, SOCK_STREAM, gaierror, error, gethostbyname
-from socket import timeout
+from socket import timeout as timeout_error
+from socket import IPPROTO_TCP, TCP_NODELAY
 from struct import pack
+from time import time
 
-
-# http://txt.arboreus.com/2013/03/13/pretty-print-tables-in-python.html
-from tabulate import tabulate
-
-from Channel import Channel
+from ChannelState import ChannelState, apply_command, mask_of_channels
+from FrameReader import FrameReader
+from Metrics import timed
+from PacketCodec import BYTE_TO_COMMAND, COMMANDS, pulse_data
 from TCPPacketHandler import TCPPacketHandler
 from Printer import Printer
 
 
+class VM201Error(Exception):
+    ''' Raised when the vm201 cannot be reached or the session breaks '''
+    pass
+
+
+class LoginError(VM201Error):
+    ''' Raised when the vm201 refuses the username and password '''
+    pass
+
+
 class VM201RelayCard(object):
-    def __init__(self, host, port=9760, username=None, password=None,verbose=True):
+    def __init__(self, host, port=9760, username=None, password=None,verbose=True,
+                 name_cache=None, packet_log=None, metrics=None,
+                 capture=None):
         self.host = host
         self.port = int(port)
         self.username = username
         self.password = password
 
+        # Resolved once; reused when reconnecting.
+        self.ip = None
+
         # Socket to communicatie over with the vm201 firmware.
         self.socket = None
+        # Buffered reader that cuts the socket byte stream into packets.
+        self.reader = None
 
         # Pre-defined commands stated in the protocol.
-        self.commands = {'STX': '\x02',
-                         'ETX': '\x03',
-                         'CMD_AUTH': 'A',
-                         'LEN_CMD_AUTH': 5,
-                         'CMD_USERNAME': 'U',
-                         'LEN_CMD_USERNAME': 14,
-                         'CMD_PASSWORD': 'W',
-                         'LEN_CMD_PASSWORD': 14,
-                         'CMD_LOGGED_IN': 'L',
-                         'LEN_CMD_LOGGED_IN': 5,
-                         'CMD_ACCESS_DENIED': 'X',
-                         'LEN_CMD_ACCESS_DENIED': 5,
-                         'CMD_CLOSED': 'C',
-                         'LEN_CMD_CLOSED': 5,
-                         'CMD_NAME': 'N',
-                         'LEN_CMD_NAME': 22,
-                         'CMD_STATUS_REQ': 'R',
-                         'LEN_CMD_STATUS_REQ': 5,
-                         'CMD_STATUS': 'S',
-                         'LEN_CMD_STATUS': 8,
-                         'CMD_ON': 'O',
-                         'LEN_CMD_ON': 6,
-                         'CMD_OFF': 'F',
-                         'LEN_CMD_OFF': 6,
-                         'CMD_TOGGLE': 'T',
-                         'LEN_CMD_TOGGLE': 6,
-                         'CMD_PULSE': 'P',
-                         'LEN_CMD_PULSE': 8,
-                         'CMD_UPDATE': 'V',
-                         'LEN_CMD_UPDATE': 6,
-                         'CMD_TMR_ENA': 'E',
-                         'LEN_CMD_TMR_ENA': 6,
-                         'CMD_TMR_DIS': 'D',
-                         'LEN_CMD_TMR_DIS': 6,
-                         'CMD_TMR_TOGGLE': 'G',
-                         'LEN_CMD_TMR_TOGGLE': 6
-                         }
-
-        # Relay channels (8 output; 1 input)
-        self.channels = dict()
-        self.channel_string = str()
-        self.timer_string = str()
-
-        for i in range(1, 10):
-            self.channels[i] = Channel()
+        self.commands = COMMANDS
+
+        # Relay channels (8 output; 1 input): names by channel number, and
+        # the last known output/timer/input bits; None until a CMD_STATUS.
+        self.names = dict((i, None) for i in range(1, 10))
+        self.state = None
+
+        # Channel names are sent once, after login; an unchanged CMD_NAME
+        # leaves the name table, and the NameCache, alone.
+        self.name_cache = name_cache
+        self.names_changed = False
+        # CMD_NAMEs that are counted, but not decoded; see status().
+        self.skip = ()
+        if name_cache is not None:
+            self.names.update(name_cache.get(self.host, self.port))
 
         # TCP packet handler to decode and encode packets.
         self.tcp_handler = TCPPacketHandler()
@@ -86,12 +74,39 @@ class VM201RelayCard(object):
         # Custum print handler
         self.display = Printer(verbose)
 
+        # Optional PacketLog; records every packet, also when not verbose.
+        self.packet_log = packet_log
+
+        # Optional PacketCapture; the exact bytes sent and received, in a
+        # CaptureStream per connection.
+        self.capture = capture
+        self.capture_stream = None
+
+        # Optional Metrics; latency histograms and counters of this card.
+        self.metrics = metrics
+        self.labels = (('card', '{0}:{1}'.format(self.host, self.port)),)
+
+        # Optional callback on_status(card, old state, new state), called for
+        # every CMD_STATUS; e.g. to push changes to subscribers.
+        self.on_status = None
+
     def __str__(self):
+        # http://txt.arboreus.com/2013/03/13/pretty-print-tables-in-python.html
+        # Imported here; one-shot scripts never print the table.
+        from tabulate import tabulate
+
         header = ['Name', 'Output', 'Timer']
         table = list()
 
-        for i in range(1, 10):
-            table.append(self.channels[i].as_list())
+        bits = self.state
+        for i in range(1, 9):
+            if bits is None:
+                table.append([self.names[i], None, None])
+            else:
+                table.append([self.names[i], int(bits.is_on(i)),
+                              int(bits.timer_enabled(i))])
+        table.append([self.names[9], None if bits is None else bits.input,
+                      None if bits is None else '-'])
 
         # table.append(['', '', ''])
         state = '\n' + str(tabulate(table, header, "rst")) + '\n'
@@ -102,70 +117,104 @@ class VM201RelayCard(object):
         ''' Lookup key in self.commands dict given its value cmd_byte '''
 
         try:
-            return [key for key in self.commands if
-                    self.commands[key] == cmd_byte][0]
-        except KeyError, e:
+            return BYTE_TO_COMMAND[cmd_byte]
+        except KeyError:
             msg = 'Error: value \'{0}\' not found'\
-                  .format(cmd_byte) + ' in VM201.commands dict!\n', e
+                  .format(cmd_byte) + ' in VM201.commands dict!'
             self.display.add_tcp_msg(msg)
             return None
 
-    def connect(self):
-        ''' Connect to vm201 via TCP protocol '''
+    def fail(self, msg, exception=VM201Error):
+        ''' Show msg, drop the connection and raise exception(msg) '''
+        self.display.add_tcp_msg(msg)
+        self.close()
+        raise exception(msg)
 
-        # 'LEN_CMD_AUTH' is equal to 'LEN_CMD_LOGGED_IN'.
-        length = self.commands['LEN_CMD_AUTH']
+    @timed('connect')
+    def connect(self, timeout=None):
+        '''
+        Connect to vm201 via TCP protocol, and login.
 
-        # create an INET, STREAMing socket
-        try:
-            self.socket = socket(AF_INET, SOCK_STREAM)
-        except socket.error:
-            msg = 'Failed to create socket'
-            self.display.add_tcp_msg(msg)
-            exit()
-        else:
-            self.display.add_tcp_msg('Socket Created.')
+        @param timeout: seconds for each step of connect and login; None
+                        blocks until the vm201 answers.
+        @raise VM201Error: hostname, connection or protocol error.
+        @raise LoginError: username and password were refused.
+        '''
+
+        self.open_socket(timeout)
 
         try:
-            remote_ip = gethostbyname(self.host)
-            self.socket.connect((self.host, self.port))
-        except gaierror:
-            msg = 'Error in {0}: Hostname could not be resolved.'\
-                .format('connect_to_vm201')
-            self.display.add_tcp_msg(msg)
-            exit()
+            packet = self.reader.read_frame()
+            login_status = self.tcp_handler.decode(self, packet).cmd
+            if login_status == 'CMD_LOGGED_IN':
+                # No auth required; no further steps needed.
+                pass
+            elif login_status == 'CMD_AUTH':
+                self.login()
+            else:
+                self.fail('Error: unexpected server return {0}'
+                          .format(login_status))
+
+            # After login the vm201 sends the names of all channels, then the
+            # status. Fill the name table once; status() does not decode the
+            # names again.
+            self.receive_status_of_channels()
         except error, e:
-            msg = 'Error in {0}: {1}'\
-                .format('connect_to_vm201', e)
-            msg += '\nPerhaps hostname or port incorrect? Please double check.'
-            self.display.add_tcp_msg(msg)
-            exit()
-        else:
-            self.display.add_tcp_msg(
-                'Socket Connected to ' + self.host + ' on ip ' + remote_ip)
+            self.fail('Error in {0}: {1}'.format('connect_to_vm201', e))
+        finally:
+            if self.socket is not None:
+                self.socket.settimeout(None)
+
+        self.save_names()
+
+    def open_socket(self, timeout=None):
+        '''
+        Resolve the host (once) and open the TCP connection; do not login.
+
+        @param timeout: seconds; the socket keeps it until the caller resets.
+        @raise VM201Error: hostname or connection error.
+        '''
 
         try:
-            packet = self.socket.recv(length)
-        except Exception, e:
-            # I have no idea whatsoever what could go wrong =)...
-            raise
-            msg = 'Error: something went wrong in recv function in {0}!'\
-                  .format('connect_to_vm201')
-            self.display.add_tcp_msg(msg)
-            exit()
+            if self.ip is None:
+                self.ip = gethostbyname(self.host)
+        except gaierror:
+            self.fail('Error in {0}: Hostname could not be resolved.'
+                      .format('connect_to_vm201'))
 
-        response = self.tcp_handler.decode(self, packet)
-        login_status = self.lookup(chr(response[2]))
-        if login_status == 'CMD_LOGGED_IN':
-            # No auth required; no further steps needed.
-            pass
-        elif login_status == 'CMD_AUTH':
-            self.login()
+        # create an INET, STREAMing socket
+        try:
+            self.socket = socket(AF_INET, SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect((self.ip, self.port))
+        except error, e:
+            # The vm201 may have a new address by the next attempt.
+            self.ip = None
+            self.fail('Error in {0}: {1}'.format('connect_to_vm201', e) +
+                      '\nPerhaps hostname or port incorrect? '
+                      'Please double check.')
         else:
-            msg = 'Error: unexpected server return {0}'.format(login_status)
-            self.display.add_tcp_msg(msg)
-            exit()
-
+            self.display.add_tcp_msg(
+                'Socket Connected to ' + self.host + ' on ip ' + self.ip)
+
+        # Packets are tiny and often not answered; do not let Nagle hold the
+        # next one back until the previous one is acknowledged.
+        self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        if self.capture is not None:
+            self.capture_stream = self.capture.stream(
+                '{0}:{1}'.format(self.host, self.port))
+        self.reader = FrameReader(self.socket, capture=self.capture_stream)
+
+    def save_names(self):
+        ''' Write the channel names to the NameCache, if they changed '''
+        if self.name_cache is not None and self.names_changed:
+            self.name_cache.update(self.host, self.port, dict(
+                (channel, name) for channel, name in self.names.items()
+                if name is not None))
+            self.name_cache.save()
+            self.names_changed = False
+
+    @timed('login')
     def login(self):
         '''
         Expected client answer to received CMD_AUTH::
@@ -179,9 +228,8 @@ class VM201RelayCard(object):
         '''
 
         if self.username is None or self.password is None:
-            msg = 'Error: no username and/or password specified!'
-            self.display.add_tcp_msg(msg)
-            exit()
+            self.fail('Error: no username and/or password specified!',
+                      LoginError)
 
         packet = self.tcp_handler.encode(self, 'CMD_USERNAME', self.username)
         self.socket.send(packet)
@@ -189,88 +237,130 @@ class VM201RelayCard(object):
         packet = self.tcp_handler.encode(self, 'CMD_PASSWORD', self.password)
         self.socket.send(packet)
 
-        # 'LEN_CMD_LOGGED_IN' = 'LEN_CMD_ACCESS_DENIED'  = 'LEN_CMD_CLOSED'
-        length = self.commands['LEN_CMD_LOGGED_IN']
-        packet = self.socket.recv(length)
-        response = self.tcp_handler.decode(self, packet)
-        login_status = self.lookup(chr(response[2]))
+        packet = self.reader.read_frame()
+        login_status = self.tcp_handler.decode(self, packet).cmd
 
         if login_status == 'CMD_LOGGED_IN':
             self.display.add_tcp_msg('Authentication succeeded.')
         elif login_status == 'CMD_ACCESS_DENIED':
-            self.display.add_tcp_msg('Authentication failed.')
-            packet = self.socket.recv(length)
-            response = self.tcp_handler.decode(self, packet)
-            exit()
+            # The vm201 sends CMD_CLOSED next, and hangs up.
+            self.fail('Authentication failed.', LoginError)
+
+    def pipeline(self, window=8):
+        ''' @return: VM201Pipeline to send a burst of commands with '''
+        from VM201Pipeline import VM201Pipeline
+        return VM201Pipeline(self, window)
 
-    def receive_names_of_channels(self):
+    def receive_message(self):
         '''
-        Expected server response:
-        <STX><22><CMD_NAME><Channelnr><char1 name>...<char16 of name><CHECKSUM><ETX>
+        Decode the next packet straight from the receive buffer, and update the
+        local copy of the vm201 state.
+
+        @return: named tuple from PacketCodec, e.g. Name or Status.
         '''
 
-        length = self.commands['LEN_CMD_NAME']
+        return self.handle_frame(self.reader.read_frame_offset())
 
-        # First 8 output channels, then 1 input channel.
-        for i in range(1, 10):
-            try:
-                packet = self.socket.recv(length)
-            except Exception, e:
-                # I have no idea whatsoever what could go wrong =)...
-                raise
-                msg = 'Error: something went wrong in recv function in {0}!'\
-                      .format('receive_names_of_channels')
-                self.display.add_tcp_msg(msg)
-                exit()
-
-            response = self.tcp_handler.decode(self, packet)
-
-            name = ''
-            for char in response[4:20]:
-                # There appears to be buggy behaviour in the VM201 firmware.
-                # The channel names might have seemingly random chars added.
-                lowercase = (chr(char) >= 'a' and chr(char) <= 'z')
-                uppercase = (chr(char) >= 'A' and chr(char) <= 'Z')
-                # digit = (chr(char) >= 0 and chr(char) <= '9')
-                # space = (chr(char) == 32)
-                if uppercase or lowercase:
-                    name += chr(char)
-            self.channels[i].name = name
-
-    def receive_status_of_channels(self):
+    def handle_frame(self, offset):
+        ''' Decode the packet at offset in the receive buffer and handle it '''
+        message = self.tcp_handler.decode_from(self, self.reader.buffer,
+                                               offset, self.skip)
+
+        if message.cmd in self.skip:
+            pass
+        elif message.cmd == 'CMD_NAME':
+            self.update_name(message)
+        elif message.cmd == 'CMD_STATUS':
+            self.update_status(message)
+
+        return message
+
+    def drain(self):
         '''
-        Expected server response:
-        <STX><8><CMD_STATUS><output status><output timer status><input status><CHECKSUM><ETX>
+        Handle the packets the vm201 sent unasked since the last command, e.g.
+        the CMD_STATUS at the end of a pulse, without blocking. A connection
+        that was closed by the vm201 is detected here, before the next send.
+
+        @raise socket.error: if the vm201 closed the connection.
+        '''
+
+        # setblocking(1) would drop a timeout the caller set; restore it.
+        previous = self.socket.gettimeout()
+        self.socket.setblocking(0)
+        try:
+            while True:
+                offset = self.reader.next_frame_offset()
+                if offset is not None:
+                    self.handle_frame(offset)
+                elif not self.reader.fill():
+                    raise error('Connection closed by the vm201.')
+        except error, e:
+            if e.errno not in (EAGAIN, EWOULDBLOCK):
+                raise
+        finally:
+            self.socket.settimeout(previous)
+
+    def wait_for(self, cmd, timeout=None):
         '''
+        Handle incoming packets until a cmd packet arrives, and return at once.
 
-        length = self.commands['LEN_CMD_STATUS']
+        @param cmd: CMD_FULL_NAME of the expected packet.
+        @param timeout: seconds; None waits as the socket does, e.g. with the
+                        timeout a session set on it.
+        @return: named tuple from PacketCodec of the cmd packet.
+        @raise socket.timeout: if no cmd packet arrived within timeout.
+        '''
 
+        deadline = None if timeout is None else time() + timeout
+        # Restored afterwards; it may have been set by the caller.
+        previous = self.socket.gettimeout()
         try:
-            packet = self.socket.recv(length)
-        except Exception, e:
-            # I have no idea whatsoever what could go wrong =)...
+            while True:
+                if deadline is not None:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise timeout_error('timed out')
+                    self.socket.settimeout(remaining)
+                message = self.receive_message()
+                if message.cmd == cmd:
+                    return message
+        except timeout_error:
+            if self.metrics is not None:
+                self.metrics.increment('vm201_timeouts_total', self.labels)
             raise
-            msg = 'Error: something went wrong in recv function in {0}!'\
-                  .format('receive_status_of_channels')
-            self.display.add_tcp_msg(msg)
-            exit()
+        finally:
+            if deadline is not None and self.socket is not None:
+                self.socket.settimeout(previous)
+
+    def update_name(self, message):
+        '''
+        Expected server response:
+        <STX><22><CMD_NAME><Channelnr><char1 name>...<char16 of name><CHECKSUM><ETX>
+        '''
 
-        response = self.tcp_handler.decode(self, packet)
+        # PacketCodec.Name drops the garbage chars the VM201 firmware adds;
+        # they differ from frame to frame, so compare the name without them.
+        name = message.name
+        if self.names.get(message.channel) == name:
+            return
 
-        self.channel_string = bin(response[3])
-        self.timer_string = bin(response[4])
-        self.input_status = response[5]
+        self.names[message.channel] = name
+        self.names_changed = True
 
-        # The string is now channel 8...1, but we want 1...8
-        channel_string = self.channel_string[::-1]
-        timer_string = self.timer_string[::-1]
+    def update_status(self, message):
+        '''
+        Expected server response:
+        <STX><8><CMD_STATUS><output status><output timer status><input status><CHECKSUM><ETX>
+        '''
 
-        for i in range(8):
-            self.channels[i+1].status = channel_string[i]
-            self.channels[i+1].timer = timer_string[i]
+        # Last known bitmasks, used to predict whether a command changes state.
+        old_state, self.state = self.state, ChannelState.from_status(message)
+        if self.on_status is not None:
+            self.on_status(self, old_state, self.state)
 
-        self.channels[9].status = self.input_status
-        self.channels[9].timer = '-'
+    def receive_status_of_channels(self, timeout=None):
+        ''' Any decoded CMD_NAME in front of the CMD_STATUS updates the names '''
+        self.wait_for('CMD_STATUS', timeout)
 
     def send_status_request(self):
         '''
@@ -281,63 +371,110 @@ class VM201RelayCard(object):
         packet = self.tcp_handler.encode(self, 'CMD_STATUS_REQ')
         self.socket.send(packet)
 
-    def status(self):
-        self.receive_names_of_channels()
-        self.receive_status_of_channels()
-        self.display.update_state(str(self))
-
-    def update_string(self, s, channel_id):
+    @timed('status')
+    def status(self, timeout=None):
         '''
-        NB channel bits 7...0 = channels 8...1
-        calculate new channel/input string where only channel_id is flipped!
-
-        @param s: str, either channel or input string
-        @param channel_id: int; which channel should be changed?
-        @return str; newly generated channel/input string.
+        Request the status. The firmware answers a CMD_STATUS_REQ with all
+        nine CMD_NAME frames in front of the 8-byte CMD_STATUS, so a poll
+        still receives 206 bytes. The names are known since connect(), so
+        those frames are only counted, not decoded.
+
+        @param timeout: seconds; None blocks until the CMD_STATUS arrives.
+        @return: ChannelState
+        @raise socket.timeout: if no CMD_STATUS arrived within timeout.
         '''
 
-        new_bit = ''
-        if s[-channel_id] == '0':
-            new_bit = '1'
-        elif s[-channel_id] == '1':
-            new_bit = '0'
-
-        return s[: -channel_id] + new_bit + s[len(s) - channel_id + 1: len(s)]
-
-    def string_of_change(self, channel_id):
-        ''' Return zero for all channels but channel_id '''
-        byte_string = '0' * (8 - channel_id) + '1' + '0' * (channel_id - 1)
-        return (pack('B', int(byte_string, 2)))
-
-    def on_off_toggle(self, cmd, channel_id):
+        if None not in self.names.values():
+            self.skip = ('CMD_NAME',)
+        try:
+            self.send_status_request()
+            self.receive_status_of_channels(timeout)
+        finally:
+            self.skip = ()
+        if self.display.verbose:
+            self.display.update_state(str(self))
+        return self.state
+
+    def on_off_toggle(self, cmd, channel_id, timeout=3.0):
         '''
         Expected by the server
         <STX><6><CMD_...><channels><CHECKSUM><ETX>
             channel bits 7...0 = channels 8...1 ; bit=0 no change ;
             bit=1 switch channel
         @param cmd: works both with the output status and the timer.
+        @param timeout: seconds to wait for the CMD_STATUS, if one is expected.
         '''
 
-        change = self.string_of_change(channel_id)
-        packet = self.tcp_handler.encode(self, cmd, change, channel_id)
+        self.set_channels(cmd, [channel_id], timeout)
+
+    @timed()
+    def set_channels(self, cmd, channel_ids, timeout=3.0):
+        '''
+        Send cmd for all channel_ids in a single packet. The protocol takes a
+        full channel mask, so e.g. switching channels 1-3 ON costs one CMD_ON
+        and one wait for CMD_STATUS instead of three.
+
+        @param cmd: works both with the output status and the timer.
+        @param channel_ids: iterable of int channel numbers (1-8).
+        @param timeout: seconds to wait for the CMD_STATUS, if one is expected.
+        '''
+
+        channel_ids = list(channel_ids)
+        mask = mask_of_channels(channel_ids)
+        if not mask:
+            return
+
+        self.send_switch(cmd, mask, pack('B', mask), channel_ids, timeout)
+
+    def send_switch(self, cmd, mask, data_x, channel_ids, timeout):
+        '''
+        Send one packet that switches the channels in mask, and wait for the
+        CMD_STATUS it causes.
+
+        @param data_x: data bytes of the packet; starts with the mask.
+        @param channel_ids: list of int channel numbers; for display only.
+        '''
+
+        packet = self.tcp_handler.encode(self, cmd, data_x, channel_ids)
         self.socket.send(packet)
 
         # If and only if the status has changed, a CMD_STATUS is send by the
-        # server. But this we do not know, so we set a timeout and wait...
-        self.socket.settimeout(3.0)
+        # server. Predict this from the last known status; only wait if the
+        # status is unknown or expected to change.
+        if self.state is not None:
+            if self.state.apply(cmd, mask) == self.state:
+                self.display.add_tcp_msg('No change expected -> not waiting')
+                return
+
         try:
             self.display.add_tcp_msg('Waiting for CMD_STATUS')
-            self.receive_status_of_channels()
-            # packet = self.socket.recv(8)
-        except timeout, e:
+            self.receive_status_of_channels(timeout)
+        except timeout_error, e:
             self.display.add_tcp_msg('Timeout -> channel unchanged')
         except Exception, e:
             self.display.add_tcp_msg('Error: unknown')
             raise e
-        # else:
-        #    self.display.add_tcp_msg(packet.split())
 
-    def pulse(self, channel_id):
+    def apply(self, on=(), off=(), toggle=(),
+              timer_on=(), timer_off=(), timer_toggle=(), timeout=3.0):
+        '''
+        Merge channel requests into the fewest packets: at most one packet
+        per command, in the order of the arguments.
+
+        @param on, off, toggle: iterables of output channel numbers (1-8).
+        @param timer_on, timer_off, timer_toggle: idem, for the timers.
+        @param timeout: seconds to wait for each expected CMD_STATUS.
+        '''
+
+        batches = [('CMD_ON', on), ('CMD_OFF', off), ('CMD_TOGGLE', toggle),
+                   ('CMD_TMR_ENA', timer_on), ('CMD_TMR_DIS', timer_off),
+                   ('CMD_TMR_TOGGLE', timer_toggle)]
+
+        for cmd, channel_ids in batches:
+            self.set_channels(cmd, channel_ids, timeout)
+
+    @timed('CMD_PULSE')
+    def pulse(self, channel_ids, time, unit='s', timeout=3.0):
         '''
         Expected by the server
         <STX><8><CMD_PULSE><channels><pulsetime><units><CHECKSUM><ETX>
@@ -345,46 +482,62 @@ class VM201RelayCard(object):
             bit=1 pulse channel
             pulse time: 1...99
             units: 's'= seconds; 'm' = minutes; 'h' = hours
+        The vm201 switches the channels ON now, and OFF after the pulse time;
+        both send a CMD_STATUS. Only the first one is waited for.
+
+        @param channel_ids: iterable of int channel numbers (1-8).
+        @raise PacketError: time or unit out of range.
         '''
 
-        return None
+        channel_ids = list(channel_ids)
+        mask = mask_of_channels(channel_ids)
+        if not mask:
+            return
+
+        data_x = pack('B', mask) + pulse_data(time, unit)
+        self.send_switch('CMD_PULSE', mask, data_x, channel_ids, timeout)
 
-    def timer_on_off_toggle(self, cmd, channel_id):
+    def timer_on_off_toggle(self, cmd, channel_id, timeout=3.0):
         '''
         Expected by the server
         <STX><6><CMD_TMR_ENA><channels><CHECKSUM><ETX>
             channel bits 7...0 = channels 8...1 ; bit=0 no change ;
             bit=1 switch channel ON
+        @param cmd: CMD_TMR_ENA, CMD_TMR_DIS or CMD_TMR_TOGGLE.
         '''
 
-        return None
+        self.set_channels(cmd, [channel_id], timeout)
 
-    def disconnect(self):
+    @timed('disconnect')
+    def disconnect(self, timeout=3.0, wait=True):
         '''
         Expected by the server
         <STX><5><CMD_CLOSED><CHECKSUM><ETX>
-        '''
 
-        packet = self.tcp_handler.encode(self, 'CMD_CLOSED')
-        self.socket.send(packet)
-
-        length = self.commands['LEN_CMD_CLOSED']
-        packet = self.socket.recv(length)
-        self.tcp_handler.decode(self, packet)
-
-        self.socket.close()
-        self.display.add_tcp_msg('Socket Closed.')
+        @param timeout: seconds to wait for the CMD_CLOSED of the vm201.
+        @param wait: False closes right after sending CMD_CLOSED; saves a
+                     round trip when nothing is expected anymore.
+        '''
 
-        exit()
+        if self.socket is None:
+            return
 
+        try:
+            packet = self.tcp_handler.encode(self, 'CMD_CLOSED')
+            self.socket.send(packet)
 
-# http://www.gossamer-threads.com/lists/python/python/134741
-def bin(i):
-    ''' Return str of binary byte representation of given int i'''
-    s = ''
-    while i:
-        s = (i & 1 and '1' or '0') + s
-        i >>= 1
-    while len(s) < 8:
-        s = '0' + s
-    return s or '0'
+            # Status updates may still be queued in front of the CMD_CLOSED.
+            if wait:
+                self.wait_for('CMD_CLOSED', timeout)
+        except error, e:
+            # Gone already, or too slow to say goodbye; close anyway.
+            self.display.add_tcp_msg('Error in disconnect: {0}'.format(e))
+        self.close()
+
+    def close(self):
+        ''' Close the socket without saying goodbye to the vm201 '''
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            self.reader = None
+            self.display.add_tcp_msg('Socket Closed.')
@@ -0,0 +1,282 @@
+'''
+VM201Scheduler class.
+
+Timed ON/OFF/TOGGLE/PULSE actions for many VM201 cards, kept in a single heap
+by one long-running process instead of a cron entry and a new process per
+switch. Scheduling an action is O(log n) and cancelling one is O(1). Tens of
+thousands of pending actions cost a tuple each.
+
+When actions come due they are grouped per card. Actions with the same
+command are merged into one mask packet, e.g. ON channel 1 and ON channel 3
+at 07:00 become a single CMD_ON for mask 0b101. All cards with due actions
+are then switched concurrently, each in one pipelined burst over its own
+VM201Session. The sessions stay logged in between the batches, and are kept
+alive by the scheduler, so a batch costs a round trip, not a TCP connect, a
+login and the channel names.
+
+    scheduler = VM201Scheduler()
+    card = scheduler.add_card('192.168.1.100', 9760, 'user', 'pass')
+    scheduler.on(time() + 60, card, [1, 3])
+    scheduler.pulse(time() + 3600, card, [2], 5, 's')
+    scheduler.serve_forever()
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import heapq
+from threading import Condition, Thread
+from time import time
+
+from ChannelState import IDEMPOTENT_COMMANDS, mask_of_channels
+from PacketCodec import pulse_data
+from VM201Fleet import CardResult, FleetCard
+from VM201RelayCard import VM201Error
+from VM201Session import VM201Session
+
+
+def touched_channels(cmd, mask):
+    ''' CMD_UPDATE sets all channels; its mask is the new output status '''
+    return 0xFF if cmd == 'CMD_UPDATE' else mask
+
+
+def merge(commands, cmd, mask, extra=''):
+    '''
+    Add one action to the packets for a card, merged into an earlier packet
+    with the same command if the result is the same as sending both.
+
+    @param commands: list of [cmd, mask, extra] lists; updated in place.
+    @param extra: data bytes after the mask; e.g. pulse time and unit.
+    '''
+
+    touched = touched_channels(cmd, mask)
+    for command in reversed(commands):
+        if command[0] == cmd and command[2] == extra and \
+                cmd != 'CMD_UPDATE' and \
+                (cmd in IDEMPOTENT_COMMANDS or not command[1] & mask):
+            command[1] |= mask
+            return
+        if touched_channels(command[0], command[1]) & touched:
+            # Moving the action in front of this packet changes the result.
+            break
+    commands.append([cmd, mask, extra])
+
+
+class VM201Scheduler(object):
+    def __init__(self, timeout=10.0, packet_log=None, metrics=None,
+                 keepalive=30.0):
+        '''
+        @param timeout: seconds per card per batch of due actions.
+        @param keepalive: seconds of silence after which a session is polled.
+        '''
+
+        self.timeout = timeout
+        self.packet_log = packet_log
+        self.metrics = metrics
+        self.keepalive_interval = keepalive
+
+        # FleetCard -> VM201Session; logged in at its first batch, then kept.
+        self.sessions = dict()
+
+        # Heap of (due, action id, card, cmd, mask, extra) tuples.
+        self.queue = list()
+        self.sequence = 0
+        self.cancelled = set()
+        self.condition = Condition()
+
+        # Called with the list of CardResult of every batch, if not None.
+        self.on_results = None
+
+        self.running = False
+        self.thread = None
+
+    def add_card(self, host, port=9760, username=None, password=None):
+        ''' @return: FleetCard to schedule actions for '''
+        card = FleetCard(host, port, username, password)
+        # One attempt per batch; a card that is down must not hold up the
+        # others. It is connected again at its next batch.
+        self.sessions[card] = VM201Session(
+            host, port, username, password, timeout=self.timeout,
+            keepalive=self.keepalive_interval, attempts=1,
+            packet_log=self.packet_log, metrics=self.metrics)
+        return card
+
+    def schedule(self, due, card, cmd, channel_ids, extra=''):
+        '''
+        @param due: float; unix time at which to send cmd.
+        @param card: FleetCard, as returned by add_card.
+        @param cmd: CMD_FULL_NAME; one that takes a channel mask.
+        @param channel_ids: iterable of int channel numbers (1-8).
+        @param extra: data bytes after the mask; e.g. pulse time and unit.
+        @return: int action id, for cancel.
+        '''
+
+        mask = mask_of_channels(channel_ids)
+        with self.condition:
+            self.sequence += 1
+            heapq.heappush(self.queue,
+                           (due, self.sequence, card, cmd, mask, extra))
+            if self.queue[0][1] == self.sequence:
+                # New first action; serve_forever may sleep too long.
+                self.condition.notify()
+            return self.sequence
+
+    def on(self, due, card, channel_ids):
+        return self.schedule(due, card, 'CMD_ON', channel_ids)
+
+    def off(self, due, card, channel_ids):
+        return self.schedule(due, card, 'CMD_OFF', channel_ids)
+
+    def toggle(self, due, card, channel_ids):
+        return self.schedule(due, card, 'CMD_TOGGLE', channel_ids)
+
+    def pulse(self, due, card, channel_ids, time, unit='s'):
+        '''
+        @param time: int; pulse time 1...99.
+        @param unit: 's'= seconds; 'm' = minutes; 'h' = hours
+        @raise PacketError: time or unit out of range.
+        '''
+
+        return self.schedule(due, card, 'CMD_PULSE', channel_ids,
+                             pulse_data(time, unit))
+
+    def cancel(self, action_id):
+        ''' The action is dropped when it comes due '''
+        with self.condition:
+            self.cancelled.add(action_id)
+
+    def next_due(self):
+        ''' @return: float unix time of the first action; None if idle '''
+        with self.condition:
+            return self.queue[0][0] if self.queue else None
+
+    def take_due(self, now=None):
+        '''
+        Remove all actions that are due, merged per card.
+
+        @return: list of (FleetCard, commands) tuples, as for run_cards.
+        '''
+
+        if now is None:
+            now = time()
+
+        jobs = dict()
+        cards = list()
+        with self.condition:
+            while self.queue and self.queue[0][0] <= now:
+                due, action_id, card, cmd, mask, extra = \
+                    heapq.heappop(self.queue)
+                if action_id in self.cancelled:
+                    self.cancelled.discard(action_id)
+                    continue
+                if card not in jobs:
+                    jobs[card] = list()
+                    cards.append(card)
+                merge(jobs[card], cmd, mask, extra)
+
+        return [(card, [tuple(command) for command in jobs[card]])
+                for card in cards]
+
+    def send(self, card, commands):
+        '''
+        Send the commands for one card in one pipelined burst.
+
+        @param commands: list of (cmd, mask, extra) tuples, as from take_due.
+        @return: CardResult.
+        '''
+
+        session = self.sessions[card]
+        result = CardResult(card)
+        started = time()
+
+        def switch(relay_card):
+            pipeline = relay_card.pipeline()
+            for cmd, mask, extra in commands:
+                pipeline.switch(cmd, mask, extra)
+            pipeline.execute(self.timeout)
+
+        try:
+            # A retry after a lost connection must not toggle twice.
+            session.call(switch, all(command[0] in IDEMPOTENT_COMMANDS
+                                     for command in commands))
+        except VM201Error, e:
+            result.error = str(e)
+        else:
+            result.ok = True
+            result.state = session.state
+        result.elapsed = time() - started
+        return result
+
+    def run_due(self, now=None):
+        '''
+        Send all due actions; the cards concurrently, a thread per card.
+
+        @return: list of CardResult, in the order of the cards in the batch;
+                 empty if nothing was due.
+        '''
+
+        jobs = self.take_due(now)
+        if not jobs:
+            return list()
+
+        results = [None] * len(jobs)
+
+        def send(i):
+            results[i] = self.send(*jobs[i])
+        threads = [Thread(target=send, args=(i,))
+                   for i in range(1, len(jobs))]
+        for thread in threads:
+            thread.start()
+        send(0)
+        for thread in threads:
+            thread.join()
+
+        if self.on_results is not None:
+            self.on_results(results)
+        return results
+
+    def keepalive(self):
+        ''' Poll the connected sessions that were idle for a while '''
+        for session in self.sessions.values():
+            if not session.is_connected():
+                continue
+            try:
+                session.keepalive()
+            except VM201Error, e:
+                # The next batch of the card connects again.
+                session.display.add_tcp_msg('Keepalive failed: {0}'
+                                            .format(e))
+
+    def serve_forever(self):
+        self.running = True
+        while self.running:
+            with self.condition:
+                # Wake up at least every second for the keepalives.
+                wait = min(self.keepalive_interval, 1.0)
+                if self.queue:
+                    wait = min(wait, self.queue[0][0] - time())
+                if wait > 0:
+                    self.condition.wait(wait)
+            self.run_due()
+            self.keepalive()
+
+    def start(self):
+        ''' Serve from a background thread '''
+        self.thread = Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        ''' Stop, and say goodbye to the cards '''
+        self.stop()
+        for session in self.sessions.values():
+            session.close()
@@ -0,0 +1,229 @@
+'''
+VM201Session class.
+
+Long-lived session with one VM201 card. The socket stays open between
+commands, so a command on a warm session costs a packet instead of a DNS
+lookup, TCP setup and the USERNAME/PASSWORD login handshake. When the card
+goes away the session reconnects and logs in again, with jittered exponential
+backoff between the attempts. Periodic CMD_STATUS_REQ keepalives find a dead
+connection before the next command does, and keep NAT and firewall state
+alive.
+
+    session = VM201Session('192.168.1.100', 9760, 'user', 'pass').start()
+    session.set_channels('CMD_ON', [1, 2, 3])
+    print session.status()
+    session.close()
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import random
+from select import select, error as select_error
+from socket import error
+from threading import Event, RLock, Thread
+from time import time
+
+from ChannelState import IDEMPOTENT_COMMANDS
+from VM201RelayCard import LoginError, VM201Error, VM201RelayCard
+
+
+class VM201Session(object):
+    def __init__(self, host, port=9760, username=None, password=None,
+                 verbose=False, timeout=3.0, keepalive=30.0, backoff=0.5,
+                 max_backoff=60.0, attempts=None, name_cache=None,
+                 packet_log=None, metrics=None, capture=None):
+        '''
+        @param timeout: seconds to wait for each answer of the vm201.
+        @param keepalive: seconds of silence after which a CMD_STATUS_REQ is
+                          sent by the background thread; see start().
+        @param backoff, max_backoff: first and largest delay in seconds
+                                     between two connection attempts.
+        @param attempts: connection attempts per command; None is forever.
+        '''
+
+        self.card = VM201RelayCard(host, port, username, password, verbose,
+                                   name_cache, packet_log, metrics, capture)
+        self.timeout = timeout
+        self.keepalive_interval = keepalive
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.attempts = attempts
+
+        # One command at a time on the socket; the keepalive thread included.
+        self.lock = RLock()
+        self.last_used = 0.0
+        self.reconnects = 0
+
+        self.stopped = Event()
+        self.thread = None
+
+    @property
+    def display(self):
+        return self.card.display
+
+    @property
+    def state(self):
+        ''' ChannelState of the last CMD_STATUS; None before the first one '''
+        return self.card.state
+
+    def is_connected(self):
+        return self.card.socket is not None
+
+    def connect(self):
+        '''
+        Connect and login; retry with jittered exponential backoff.
+
+        @raise LoginError: at once; retrying will not fix the credentials.
+        @raise VM201Error: after self.attempts failed attempts, or close().
+        '''
+
+        with self.lock:
+            delay = self.backoff
+            attempt = 0
+            while not self.is_connected():
+                attempt += 1
+                try:
+                    self.card.connect(self.timeout)
+                except LoginError:
+                    raise
+                except VM201Error:
+                    if self.attempts is not None and \
+                            attempt >= self.attempts:
+                        raise
+
+                    # Sleep between delay/2 and delay, so a fleet of
+                    # sessions that lost a card at once do not retry in step.
+                    wait = delay / 2 + random.uniform(0, delay / 2)
+                    self.display.add_tcp_msg('Reconnecting in {0:.1f}s'
+                                             .format(wait))
+                    if self.stopped.wait(wait):
+                        raise VM201Error('Session closed.')
+                    delay = min(2 * delay, self.max_backoff)
+            self.last_used = time()
+
+    def call(self, function, retry=True):
+        '''
+        Run function(card) on a connected card. If the connection turns out to
+        be broken, reconnect, and run it once more if retry.
+
+        @param retry: False for commands that must not be sent twice.
+        @return: whatever function returns.
+        @raise VM201Error: the session could not be (re)established.
+        '''
+
+        with self.lock:
+            self.connect()
+            try:
+                # Dead connections show up here, before anything is sent.
+                self.card.drain()
+                result = function(self.card)
+            except error, e:
+                self.card.close()
+                self.reconnects += 1
+                if self.card.metrics is not None:
+                    self.card.metrics.increment('vm201_reconnects_total',
+                                                self.card.labels)
+                if not retry:
+                    raise VM201Error('Connection lost: {0}'.format(e))
+
+                self.display.add_tcp_msg('Connection lost: {0}'.format(e))
+                self.connect()
+                try:
+                    result = function(self.card)
+                except error, e:
+                    self.card.close()
+                    raise VM201Error('Connection lost: {0}'.format(e))
+
+            self.last_used = time()
+            return result
+
+    def status(self):
+        ''' @return: ChannelState '''
+        return self.call(lambda card: card.status(self.timeout))
+
+    def set_channels(self, cmd, channel_ids):
+        channel_ids = list(channel_ids)
+        self.call(lambda card: card.set_channels(cmd, channel_ids,
+                                                 self.timeout),
+                  cmd in IDEMPOTENT_COMMANDS)
+
+    def on_off_toggle(self, cmd, channel_id):
+        self.set_channels(cmd, [channel_id])
+
+    def pulse(self, channel_ids, time, unit='s'):
+        channel_ids = list(channel_ids)
+        self.call(lambda card: card.pulse(channel_ids, time, unit,
+                                          self.timeout))
+
+    def keepalive(self):
+        ''' Send a CMD_STATUS_REQ if the session was idle for a while '''
+        with self.lock:
+            if time() - self.last_used >= self.keepalive_interval:
+                self.status()
+
+    def watch(self, stopped, wait, quiet, tick=None, label='Session'):
+        '''
+        Pick up what the vm201 sends unasked (input changes, ends of pulses)
+        as soon as it arrives, until stopped is set; reconnect when the
+        connection is lost. For a thread that owns the session between the
+        commands of other threads.
+
+        @param stopped: Event that ends the loop.
+        @param wait: function() -> seconds to wait for the socket at most.
+        @param quiet: function() called when nothing arrived in that time.
+        @param tick: function() called after every wait; or None.
+        @param label: str in front of the errors on the display.
+        '''
+
+        while not stopped.is_set():
+            try:
+                sock = self.card.socket
+                if sock is None:
+                    self.connect()
+                    continue
+
+                if select([sock], [], [], max(wait(), 0.0))[0]:
+                    # call() drains the socket before it runs the function.
+                    self.call(lambda card: None)
+                else:
+                    quiet()
+                if tick is not None:
+                    tick()
+            except (error, select_error, ValueError):
+                # The socket was closed by a command thread; pick up the new.
+                continue
+            except LoginError, e:
+                # Retrying at once will not fix the credentials.
+                self.display.add_tcp_msg('{0}: {1}'.format(label, e))
+                stopped.wait(self.max_backoff)
+            except VM201Error, e:
+                self.display.add_tcp_msg('{0}: {1}'.format(label, e))
+
+    def run(self):
+        while not self.stopped.wait(min(self.keepalive_interval, 1.0)):
+            try:
+                self.keepalive()
+            except VM201Error, e:
+                # Try again at the next keepalive; commands reconnect anyway.
+                self.display.add_tcp_msg('Keepalive failed: {0}'.format(e))
+
+    def start(self):
+        ''' Connect, and send keepalives from a background thread '''
+        self.connect()
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def close(self):
+        ''' Stop the keepalives, and say goodbye to the vm201 '''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            self.card.disconnect(self.timeout)
@@ -0,0 +1,562 @@
+'''
+VM201ShardedFleet class.
+
+VM201Fleet for installations too large for one process. One event loop
+spends its time on encode, decode and bookkeeping in Python, so it is bound
+to one core; the sharded fleet spreads the cards over a pool of worker
+processes, each with an event loop for its own share of the cards.
+
+A card belongs to shard crc32('host:port') % shards, so it always ends up in
+the same worker, also across restarts. Every worker keeps a logged-in
+session open to each of its cards: a command costs its packets and the
+CMD_STATUS it causes, not a TCP connect, a login and the channel names. A
+lost connection is set up again, with jittered exponential backoff.
+
+Commands are routed to the owning worker over its own multiprocessing
+queue, as compact tuples, and every worker answers over its own pipe: a
+worker that is killed halfway a write cannot block the others. Workers
+write the state of every card into shared memory as it arrives, also the
+CMD_STATUS the vm201 sends by itself: one int per card with the CMD_STATUS
+bits, and the time it was read. Reading the state of the whole fleet costs
+no IPC at all.
+
+Idle sessions are polled with a CMD_STATUS_REQ every poll seconds (every
+KEEPALIVE seconds without poll), which keeps the shared state fresh and
+finds dead connections. A worker process that dies is started again.
+
+    fleet = VM201ShardedFleet(shards=4, poll=1.0)
+    for host in hosts:
+        fleet.add_card(host, 9760, 'user', 'pass')
+    fleet.start()
+    fleet.on_off_toggle('CMD_ON', [1, 2])
+    print fleet.state(0)
+    fleet.stop()
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import asyncore
+import multiprocessing
+import random
+from itertools import count
+from Queue import Empty, Queue
+from select import select
+from socket import socketpair
+from threading import Lock, Thread
+from time import time
+from zlib import crc32
+
+from ChannelState import ChannelState, mask_of_channels
+from VM201Fleet import CardConnection, CardResult, FleetCard
+
+
+# Bit of the shared state int that says a CMD_STATUS was read; below it are
+# the output, timer and input bits, as in ChannelState.__hash__.
+VALID = 1 << 24
+
+# Seconds between two status requests on an idle session, without poll.
+KEEPALIVE = 30.0
+
+# First and largest delay in seconds between two connection attempts.
+BACKOFF = 0.5
+MAX_BACKOFF = 60.0
+
+# Seconds between two checks of the timeouts, reconnects and polls.
+TICK = 0.05
+
+
+def shard_of(host, port, shards):
+    ''' Shard of a card; the same in every process and every run '''
+    return (crc32('{0}:{1}'.format(host, port)) & 0xFFFFFFFF) % shards
+
+
+class WorkerJob(object):
+    ''' The cards of one job in one worker; reported when all are done '''
+
+    __slots__ = ('job_id', 'waiting', 'report')
+
+    def __init__(self, job_id, waiting):
+        self.job_id = job_id
+        self.waiting = waiting
+        self.report = list()
+
+
+class ShardCard(object):
+    ''' A card of a worker: its session, if any, and the jobs for it '''
+
+    __slots__ = ('index', 'card', 'connection', 'jobs', 'retry_at',
+                 'backoff')
+
+    def __init__(self, index, card):
+        self.index = index
+        self.card = card
+        self.connection = None
+        # (WorkerJob, commands, deadline) tuples, in arrival order.
+        self.jobs = list()
+        self.retry_at = 0.0
+        self.backoff = BACKOFF
+
+
+class SessionConnection(CardConnection):
+    '''
+    A CardConnection that stays open. Where a CardConnection would close the
+    session, it waits for the next job instead. States as CardConnection,
+    except 'CLOSING', and:
+        'IDLE'      logged in; nothing outstanding
+        'POLLING'   CMD_STATUS_REQ sent; waiting for the CMD_STATUS
+    '''
+
+    def __init__(self, worker, shard_card, deadline):
+        self.worker = worker
+        self.shard_card = shard_card
+        shard_card.connection = self
+
+        self.job = None
+        self.logged_in = False
+        self.last_status = time()
+        CardConnection.__init__(self, worker.map, shard_card.card, [],
+                                deadline)
+
+    def start_job(self, job, commands, deadline):
+        '''
+        @param commands: as in VM201Fleet.run; None asks for the status.
+        '''
+
+        self.job = job
+        self.deadline = deadline
+        self.started = time()
+        self.result.error = None
+        if commands is None:
+            self.poll(deadline)
+        else:
+            self.todo = commands
+            self.send_commands()
+
+    def poll(self, deadline):
+        self.deadline = deadline
+        self.result.error = None
+        self.state = 'POLLING'
+        self.send_packet('CMD_STATUS_REQ')
+
+    def handle_message(self, message):
+        if message.cmd == 'CMD_STATUS':
+            # Every status, also the ones the vm201 sends by itself.
+            self.last_status = time()
+            self.worker.store(self.shard_card.index,
+                              ChannelState.from_status(message))
+
+        polling = self.state == 'POLLING'
+        CardConnection.handle_message(self, message)
+        if message.cmd == 'CMD_STATUS' and polling:
+            self.start_closing()
+
+    def start_closing(self):
+        ''' The job is done; keep the session for the next one '''
+        self.state = 'IDLE'
+        self.logged_in = True
+        if self.job is not None:
+            job, self.job = self.job, None
+            self.worker.report(job, self.shard_card.index, True, None,
+                               time() - self.started)
+        self.worker.ready(self)
+
+    def finish(self):
+        ''' The connection failed, or was lost '''
+        self.state = 'DONE'
+        if self.socket is not None:
+            self.close()
+        if self.job is not None:
+            job, self.job = self.job, None
+            self.worker.report(job, self.shard_card.index, False,
+                               self.result.error, time() - self.started)
+        self.worker.lost(self)
+
+    def say_goodbye(self):
+        ''' Send CMD_CLOSED without waiting for the answer, and close '''
+        if self.socket is not None and self.logged_in:
+            self.send_packet('CMD_CLOSED')
+            try:
+                self.handle_write()
+            except Exception:
+                pass
+        self.state = 'DONE'
+        if self.socket is not None:
+            self.close()
+
+
+class JobWaker(asyncore.dispatcher):
+    ''' Wakes up the event loop of a worker when a job arrives '''
+
+    def __init__(self, worker, sock):
+        asyncore.dispatcher.__init__(self, sock, map=worker.map)
+        self.worker = worker
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+        self.worker.take_jobs()
+
+
+class ShardWorker(object):
+    ''' Event loop of a worker process, with a session per card '''
+
+    def __init__(self, cards, results, states, stamps, timeout, poll):
+        '''
+        @param cards: list of (index, host, port, username, password) tuples.
+        @param results: multiprocessing Connection to the parent, for
+                        (job id, [(index, ok, error, elapsed)]) tuples.
+        @param states, stamps: shared arrays; written for the cards of this
+                               worker only.
+        @param timeout: seconds for a login, a poll, or a job.
+        @param poll: seconds between two status polls of an idle session.
+        '''
+
+        self.map = dict()
+        self.cards = [ShardCard(index, FleetCard(host, port, username,
+                                                 password))
+                      for index, host, port, username, password in cards]
+        self.results = results
+        self.states = states
+        self.stamps = stamps
+        self.timeout = timeout
+        self.interval = poll if poll is not None else KEEPALIVE
+
+        self.by_index = dict((card.index, card) for card in self.cards)
+        self.inbox = Queue()
+        self.stopped = False
+
+    def store(self, index, state):
+        self.states[index] = hash(state) | VALID
+        self.stamps[index] = time()
+
+    def report(self, job, index, ok, error, elapsed):
+        job.report.append((index, ok, error, elapsed))
+        job.waiting -= 1
+        if not job.waiting and job.job_id is not None:
+            self.results.send((job.job_id, job.report))
+
+    def connect(self, shard_card):
+        SessionConnection(self, shard_card, time() + self.timeout)
+
+    def ready(self, connection):
+        ''' The session is idle; start the next job for the card '''
+        shard_card = connection.shard_card
+        shard_card.backoff = BACKOFF
+        if shard_card.jobs and connection.state == 'IDLE':
+            job, commands, deadline = shard_card.jobs.pop(0)
+            connection.start_job(job, commands, deadline)
+
+    def lost(self, connection):
+        shard_card = connection.shard_card
+        if shard_card.connection is not connection:
+            return
+        shard_card.connection = None
+
+        if connection.logged_in:
+            # The card was there a moment ago; try again at once.
+            shard_card.retry_at = time()
+            return
+
+        # The card cannot be reached now; the waiting jobs get the error.
+        jobs, shard_card.jobs = shard_card.jobs, list()
+        for job, commands, deadline in jobs:
+            self.report(job, shard_card.index, False,
+                        connection.result.error, None)
+        # Between backoff/2 and backoff, so cards do not retry in step.
+        delay = shard_card.backoff
+        shard_card.retry_at = time() + delay / 2 + \
+            random.uniform(0, delay / 2)
+        shard_card.backoff = min(2 * delay, MAX_BACKOFF)
+
+    def take_jobs(self):
+        ''' Hand the jobs that arrived to the sessions of their cards '''
+        while True:
+            try:
+                job = self.inbox.get_nowait()
+            except Empty:
+                return
+            if job is None:
+                self.stopped = True
+                return
+
+            job_id, jobs, job_timeout = job
+            deadline = time() + job_timeout
+            worker_job = WorkerJob(job_id, len(jobs))
+            for index, commands in jobs:
+                shard_card = self.by_index[index]
+                shard_card.jobs.append((worker_job, commands, deadline))
+                connection = shard_card.connection
+                if connection is None:
+                    self.connect(shard_card)
+                elif connection.state == 'IDLE':
+                    self.ready(connection)
+
+    def tick(self, now):
+        ''' Timeouts, reconnects and polls '''
+        for shard_card in self.cards:
+            if shard_card.jobs:
+                expired = [entry for entry in shard_card.jobs
+                           if entry[2] < now]
+                if expired:
+                    shard_card.jobs = [entry for entry in shard_card.jobs
+                                       if entry[2] >= now]
+                for job, commands, deadline in expired:
+                    self.report(job, shard_card.index, False,
+                                'Timeout waiting for the card', None)
+
+            connection = shard_card.connection
+            if connection is None:
+                if shard_card.jobs or now >= shard_card.retry_at:
+                    self.connect(shard_card)
+            elif connection.state == 'IDLE':
+                if now >= connection.last_status + self.interval:
+                    connection.poll(now + self.timeout)
+            elif connection.state != 'DONE' and now > connection.deadline:
+                connection.fail('Timeout after {0}s in state {1}'.format(
+                    self.timeout, connection.state))
+
+    def receive(self, commands, waker):
+        ''' Thread: move the jobs from the parent into the inbox '''
+        while True:
+            job = commands.get()
+            self.inbox.put(job)
+            waker.send('x')
+            if job is None:
+                return
+
+    def run(self, commands):
+        '''
+        @param commands: multiprocessing.Queue of (job id, [(index,
+                         commands)], timeout) tuples; None stops the worker.
+        '''
+
+        waker, wakee = socketpair()
+        JobWaker(self, wakee)
+        thread = Thread(target=self.receive, args=(commands, waker))
+        thread.daemon = True
+        thread.start()
+
+        for shard_card in self.cards:
+            self.connect(shard_card)
+
+        next_tick = 0.0
+        try:
+            while not self.stopped:
+                now = time()
+                if now >= next_tick:
+                    self.tick(now)
+                    next_tick = now + TICK
+                asyncore.loop(timeout=TICK, map=self.map, use_poll=True,
+                              count=1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for shard_card in self.cards:
+                if shard_card.connection is not None:
+                    shard_card.connection.say_goodbye()
+            asyncore.close_all(self.map)
+
+
+def worker(cards, commands, results, states, stamps, timeout, poll):
+    ''' Main function of a worker process; see ShardWorker '''
+    ShardWorker(cards, results, states, stamps, timeout, poll).run(commands)
+
+
+class VM201ShardedFleet(object):
+    def __init__(self, shards=None, timeout=10.0, poll=None):
+        '''
+        @param shards: number of worker processes; one per core if None.
+        @param timeout: seconds for a login, a poll or the commands of a job.
+        @param poll: seconds between the status polls of an idle session;
+                     None polls every KEEPALIVE seconds only.
+        '''
+
+        self.shards = shards or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.poll = poll
+        self.cards = list()
+
+        self.states = None
+        self.stamps = None
+        self.queues = list()
+        self.results = list()
+        self.processes = list()
+        self.restarts = 0
+
+        # One job at a time, so every result is for the job that waits.
+        self.lock = Lock()
+        self.job_ids = count(1)
+
+    def add_card(self, host, port=9760, username=None, password=None):
+        ''' Add a card; before start() @return: FleetCard '''
+        if self.processes:
+            raise RuntimeError('Cards cannot be added to a started fleet.')
+        card = FleetCard(host, port, username, password)
+        card.index = len(self.cards)
+        card.shard = shard_of(card.host, card.port, self.shards)
+        self.cards.append(card)
+        return card
+
+    def start(self):
+        ''' Start the worker processes; each gets the cards of its shard '''
+        self.states = multiprocessing.Array('i', len(self.cards), lock=False)
+        self.stamps = multiprocessing.Array('d', len(self.cards), lock=False)
+
+        self.queues = [None] * self.shards
+        self.results = [None] * self.shards
+        self.processes = [None] * self.shards
+        for shard in range(self.shards):
+            self.start_worker(shard)
+        return self
+
+    def start_worker(self, shard):
+        cards = [(card.index, card.host, card.port, card.username,
+                  card.password)
+                 for card in self.cards if card.shard == shard]
+        # Before the worker starts: a state read by a worker that died is
+        # not current, and state() should not say it is.
+        for card in cards:
+            self.states[card[0]] = 0
+        queue = multiprocessing.Queue()
+        results, worker_end = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=worker, args=(cards, queue, worker_end, self.states,
+                                 self.stamps, self.timeout, self.poll))
+        process.daemon = True
+        process.start()
+        worker_end.close()
+        if self.results[shard] is not None:
+            self.results[shard].close()
+        self.queues[shard] = queue
+        self.results[shard] = results
+        self.processes[shard] = process
+
+    def restart_dead_workers(self, shards=None):
+        ''' @return: list of the shards whose worker was started again '''
+        if shards is None:
+            shards = range(self.shards)
+        dead = [shard for shard in shards
+                if not self.processes[shard].is_alive()]
+        for shard in dead:
+            self.processes[shard].join()
+            self.start_worker(shard)
+            self.restarts += 1
+        return dead
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+        for results in self.results:
+            results.close()
+        self.queues = list()
+        self.results = list()
+        self.processes = list()
+
+    def state(self, index):
+        '''
+        The state of a card as last read by its worker.
+
+        @return: tuple (ChannelState, unix time it was read); (None, None)
+                 if never read.
+        '''
+
+        bits = self.states[index]
+        if not bits & VALID:
+            return None, None
+        state = ChannelState(bits & 0xFF, bits >> 8 & 0xFF, bits >> 16 & 0xFF)
+        return state, self.stamps[index]
+
+    def run(self, commands, timeout=None):
+        '''
+        Send commands to all cards; as VM201Fleet.run.
+
+        @return: list of CardResult, in the order the cards were added.
+        '''
+
+        return self.run_cards([(card, commands) for card in self.cards],
+                              timeout)
+
+    def run_cards(self, jobs, timeout=None):
+        '''
+        As VM201Fleet.run_cards; every job goes to the worker of its card.
+        Commands are lists of tuples; functions cannot be sent to a worker.
+
+        @param jobs: list of (FleetCard, commands) tuples; commands None asks
+                     the card for its status.
+        @return: list of CardResult, in the order of jobs.
+        '''
+
+        if timeout is None:
+            timeout = self.timeout
+
+        per_shard = dict()
+        for card, commands in jobs:
+            if commands is not None:
+                commands = [tuple(command) for command in commands]
+            per_shard.setdefault(card.shard, list()).append(
+                (card.index, commands))
+
+        reports = dict()
+        with self.lock:
+            self.restart_dead_workers(list(per_shard))
+            died = list()
+            job_id = next(self.job_ids)
+            for shard, shard_jobs in per_shard.items():
+                self.queues[shard].put((job_id, shard_jobs, timeout))
+
+            # Workers time their jobs out themselves; this is a last resort.
+            deadline = time() + timeout + 1.0
+            waiting = set(per_shard)
+            while waiting:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                shards = dict((self.results[shard], shard)
+                              for shard in waiting)
+                ready = select(list(shards), [], [], min(remaining, 0.5))[0]
+                for results in ready:
+                    try:
+                        result_id, report = results.recv()
+                    except EOFError:
+                        # The worker is gone; restarted below.
+                        self.processes[shards[results]].join()
+                        continue
+                    if result_id != job_id:
+                        # Left behind by an earlier job that timed out.
+                        continue
+                    waiting.discard(shards[results])
+                    for index, ok, error, elapsed in report:
+                        reports[index] = (ok, error, elapsed)
+                # A dead worker does not answer; do not wait for it.
+                dead = self.restart_dead_workers(list(waiting))
+                waiting.difference_update(dead)
+                died.extend(dead)
+
+        results = list()
+        for card, commands in jobs:
+            result = CardResult(card)
+            error = 'Worker died' if card.shard in died else \
+                'Worker did not answer'
+            result.ok, result.error, result.elapsed = \
+                reports.get(card.index, (False, error, None))
+            if result.ok:
+                result.state = self.state(card.index)[0]
+            results.append(result)
+        return results
+
+    def on_off_toggle(self, cmd, channel_ids, timeout=None):
+        ''' Send one cmd for the given channels to every card in the fleet '''
+        return self.run([(cmd, mask_of_channels(channel_ids))], timeout)
+
+    def status(self, timeout=None):
+        ''' Ask every card for its status; nothing is switched '''
+        return self.run_cards([(card, None) for card in self.cards], timeout)
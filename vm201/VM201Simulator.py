@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+'''
+VM201Simulator class.
+
+Pure-Python emulator of the VM201 firmware, to exercise VM201RelayCard and
+VM201Fleet without a real card on the network. It speaks the protocol as
+documented in VM201_protocol.txt: login with CMD_AUTH/CMD_USERNAME/
+CMD_PASSWORD, CMD_NAME, CMD_STATUS, CMD_STATUS_REQ, CMD_ON/OFF/TOGGLE/UPDATE,
+CMD_TMR_*, CMD_PULSE and CMD_CLOSED; every status change is pushed to all
+clients of the card.
+
+Each virtual card listens on its own local port, or many cards share one
+port and the card is selected by the username of the login. Knobs:
+    latency, jitter: seconds of delay added to every response.
+    fragment: max number of bytes per send; splits packets over TCP segments.
+    garbage_names: add random chars to CMD_NAME, like the real firmware.
+    names_on_request: answer CMD_STATUS_REQ with the names and the status,
+                      as the firmware does; on by default.
+
+NB this code base is Python 2, hence the event loop is asyncore.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import asyncore
+import heapq
+import random
+from socket import AF_INET, SOCK_STREAM, IPPROTO_TCP, TCP_NODELAY
+from sys import exc_info
+from threading import Thread
+from time import time
+
+from FrameReader import FrameReader
+import PacketCodec
+
+
+class VirtualCard(object):
+    def __init__(self, username=None, password=None, names=None):
+        self.username = username
+        self.password = password
+        self.port = None
+
+        # 8 output channels, then 1 input channel.
+        if names is None:
+            names = ['Output' + letter for letter in 'ABCDEFGH'] + ['Input']
+        self.names = list(names)
+
+        self.output = 0
+        self.timer = 0
+        self.input = 0
+
+        # Logged in connections; they receive every status update.
+        self.clients = list()
+
+    def __str__(self):
+        return 'port={0}, username={1}, output={2:08b}, timer={3:08b}, ' \
+            'input={4}'.format(self.port, self.username, self.output,
+                               self.timer, self.input)
+
+    def status_packet(self):
+        return PacketCodec.build('CMD_STATUS', chr(self.output) +
+                                 chr(self.timer) + chr(self.input))
+
+    def name_packets(self, garbage=False):
+        packets = list()
+        for channel, name in enumerate(self.names, 1):
+            name = name[:16]
+            if garbage:
+                # Seemingly random chars, as added by the VM201 firmware.
+                noise = ''.join(chr(random.choice(range(0x21, 0x41) +
+                                                  range(0x7b, 0x100)))
+                                for i in range(random.randint(1, 3)))
+                name = (name + noise)[:16]
+            name += (16 - len(name)) * '\x00'
+            packets.append(PacketCodec.build('CMD_NAME', chr(channel) + name))
+        return ''.join(packets)
+
+    def execute(self, message):
+        '''
+        Apply a switch or timer command to the card.
+
+        @param message: PacketCodec.Switch
+        @return: bool; True if the status changed.
+        '''
+
+        before = (self.output, self.timer)
+        mask = message.channels
+        cmd = message.cmd
+
+        if cmd == 'CMD_ON':
+            self.output |= mask
+        elif cmd == 'CMD_OFF':
+            self.output &= ~mask & 0xFF
+        elif cmd == 'CMD_TOGGLE':
+            self.output ^= mask
+        elif cmd == 'CMD_UPDATE':
+            self.output = mask
+        elif cmd == 'CMD_TMR_ENA':
+            self.timer |= mask
+        elif cmd == 'CMD_TMR_DIS':
+            self.timer &= ~mask & 0xFF
+        elif cmd == 'CMD_TMR_TOGGLE':
+            self.timer ^= mask
+
+        return (self.output, self.timer) != before
+
+    def push_status(self):
+        packet = self.status_packet()
+        for client in self.clients:
+            client.respond(packet)
+
+
+class SimulatorConnection(asyncore.dispatcher):
+    def __init__(self, simulator, sock, listener):
+        asyncore.dispatcher.__init__(self, sock, map=simulator.map)
+        self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+        self.simulator = simulator
+        self.listener = listener
+        self.reader = FrameReader(self.socket)
+
+        # The shared port selects the card at login.
+        self.card = listener.card
+        self.username = None
+        self.logged_in = False
+        self.closing = False
+
+        # Responses as (due time, bytes); sent in order once due.
+        self.queue = list()
+        self.last_due = 0.0
+
+        if self.card is not None and self.card.username is None:
+            self.login()
+        else:
+            self.respond(PacketCodec.FRAMES['CMD_AUTH'])
+
+    def respond(self, data):
+        sim = self.simulator
+        due = time()
+        if sim.latency or sim.jitter:
+            due += sim.latency + random.uniform(0, sim.jitter)
+            sim.wake_at(due)
+        # Latency may vary, the order of the bytes may not.
+        due = max(due, self.last_due)
+        self.last_due = due
+        self.queue.append((due, data))
+
+    def login(self):
+        self.logged_in = True
+        self.card.clients.append(self)
+        self.respond(PacketCodec.FRAMES['CMD_LOGGED_IN'])
+        self.respond(self.card.name_packets(self.simulator.garbage_names))
+        self.respond(self.card.status_packet())
+
+    def deny(self):
+        self.respond(PacketCodec.FRAMES['CMD_ACCESS_DENIED'])
+        self.respond(PacketCodec.FRAMES['CMD_CLOSED'])
+        self.closing = True
+
+    def authenticate(self, password):
+        card = self.card
+        if card is None:
+            card = self.listener.cards.get(self.username)
+        if card is not None and card.username == self.username and \
+                card.password == password:
+            self.card = card
+            self.login()
+        else:
+            self.deny()
+
+    def handle_message(self, message):
+        cmd = message.cmd
+
+        if not self.logged_in:
+            if cmd == 'CMD_USERNAME':
+                self.username = message.text.rstrip('\x00')
+            elif cmd == 'CMD_PASSWORD':
+                self.authenticate(message.text.rstrip('\x00'))
+            return
+
+        if cmd == 'CMD_STATUS_REQ':
+            if self.simulator.names_on_request:
+                self.respond(self.card.name_packets(
+                    self.simulator.garbage_names))
+            self.respond(self.card.status_packet())
+        elif cmd == 'CMD_CLOSED':
+            self.respond(PacketCodec.FRAMES['CMD_CLOSED'])
+            self.closing = True
+        elif cmd == 'CMD_PULSE':
+            self.simulator.pulse(self.card, message)
+        elif cmd in PacketCodec.MASK_COMMANDS:
+            if self.card.execute(message):
+                self.card.push_status()
+
+    def readable(self):
+        return not self.closing
+
+    def writable(self):
+        return bool(self.queue) and self.queue[0][0] <= time()
+
+    def handle_read(self):
+        if not self.reader.fill():
+            self.handle_close()
+            return
+
+        buffer = self.reader.buffer
+        offset = self.reader.next_frame_offset()
+        while offset is not None:
+            if PacketCodec.checksum_is_valid_from(buffer, offset):
+                try:
+                    self.handle_message(
+                        PacketCodec.decode_from(buffer, offset))
+                except PacketCodec.PacketError:
+                    pass
+            offset = self.reader.next_frame_offset()
+
+    def handle_write(self):
+        fragment = self.simulator.fragment
+        now = time()
+        while self.queue and self.queue[0][0] <= now:
+            due, data = self.queue[0]
+            chunk = data[:fragment] if fragment else data
+            sent = self.send(chunk)
+            if sent < len(data):
+                self.queue[0] = (due, data[sent:])
+                if fragment:
+                    self.simulator.wake_at(now)
+                return
+            self.queue.pop(0)
+
+        if self.closing and not self.queue:
+            self.handle_close()
+
+    def handle_close(self):
+        if self.card is not None and self in self.card.clients:
+            self.card.clients.remove(self)
+        self.close()
+
+    def handle_error(self):
+        self.simulator.errors.append(exc_info()[1])
+        self.handle_close()
+
+
+class SimulatorListener(asyncore.dispatcher):
+    def __init__(self, simulator, host, port, card=None):
+        asyncore.dispatcher.__init__(self, map=simulator.map)
+        self.simulator = simulator
+
+        # Own port: one card. Shared port: cards by username.
+        self.card = card
+        self.cards = dict()
+
+        self.create_socket(AF_INET, SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(1024)
+        self.port = self.socket.getsockname()[1]
+
+    def handle_accept(self):
+        # Drain the backlog; a fleet connects to thousands of cards at once.
+        pair = self.accept()
+        while pair is not None:
+            SimulatorConnection(self.simulator, pair[0], self)
+            pair = self.accept()
+
+
+class VM201Simulator(object):
+    def __init__(self, host='127.0.0.1', latency=0.0, jitter=0.0, fragment=0,
+                 garbage_names=False, names_on_request=True):
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.garbage_names = garbage_names
+        self.names_on_request = names_on_request
+
+        self.map = dict()
+        self.cards = list()
+        self.shared = None
+        self.errors = list()
+
+        # Heap of (due time, sequence number, callback or None).
+        self.timers = list()
+        self.sequence = 0
+        self.thread = None
+        self.running = False
+
+    def add_card(self, port=0, username=None, password=None, names=None,
+                 shared=False):
+        '''
+        Add a virtual card, listening on its own port or on the shared port.
+
+        @param port: local port for the card; 0 picks a free port.
+        @param shared: if True the card is served on the port of listen_shared
+                       and selected by username, which must be unique.
+        @return: VirtualCard; its port attribute holds the port to connect to.
+        '''
+
+        card = VirtualCard(username, password, names)
+        if shared:
+            if self.shared is None:
+                self.listen_shared()
+            if username is None:
+                raise ValueError('A card on the shared port needs a username.')
+            self.shared.cards[username] = card
+            card.port = self.shared.port
+        else:
+            card.port = SimulatorListener(self, self.host, port, card).port
+        self.cards.append(card)
+        return card
+
+    def listen_shared(self, port=0):
+        ''' Open the port on which the shared cards are served '''
+        self.shared = SimulatorListener(self, self.host, port)
+        return self.shared.port
+
+    def wake_at(self, due, callback=None):
+        ''' Make sure the event loop wakes up at due; then call callback() '''
+        self.sequence += 1
+        heapq.heappush(self.timers, (due, self.sequence, callback))
+
+    def pulse(self, card, message):
+        ''' Switch the channels ON now, and OFF after time units '''
+        if card.execute(PacketCodec.Switch('CMD_ON', message.channels)):
+            card.push_status()
+
+        def end_of_pulse():
+            if card.execute(PacketCodec.Switch('CMD_OFF', message.channels)):
+                card.push_status()
+
+        duration = message.time * PacketCodec.PULSE_UNITS.get(message.unit, 1)
+        self.wake_at(time() + duration, end_of_pulse)
+
+    def set_input(self, card, level, delay=0.0):
+        '''
+        Drive the input channel of card, e.g. a door contact; the clients get
+        a CMD_STATUS if it changes. Several calls with small delays make a
+        bouncing contact.
+
+        @param level: bool or int; the new input status.
+        @param delay: seconds from now.
+        '''
+
+        def change():
+            if card.input != int(level):
+                card.input = int(level)
+                card.push_status()
+
+        self.wake_at(time() + delay, change)
+
+    def poll(self, timeout=0.1):
+        ''' One iteration of the event loop; returns after at most timeout '''
+        now = time()
+        while self.timers and self.timers[0][0] <= now:
+            callback = heapq.heappop(self.timers)[2]
+            if callback is not None:
+                callback()
+
+        if self.timers:
+            timeout = min(timeout, max(self.timers[0][0] - now, 0.0))
+        asyncore.loop(timeout=timeout, map=self.map, use_poll=True, count=1)
+
+    def serve_forever(self):
+        self.running = True
+        while self.running:
+            self.poll()
+
+    def start(self):
+        ''' Serve from a background thread; e.g. for tests and benchmarks '''
+        self.thread = Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        asyncore.close_all(self.map)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VM201 firmware simulator')
+    parser.add_argument('--cards', type=int, default=1)
+    parser.add_argument('--port', type=int, default=9760,
+                        help='first port; cards get consecutive ports')
+    parser.add_argument('--shared', action='store_true',
+                        help='serve all cards on --port, select by username')
+    parser.add_argument('--username', default=None)
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--fragment', type=int, default=0)
+    parser.add_argument('--garbage-names', action='store_true')
+    parser.add_argument('--no-names-on-request', dest='names_on_request',
+                        action='store_false',
+                        help='answer CMD_STATUS_REQ with the status only')
+    args = parser.parse_args()
+
+    simulator = VM201Simulator(latency=args.latency, jitter=args.jitter,
+                               fragment=args.fragment,
+                               garbage_names=args.garbage_names,
+                               names_on_request=args.names_on_request)
+
+    if args.shared:
+        simulator.listen_shared(args.port)
+    for i in range(args.cards):
+        username = args.username
+        if args.shared:
+            # Each shared card needs its own username: user0, user1, ...
+            username = '{0}{1}'.format(args.username or 'card', i)
+        password = args.password
+        if args.shared and password is None:
+            password = ''
+        port = 0 if args.shared else args.port + i
+        card = simulator.add_card(port, username, password,
+                                  shared=args.shared)
+        print card
+
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -0,0 +1,253 @@
+'''
+VM201Watcher class.
+
+Edges of the input channel and the relays of one VM201 card, as they
+happen. The vm201 sends a CMD_STATUS by itself whenever its status changes,
+e.g. when a door contact on the input closes, so the watcher waits on the
+socket of a VM201Session and detects the rising and falling edges in those
+frames; nobody has to poll with status() to see the input change.
+
+Edges are debounced: a channel has to keep its new level for debounce
+seconds, or the change is dropped as contact bounce. The watcher polls with a
+CMD_STATUS_REQ only to find a dead connection or a lost frame; the poll
+interval starts at min_interval after every edge, and doubles while the card
+is quiet, up to max_interval.
+
+    watcher = VM201Watcher(VM201Session(host, 9760, 'user', 'pass')).start()
+    watcher.subscribe(door_opened, channels=[9], falling=False)
+    for edge in watcher.events():
+        print edge
+
+Channels 1-8 are the relays, channel 9 is the input.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from collections import namedtuple
+from Queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from time import time
+
+
+CHANNELS = range(1, 10)
+
+# rising: True for OFF -> ON; time: of the change; state: ChannelState once
+# the new level was stable.
+Edge = namedtuple('Edge', 'channel rising time state')
+
+
+class Subscription(object):
+    __slots__ = ('callback', 'channels', 'rising', 'falling')
+
+    def __init__(self, callback, channels=None, rising=True, falling=True):
+        self.callback = callback
+        self.channels = set(channels or CHANNELS)
+        self.rising = rising
+        self.falling = falling
+
+    def wants(self, edge):
+        return edge.channel in self.channels and \
+            (self.rising if edge.rising else self.falling)
+
+
+class VM201Watcher(object):
+    def __init__(self, session, debounce=0.05, min_interval=0.5,
+                 max_interval=30.0):
+        '''
+        @param session: VM201Session of the card; the watcher sends its
+                        keepalives, so do not start() the session itself.
+        @param debounce: seconds a channel has to keep a new level.
+        @param min_interval, max_interval: seconds between two polls right
+                                           after an edge, and when quiet.
+        '''
+
+        self.session = session
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+        # Levels (bool) per channel that were reported; None until the first
+        # CMD_STATUS. pending: channel -> time at which its new level counts.
+        self.levels = None
+        self.pending = dict()
+        self.state = None
+
+        self.lock = Lock()
+        self.subscriptions = dict()
+        self.sequence = 0
+
+        # Chain to whoever listened to the card before us.
+        self.on_status_before = session.card.on_status
+        session.card.on_status = self.on_status
+
+        self.stopped = Event()
+        self.thread = None
+
+    def subscribe(self, callback, channels=None, rising=True, falling=True):
+        '''
+        @param callback: function(edge); called from the watcher thread, so
+                         it should return quickly.
+        @param channels: iterable of channel numbers (1-9); None for all.
+        @param rising, falling: which edges to report.
+        @return: int subscription id, for unsubscribe.
+        '''
+
+        with self.lock:
+            self.sequence += 1
+            self.subscriptions[self.sequence] = \
+                Subscription(callback, channels, rising, falling)
+            return self.sequence
+
+    def unsubscribe(self, subscription_id):
+        with self.lock:
+            self.subscriptions.pop(subscription_id, None)
+
+    def events(self, channels=None, rising=True, falling=True, timeout=None,
+               backlog=100):
+        '''
+        Generator of edges, for a for loop instead of a callback.
+
+        @param timeout: seconds without an edge after which to stop; None
+                        waits forever.
+        @param backlog: edges kept for a slow consumer; further edges are
+                        dropped until it catches up.
+        '''
+
+        queue = Queue(backlog)
+
+        def put(edge):
+            try:
+                queue.put_nowait(edge)
+            except Full:
+                pass
+        subscription_id = self.subscribe(put, channels, rising, falling)
+        deadline = None if timeout is None else time() + timeout
+        try:
+            while True:
+                # Wait a second at a time: a Queue.get without a timeout
+                # cannot be interrupted by Ctrl-C in Python 2.
+                wait = 1.0
+                if deadline is not None:
+                    wait = min(wait, deadline - time())
+                    if wait <= 0:
+                        return
+                try:
+                    edge = queue.get(timeout=wait)
+                except Empty:
+                    continue
+                if deadline is not None:
+                    deadline = time() + timeout
+                yield edge
+        finally:
+            self.unsubscribe(subscription_id)
+
+    def on_status(self, card, old_state, new_state):
+        ''' Note the changed levels; they count once they are stable '''
+        if self.on_status_before is not None:
+            self.on_status_before(card, old_state, new_state)
+
+        now = time()
+        self.state = new_state
+        if self.levels is None:
+            self.levels = dict((channel, new_state.is_on(channel))
+                               for channel in CHANNELS)
+            return
+
+        for channel in CHANNELS:
+            if new_state.is_on(channel) != self.levels[channel]:
+                self.pending.setdefault(channel, now + self.debounce)
+            else:
+                # Back at the level reported last: a bounce.
+                self.pending.pop(channel, None)
+
+    def release(self, now):
+        ''' Report the pending edges that are stable by now '''
+        edges = list()
+        # on_status runs in whichever thread holds the session.
+        with self.session.lock:
+            for channel, due in sorted(self.pending.items()):
+                if due <= now:
+                    del self.pending[channel]
+                    self.levels[channel] = not self.levels[channel]
+                    edges.append(Edge(channel, self.levels[channel],
+                                      due - self.debounce, self.state))
+        if not edges:
+            return
+
+        self.interval = self.min_interval
+        with self.lock:
+            subscriptions = self.subscriptions.values()
+        for edge in edges:
+            for subscription in subscriptions:
+                if subscription.wants(edge):
+                    subscription.callback(edge)
+
+    def poll(self):
+        ''' Ask for the status; wait twice as long next time if quiet '''
+        self.session.status()
+        self.interval = min(2 * self.interval, self.max_interval)
+
+    def wait(self):
+        ''' Seconds until the next poll, or the next pending edge is due '''
+        now = time()
+        wait = self.session.last_used + self.interval - now
+        with self.session.lock:
+            if self.pending:
+                wait = min(wait, min(self.pending.values()) - now)
+        # At most a second, so stop() does not wait for long.
+        return min(wait, 1.0)
+
+    def quiet(self):
+        if time() >= self.session.last_used + self.interval:
+            self.poll()
+
+    def run(self):
+        self.session.watch(self.stopped, self.wait, self.quiet,
+                           lambda: self.release(time()), 'Watcher')
+
+    def start(self):
+        ''' Connect, and watch from a background thread '''
+        self.stopped.clear()
+        self.session.stopped.clear()
+        self.session.connect()
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        # Ends the backoff of a reconnect in progress too.
+        self.session.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.session.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from VM201Session import VM201Session
+
+    parser = argparse.ArgumentParser(description='Print the edges of a VM201')
+    parser.add_argument('host')
+    parser.add_argument('port', type=int, nargs='?', default=9760)
+    parser.add_argument('username', nargs='?')
+    parser.add_argument('password', nargs='?')
+    parser.add_argument('--debounce', type=float, default=0.05)
+    parser.add_argument('--max-interval', type=float, default=30.0)
+    args = parser.parse_args()
+
+    watcher = VM201Watcher(VM201Session(args.host, args.port, args.username,
+                                        args.password),
+                           args.debounce, max_interval=args.max_interval)
+    watcher.start()
+    try:
+        for edge in watcher.events():
+            print '{0:.3f} channel {1} {2}'.format(
+                edge.time, edge.channel, 'ON' if edge.rising else 'OFF')
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# benchmark_vm201.py
+#
+# Timo Halbesma
+#
+# Benchmark the hot paths of the VM201 client against a local VM201Simulator:
+# codec throughput, connect+login, status round trip, on_off_toggle with and
+# without a status change, a command sequence with and without pipelining,
+# fleet-wide switching, and a switch from the command line in a new process.
+# Results are written as
+# JSON so runs can be compared for regressions.
+#
+# October 18th, 2026
+# Version 1.0: implemented
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from time import time
+from timeit import timeit
+
+import BulkCodec
+import PacketCodec
+from TCPPacketHandler import TCPPacketHandler
+from VM201Fleet import VM201Fleet
+from VM201RelayCard import VM201RelayCard
+from VM201Simulator import VM201Simulator
+
+
+USERNAME, PASSWORD = 'bench', 'bench'
+
+
+def summary(samples):
+    ''' Latency statistics in milliseconds of a list of durations in s '''
+    samples = sorted(samples)
+    n = len(samples)
+
+    def percentile(p):
+        return 1e3 * samples[min(n - 1, int(p * n))]
+
+    return {'n': n,
+            'mean_ms': 1e3 * sum(samples) / n,
+            'min_ms': 1e3 * samples[0],
+            'p50_ms': percentile(0.50),
+            'p90_ms': percentile(0.90),
+            'p99_ms': percentile(0.99),
+            'max_ms': 1e3 * samples[-1]}
+
+
+def throughput(function, number):
+    ''' Calls per second of function '''
+    return number / timeit(function, number=number)
+
+
+def bench_codec(number):
+    handler = TCPPacketHandler()
+    quiet = VM201RelayCard('localhost', verbose=False)
+    status = PacketCodec.build('CMD_STATUS', '\x05\x01\x01')
+    name = PacketCodec.build('CMD_NAME', '\x01' + 'Lamp'.ljust(16, '\x00'))
+    stream = bytearray((status + name) * 1000)
+
+    return {
+        'encode_on_per_s': throughput(
+            lambda: handler.encode(quiet, 'CMD_ON', '\x07'), number),
+        'encode_username_per_s': throughput(
+            lambda: handler.encode(quiet, 'CMD_USERNAME', USERNAME), number),
+        'decode_status_per_s': throughput(
+            lambda: handler.decode(quiet, status), number),
+        'decode_name_per_s': throughput(
+            lambda: handler.decode(quiet, name), number),
+        'checksum_per_s': throughput(
+            lambda: handler.checksum_is_valid(status), number),
+        'decode_many_frames_per_s': 2000 * throughput(
+            lambda: sum(1 for m in PacketCodec.decode_many(stream)),
+            max(1, number // 2000)),
+        'bulk_decode_status_frames_per_s': 2000 * throughput(
+            lambda: BulkCodec.decode_status(stream),
+            max(1, number // 2000)),
+        'bulk_numpy': BulkCodec.np is not None,
+    }
+
+
+def connected_card(port):
+    card = VM201RelayCard('127.0.0.1', port, USERNAME, PASSWORD, False)
+    card.connect()
+    return card
+
+
+def bench_session(port, repeat):
+    connect, status, changed, unchanged = [], [], [], []
+
+    for i in range(repeat):
+        start = time()
+        card = connected_card(port)
+        connect.append(time() - start)
+        card.socket.close()
+
+    card = connected_card(port)
+    for i in range(repeat):
+        start = time()
+        card.status()
+        status.append(time() - start)
+
+        start = time()
+        card.on_off_toggle('CMD_TOGGLE', 1)
+        changed.append(time() - start)
+
+        # Channel 2 is already ON after the first iteration.
+        card.on_off_toggle('CMD_ON', 2)
+        start = time()
+        card.on_off_toggle('CMD_ON', 2)
+        unchanged.append(time() - start)
+    card.socket.close()
+
+    return {'connect_login': summary(connect),
+            'status_round_trip': summary(status),
+            'on_off_toggle_changed': summary(changed),
+            'on_off_toggle_unchanged': summary(unchanged)}
+
+
+def bench_sequence(port, repeat):
+    ''' login, status, three switches, status: one by one versus pipelined '''
+    sequential, pipelined = [], []
+
+    for i in range(repeat):
+        start = time()
+        card = connected_card(port)
+        card.status()
+        card.set_channels('CMD_ON', [1])
+        card.set_channels('CMD_TOGGLE', [2])
+        card.set_channels('CMD_OFF', [1])
+        card.status()
+        sequential.append(time() - start)
+        card.socket.close()
+
+        start = time()
+        card = VM201RelayCard('127.0.0.1', port, USERNAME, PASSWORD, False)
+        card.open_socket()
+        pipeline = card.pipeline()
+        pipeline.login()
+        pipeline.status()
+        pipeline.set_channels('CMD_ON', [1])
+        pipeline.set_channels('CMD_TOGGLE', [2])
+        pipeline.set_channels('CMD_OFF', [1])
+        pipeline.status()
+        pipeline.execute()
+        pipelined.append(time() - start)
+        card.socket.close()
+
+    return {'sequence_sequential': summary(sequential),
+            'sequence_pipelined': summary(pipelined)}
+
+
+def bench_cli(port, repeat):
+    ''' Wall time of a complete process that switches three channels ON '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        'cli_communicate_with_vm201': [
+            sys.executable, os.path.join(here, 'communicate_with_vm201.py'),
+            '127.0.0.1', str(port), USERNAME, PASSWORD, 'on'],
+        'cli_switch_vm201': [
+            sys.executable, os.path.join(here, 'switch_vm201.py'),
+            '-P', str(port), '-u', USERNAME, '-p', PASSWORD, '127.0.0.1',
+            'on', '1', '2', '3']}
+
+    results = dict()
+    for name, command in commands.items():
+        samples = list()
+        for i in range(repeat):
+            start = time()
+            subprocess.check_call(command)
+            samples.append(time() - start)
+        results[name] = summary(samples)
+    return results
+
+
+def bench_fleet(simulator, sizes, repeat):
+    results = dict()
+    for size in sizes:
+        fleet = VM201Fleet(timeout=60.0)
+        for i in range(size):
+            fleet.add_card('127.0.0.1', simulator.shared.port,
+                           'card{0}'.format(i), PASSWORD)
+
+        samples, failed = [], 0
+        for i in range(repeat):
+            start = time()
+            card_results = fleet.on_off_toggle('CMD_TOGGLE', [1])
+            samples.append(time() - start)
+            failed += sum(1 for result in card_results if not result.ok)
+
+        results[str(size)] = summary(samples)
+        results[str(size)]['failed'] = failed
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the VM201 client')
+    parser.add_argument('--output', default='benchmark_vm201.json')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--number', type=int, default=100000,
+                        help='iterations of the codec benchmarks')
+    parser.add_argument('--fleet', default='1,10,100,1000',
+                        help='comma separated fleet sizes')
+    parser.add_argument('--fleet-repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated latency per response in seconds')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.fleet.split(',') if size]
+
+    # As the firmware: a CMD_STATUS_REQ is answered with the names too.
+    simulator = VM201Simulator(latency=args.latency, names_on_request=True)
+    card = simulator.add_card(username=USERNAME, password=PASSWORD)
+    simulator.listen_shared()
+    for i in range(max(sizes or [0])):
+        simulator.add_card(username='card{0}'.format(i), password=PASSWORD,
+                           shared=True)
+    simulator.start()
+
+    try:
+        results = {'python': platform.python_version(),
+                   'started': time(),
+                   'latency_s': args.latency,
+                   'codec': bench_codec(args.number),
+                   'session': bench_session(card.port, args.repeat),
+                   'sequence': bench_sequence(card.port, args.repeat),
+                   'cli': bench_cli(card.port, min(args.repeat, 20)),
+                   'fleet': bench_fleet(simulator, sizes, args.fleet_repeat)}
+    finally:
+        simulator.stop()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print json.dumps(results, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
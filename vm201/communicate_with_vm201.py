@@ -5,77 +5,106 @@
 #
 # Control VM201 ethernet relay card over TCP.
 #
+# To trace the packets of an on/off run to a PacketLog file for post-mortems,
+# set VM201_PACKET_LOG to its path; nothing is written otherwise.
+#
 # October 11th, 2014
 # Version 2.0: Read TCP responses; send TCP packet to login and request status.
 
+from os import environ
 from sys import argv, exit
 from time import sleep
 
-from VM201RelayCard import VM201RelayCard
+from ChannelState import channels_of_mask
+from PacketLog import PacketLog
+from VM201Reconciler import DesiredState, plan
+from VM201RelayCard import VM201Error, VM201RelayCard
+from VM201Session import VM201Session
 
 
-def on_off(host, port=9760, username=None, password=None, cmd=''):
-    # Set verbose to False so no output is written to stdout.
-    VM201 = VM201RelayCard(host, port, username, password, False)
-    VM201.connect()
-    VM201.status()
+def on_off(host, port=9760, username=None, password=None, cmd='',
+           packet_log_path=None):
+    # Set verbose to False so no output is written to stdout. If a path is
+    # given, the packets are still traced to that PacketLog file.
+    packet_log = None
+    if packet_log_path is not None:
+        packet_log = PacketLog(packet_log_path).start()
+    VM201 = VM201RelayCard(host, port, username, password, False,
+                           packet_log=packet_log)
+    try:
+        VM201.connect()
 
-    if cmd.lower() == 'on':
-        VM201.on_off_toggle('CMD_ON', 1)
-        VM201.on_off_toggle('CMD_ON', 2)
-        VM201.on_off_toggle('CMD_ON', 3)
-    elif cmd.lower() == 'off':
-        VM201.on_off_toggle('CMD_OFF', 1)
-        VM201.on_off_toggle('CMD_OFF', 2)
-        VM201.on_off_toggle('CMD_OFF', 3)
-    else:
-        print "'{0}' is not a valid option".format(cmd)
+        if cmd.lower() in ['on', 'off']:
+            # Only switch the channels that are not in that state already.
+            desired = DesiredState.of_channels([1, 2, 3], cmd.lower() == 'on')
+            for switch, mask in plan(VM201.state, desired):
+                VM201.set_channels(switch, channels_of_mask(mask))
+        else:
+            print "'{0}' is not a valid option".format(cmd)
 
-    VM201.send_status_request()
-    VM201.status()
-    VM201.disconnect()
+        VM201.status()
+        VM201.disconnect()
+    except VM201Error, e:
+        print e
+        exit(1)
+    finally:
+        # Write the remaining packets, also if the vm201 could not be reached.
+        if packet_log is not None:
+            packet_log.close()
 
 
 def main(host, port=9760, username=None, password=None):
-    # Explicitly set verbose to True [this is the default value though]
-    VM201 = VM201RelayCard(host, port, username, password, True)
+    # Explicitly set verbose to True. The session reconnects and logs in
+    # again if the vm201 drops the connection while we wait for input.
+    VM201 = VM201Session(host, port, username, password, True)
 
-    VM201.connect()
-    VM201.status()
+    try:
+        VM201.connect()
+        VM201.status()
+    except VM201Error, e:
+        print e
+        exit(1)
 
     user_command = ''
     while user_command != 'QUIT':
+        # Repaint whatever the fps limit held back before blocking on input.
+        VM201.display.render(force=True)
         user_command = raw_input('> ')
-        if user_command == 'HELP':
-            VM201.display.add_tcp_msg('HELP: not available yet')
-        elif user_command == 'CMD_STATUS':
-            VM201.send_status_request()
-            VM201.status()
-        elif user_command == 'QUIT':
-            VM201.disconnect()
-        else:
+        try:
+            handle_command(VM201, user_command)
+        except VM201Error, e:
+            VM201.display.add_tcp_msg('Error: {0}'.format(e))
+
 
+def handle_command(VM201, user_command):
+    ''' Execute one line typed by the user on the session '''
+    if user_command == 'HELP':
+        VM201.display.add_tcp_msg('HELP: not available yet')
+    elif user_command == 'CMD_STATUS':
+        VM201.status()
+    elif user_command == 'QUIT':
+        VM201.close()
+    else:
+        try:
+            choice, argument = user_command.split()
+        except ValueError, e:
+            VM201.display.add_tcp_msg('Error: incorrect command or usage')
+        else:
             try:
-                choice, argument = user_command.split()
+                argument = int(argument)
+                if argument < 1 or argument > 8:
+                    raise ValueError
             except ValueError, e:
-                VM201.display.add_tcp_msg('Error: incorrect command or usage')
-            else:
-                try:
-                    argument = int(argument)
-                    if argument < 1 or argument > 8:
-                        raise ValueError
-                except ValueError, e:
-                    VM201.display.add_tcp_msg('Error: incorrect usage')
+                VM201.display.add_tcp_msg('Error: incorrect usage')
 
+            else:
+                if choice in ['CMD_ON', 'CMD_OFF', 'CMD_TOGGLE',
+                              'CMD_TMR_ENA', 'CMD_TMR_DIS',
+                              'CMD_TMR_TOGGLE']:
+                    VM201.on_off_toggle(choice, argument)
+                    VM201.status()
                 else:
-                    if choice in ['CMD_ON', 'CMD_OFF', 'CMD_TOGGLE',
-                                  'CMD_TMR_ENA', 'CMD_TMR_DIS',
-                                  'CMD_TMR_TOGGLE']:
-                        VM201.on_off_toggle(choice, argument)
-                        VM201.send_status_request()
-                        VM201.status()
-                    else:
-                        VM201.display.add_tcp_msg('Error: incorrect usage')
+                    VM201.display.add_tcp_msg('Error: incorrect usage')
 
 
 if __name__ == "__main__":
@@ -99,4 +128,5 @@ if __name__ == "__main__":
         main(argv[1], int(argv[2]), argv[3], argv[4])
     elif len(argv) == 6:
         # hostname, port and username+password given and additional command
-        on_off(argv[1], int(argv[2]), argv[3], argv[4], argv[5])
+        on_off(argv[1], int(argv[2]), argv[3], argv[4], argv[5],
+               environ.get('VM201_PACKET_LOG'))
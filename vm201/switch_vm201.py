@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# switch_vm201.py
+#
+# Timo Halbesma
+#
+# One-shot switching of a VM201 for cron jobs and automation hooks, e.g.
+#     python switch_vm201.py -u user -p pass 192.168.1.100 on 1 2 3
+#     python switch_vm201.py -P 9760 192.168.1.100 pulse 4 --time 5s
+#
+# Nothing is imported that a switch does not need, and nothing is displayed.
+# The login and the switch are sent in one burst (see VM201Pipeline), the
+# switch is confirmed by the CMD_STATUS it causes, if any, and CMD_CLOSED is
+# sent without waiting for the answer. A switch costs the TCP connect and one
+# round trip. With --timing the time spent per phase is written to stderr.
+#
+# Exit status: 0 on success, 1 on an error of the vm201, 2 on bad usage.
+#
+# October 18th, 2026
+# Version 1.0: implemented
+
+from time import time
+STARTED = time()
+
+from getopt import GetoptError, gnu_getopt
+from sys import argv, exit, stderr
+
+
+ACTIONS = {'on': 'CMD_ON',
+           'off': 'CMD_OFF',
+           'toggle': 'CMD_TOGGLE',
+           'update': 'CMD_UPDATE',
+           'timer-on': 'CMD_TMR_ENA',
+           'timer-off': 'CMD_TMR_DIS',
+           'timer-toggle': 'CMD_TMR_TOGGLE',
+           'pulse': 'CMD_PULSE'}
+
+USAGE = '''Usage: python {0} [options] host action channel [channel ...]
+
+actions: {1}
+channels: 1...8, or all; update switches the given channels ON, others OFF
+
+options:
+  -P, --port PORT          default 9760
+  -u, --username USER
+  -p, --password PASS
+  -t, --time TIME          pulse time, e.g. 5s, 10m or 2h; default 1s
+  -T, --timeout SECONDS    default 3
+      --timing             write the time per phase to stderr'''.format(
+    argv[0], ', '.join(sorted(ACTIONS)))
+
+
+def switch(host, port, username, password, cmd, channel_ids, pulse=None,
+           timeout=3.0, timings=None):
+    '''
+    Connect, login, switch and close; no status is asked for.
+
+    @param cmd: CMD_FULL_NAME; one of the values of ACTIONS.
+    @param pulse: tuple (time, unit) for CMD_PULSE.
+    @param timings: list to append (phase, unix time) tuples to; or None.
+    @return: ChannelState after the switch.
+    @raise VM201Error: connection, protocol or timeout error.
+    @raise LoginError: username and password were refused.
+    '''
+
+    from socket import timeout as timeout_error
+    from VM201RelayCard import VM201RelayCard
+
+    if timings is not None:
+        timings.append(('import', time()))
+
+    card = VM201RelayCard(host, port, username, password, verbose=False)
+    card.open_socket(timeout)
+    if timings is not None:
+        timings.append(('connect', time()))
+
+    pipeline = card.pipeline()
+    pipeline.login()
+    if cmd == 'CMD_PULSE':
+        pipeline.pulse(channel_ids, *pulse)
+    else:
+        pipeline.set_channels(cmd, channel_ids)
+    try:
+        pipeline.execute(timeout)
+    except timeout_error:
+        card.fail('Timeout after {0}s; is the card asking for a password?'
+                  .format(timeout))
+    if timings is not None:
+        timings.append(('login+switch', time()))
+
+    card.disconnect(timeout, wait=False)
+    if timings is not None:
+        timings.append(('close', time()))
+    return card.state
+
+
+def parse_channels(args):
+    ''' @raise ValueError: not a channel number '''
+    if args == ['all']:
+        return range(1, 9)
+    channel_ids = [int(arg) for arg in ','.join(args).split(',') if arg]
+    for channel_id in channel_ids:
+        if not 1 <= channel_id <= 8:
+            raise ValueError('Channel {0} is not 1...8'.format(channel_id))
+    return channel_ids
+
+
+def parse_pulse(text):
+    ''' '5s' -> (5, 's'); a number without unit is in seconds '''
+    if text[-1:] in ('s', 'm', 'h'):
+        return int(text[:-1]), text[-1]
+    return int(text), 's'
+
+
+def main(args):
+    try:
+        options, args = gnu_getopt(args, 'P:u:p:t:T:h', [
+            'port=', 'username=', 'password=', 'time=', 'timeout=', 'timing',
+            'help'])
+        options = dict(options)
+        if '-h' in options or '--help' in options:
+            print USAGE
+            return 0
+
+        host, action = args[:2]
+        cmd = ACTIONS[action]
+        channel_ids = parse_channels(args[2:])
+        if not channel_ids and cmd != 'CMD_UPDATE':
+            raise ValueError('No channels given')
+        port = int(options.get('-P', options.get('--port', 9760)))
+        pulse = parse_pulse(options.get('-t', options.get('--time', '1s')))
+        if cmd == 'CMD_PULSE':
+            # Raises PacketError, a ValueError, if out of range.
+            from PacketCodec import pulse_data
+            pulse_data(*pulse)
+        timeout = float(options.get('-T', options.get('--timeout', 3.0)))
+    except (GetoptError, KeyError, ValueError), e:
+        print >> stderr, USAGE
+        if str(e):
+            print >> stderr, '\nError: {0}'.format(e)
+        return 2
+
+    timings = [('start', STARTED)] if '--timing' in options else None
+
+    from VM201RelayCard import VM201Error
+    try:
+        switch(host, port, options.get('-u', options.get('--username')),
+               options.get('-p', options.get('--password')), cmd,
+               channel_ids, pulse, timeout, timings)
+    except VM201Error, e:
+        print >> stderr, e
+        return 1
+
+    if timings is not None:
+        print >> stderr, ', '.join(
+            '{0} {1:.1f} ms'.format(phase, 1e3 * (end - begin))
+            for (_, begin), (phase, end) in zip(timings, timings[1:])) + \
+            ', total {0:.1f} ms'.format(1e3 * (timings[-1][1] - STARTED))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main(argv[1:]))
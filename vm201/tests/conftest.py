@@ -0,0 +1,38 @@
+'''
+Fixtures of the tests; run them with python -m pytest from the vm201 folder.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import os
+import sys
+
+import pytest
+
+# The modules import each other by their bare names.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from VM201Simulator import VM201Simulator
+
+
+USERNAME = 'user'
+PASSWORD = 'pass'
+
+
+@pytest.fixture
+def simulator():
+    ''' VM201Simulator; add the cards before simulator.start() '''
+    simulator = VM201Simulator()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def card(simulator):
+    ''' VirtualCard with a login, served by the started simulator '''
+    card = simulator.add_card(username=USERNAME, password=PASSWORD)
+    simulator.start()
+    return card
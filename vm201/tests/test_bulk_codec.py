@@ -0,0 +1,91 @@
+'''
+Tests of BulkCodec, with and without numpy.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import random
+
+import pytest
+
+import BulkCodec
+import PacketCodec
+
+
+def stream_of(frames, garbage=0, seed=1):
+    ''' Concatenated frames, with up to garbage random bytes in between '''
+    rng = random.Random(seed)
+    chunks = list()
+    for frame in frames:
+        chunks.append(''.join(chr(rng.randrange(256))
+                              for i in range(rng.randrange(garbage + 1))))
+        chunks.append(frame)
+    return ''.join(chunks)
+
+
+def status(output, timer=0, input=0):
+    return PacketCodec.build('CMD_STATUS', chr(output) + chr(timer) +
+                             chr(input))
+
+
+@pytest.fixture(params=['python', 'numpy'])
+def codec(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(BulkCodec, 'np', None)
+    elif BulkCodec.np is None:
+        pytest.skip('numpy is not installed')
+    return BulkCodec
+
+
+def test_status_columns(codec):
+    outputs = range(256)
+    buffer = stream_of([status(output, 255 - output, output & 1)
+                        for output in outputs])
+    statuses = codec.decode_status(buffer)
+    assert list(statuses.output) == outputs
+    assert list(statuses.timer) == [255 - output for output in outputs]
+    assert list(statuses.input) == [output & 1 for output in outputs]
+
+
+def test_stx_inside_a_frame(codec):
+    # 0x02 as output bits; not the start of a frame.
+    buffer = status(0x02, 0x02, 0x02) + status(0x05)
+    assert list(codec.decode_status(buffer).output) == [0x02, 0x05]
+
+
+def test_candidate_without_etx_is_skipped(codec):
+    # <STX><8> of garbage in front of a frame; FrameReader would take the
+    # first 8 bytes as a frame and lose the CMD_STATUS behind it.
+    buffer = '\x02\x08' + status(0x07)
+    frames = codec.scan(buffer)
+    assert list(frames.offset) == [2]
+    assert list(codec.decode_status(buffer).output) == [0x07]
+
+
+def test_invalid_checksum(codec):
+    bad = bytearray(status(0x01))
+    bad[3] ^= 0x10
+    buffer = str(bad) + status(0x03)
+    frames = codec.scan(buffer)
+    assert list(frames.valid) == [False, True]
+    assert list(codec.decode_status(buffer).output) == [0x03]
+    assert list(codec.decode_status(buffer, validate=False).output) == \
+        [0x11, 0x03]
+
+
+def test_numpy_matches_python(monkeypatch):
+    if BulkCodec.np is None:
+        pytest.skip('numpy is not installed')
+    rng = random.Random(7)
+    frames = [status(rng.randrange(256), rng.randrange(256), rng.randrange(2))
+              for i in range(2000)]
+    buffer = stream_of(frames, garbage=6, seed=7)
+
+    fast = BulkCodec.scan(buffer)
+    monkeypatch.setattr(BulkCodec, 'np', None)
+    slow = BulkCodec.scan(buffer)
+    for fast_column, slow_column in zip(fast, slow):
+        assert [int(value) for value in fast_column] == \
+            [int(value) for value in slow_column]
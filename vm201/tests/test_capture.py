@@ -0,0 +1,94 @@
+'''
+Tests of PacketCapture and BulkCodec on the traffic of a fleet.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import pytest
+
+import BulkCodec
+from PacketCapture import CaptureReader, PacketCapture, replay
+from PacketLog import RX
+from VM201Fleet import VM201Fleet
+from VM201Simulator import VM201Simulator
+
+
+@pytest.fixture
+def capture_path(tmpdir):
+    ''' Capture of two cards, switched concurrently, in 3-byte segments '''
+    simulator = VM201Simulator(fragment=3)
+    cards = [simulator.add_card(username='card{0}'.format(i),
+                                password='pass') for i in range(2)]
+    simulator.start()
+
+    path = str(tmpdir.join('fleet.vm201cap'))
+    capture = PacketCapture(path)
+    fleet = VM201Fleet(timeout=5.0, capture=capture)
+    for card in cards:
+        fleet.add_card('127.0.0.1', card.port, card.username, 'pass')
+    try:
+        for mask in (0b1, 0b10, 0b100):
+            results = fleet.run([('CMD_TOGGLE', mask)])
+            assert all(result.ok for result in results)
+    finally:
+        capture.close()
+        simulator.stop()
+    return path
+
+
+def test_one_stream_per_connection(capture_path):
+    reader = CaptureReader(capture_path)
+    try:
+        streams = reader.streams()
+    finally:
+        reader.close()
+    # Three runs of two cards.
+    assert len(streams) == 6
+    assert len(set(label for stream, label, timestamp in streams)) == 2
+
+
+def test_replay_every_stream(capture_path):
+    reader = CaptureReader(capture_path)
+    streams = [stream for stream, label, timestamp in reader.streams()]
+    reader.close()
+
+    total = 0
+    for stream in streams:
+        card, messages, seconds = replay(capture_path, stream=stream)
+        # 9 names and the status after the login, and the toggle.
+        assert [message.cmd for message in messages].count('CMD_NAME') == 9
+        assert [message.cmd for message in messages].count(
+            'CMD_STATUS') == 2
+        total += len(messages)
+
+    card, messages, seconds = replay(capture_path)
+    assert len(messages) == total
+
+
+def test_bulk_decode_of_all_streams(capture_path):
+    statuses = BulkCodec.decode_status(BulkCodec.capture_stream(capture_path))
+    assert len(statuses.offset) == 12
+    assert sorted(set(statuses.output)) == [0, 1, 3, 7]
+
+
+def test_append_after_a_torn_record(capture_path):
+    with open(capture_path, 'ab') as f:
+        f.write('\x00' * 5)
+
+    capture = PacketCapture(capture_path)
+    stream = capture.stream('late:9760')
+    stream.record(RX, '\x02\x05\x0a\xef\x03')
+    capture.close()
+
+    reader = CaptureReader(capture_path)
+    try:
+        streams = reader.streams()
+        assert streams[-1][:2] == (7, 'late:9760')
+        records = list(reader.records(RX, 7))
+        assert len(records) == 1
+        timestamp, record_stream, direction, offset, length = records[0]
+        assert reader.data(offset, length) == '\x02\x05\x0a\xef\x03'
+    finally:
+        reader.close()
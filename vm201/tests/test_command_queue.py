@@ -0,0 +1,116 @@
+'''
+Tests of VM201CommandQueue: the merge algebra, and the queue against the
+simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import random
+
+import pytest
+
+from ChannelState import apply_command
+from conftest import PASSWORD, USERNAME
+from VM201CommandQueue import MANUAL, OUTPUT_COMMANDS, SCHEDULED, \
+    TIMER_COMMANDS, NetChange, VM201CommandQueue
+from VM201Session import VM201Session
+
+
+COMMANDS = sorted(OUTPUT_COMMANDS) + sorted(TIMER_COMMANDS)
+
+
+def test_net_change_matches_apply_command():
+    ''' Merged, any run of commands has the effect of sending them all '''
+    rng = random.Random(23)
+    for trial in range(20000):
+        output_change, timer_change = NetChange(), NetChange()
+        output = first_output = rng.randrange(256)
+        timer = first_timer = rng.randrange(256)
+        for i in range(rng.randrange(1, 6)):
+            cmd, mask = rng.choice(COMMANDS), rng.randrange(256)
+            output, timer = apply_command(cmd, mask, output, timer)
+            if cmd in TIMER_COMMANDS:
+                timer_change.add(TIMER_COMMANDS[cmd], mask)
+            else:
+                output_change.add(OUTPUT_COMMANDS[cmd], mask)
+        assert output_change.apply(first_output) == output, trial
+        assert timer_change.apply(first_timer) == timer, trial
+
+
+def test_toggle_twice_is_nothing():
+    change = NetChange()
+    change.add('toggle', 0b101)
+    change.add('toggle', 0b101)
+    assert change.touched() == 0
+
+
+@pytest.fixture
+def queue(simulator, card):
+    session = VM201Session('127.0.0.1', card.port, USERNAME, PASSWORD,
+                           timeout=1.0)
+    queue = VM201CommandQueue(session, rate=20, burst=4).start()
+    yield queue
+    queue.stop()
+    session.close()
+
+
+def test_queue_ends_in_the_state_of_sending_one_by_one(card, queue):
+    rng = random.Random(5)
+    commands = [queue.submit(rng.choice(['CMD_ON', 'CMD_OFF', 'CMD_TOGGLE',
+                                         'CMD_TMR_TOGGLE']),
+                             [rng.randint(1, 8)],
+                             rng.choice([MANUAL, SCHEDULED]))
+                for i in range(50)]
+    expected = (0, 0)
+    for command in commands:
+        expected = apply_command(command.cmd, command.mask, *expected)
+
+    for command in commands:
+        assert command.wait(5.0)
+    assert (card.output, card.timer) == expected
+    # Merged: far fewer packets than commands.
+    assert queue.packets < len(commands)
+
+
+def test_toggle_pair_sends_nothing(card, queue):
+    queue.submit('CMD_ON', [1], MANUAL).wait(2.0)
+    packets = queue.packets
+    queue.submit('CMD_TOGGLE', [1])
+    assert queue.submit('CMD_TOGGLE', [1]).wait(2.0)
+    assert queue.packets == packets
+    assert card.output == 0b1
+
+
+def test_pulse(card, queue):
+    assert queue.pulse([7], 1, 's', MANUAL).wait(2.0)
+    assert card.output == 0b1000000
+
+
+def test_bad_pulse_fails_at_submit(queue):
+    from PacketCodec import PacketError
+    with pytest.raises(PacketError):
+        queue.pulse([7], 100)
+
+
+@pytest.mark.parametrize('channels', [[0], [9], [1, 9]])
+def test_bad_channel_fails_at_submit(queue, channels):
+    with pytest.raises(ValueError):
+        queue.submit('CMD_TOGGLE', channels, MANUAL)
+    with pytest.raises(ValueError):
+        queue.pulse(channels, 5)
+    assert not queue.pending
+
+
+def test_stop_fails_pending_commands(simulator, card):
+    from VM201RelayCard import VM201Error
+    session = VM201Session('127.0.0.1', card.port, USERNAME, PASSWORD,
+                           timeout=1.0)
+    # Lingers for a minute; stop() comes first.
+    queue = VM201CommandQueue(session, linger={SCHEDULED: 60.0}).start()
+    command = queue.submit('CMD_ON', [1], SCHEDULED)
+    queue.stop()
+    session.close()
+    with pytest.raises(VM201Error):
+        command.wait(1.0)
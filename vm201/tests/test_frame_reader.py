@@ -0,0 +1,92 @@
+'''
+Tests of FrameReader, over a socket that returns the stream in given chunks.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from random import Random
+from socket import error
+
+import pytest
+
+from FrameReader import FrameReader
+from PacketCodec import build, encode
+
+
+# What the vm201 sends after a login: nine names, then the status.
+FRAMES = [build('CMD_NAME', chr(channel) + 'Output{0}'.format(channel)
+                .ljust(16, '\x00')) for channel in range(1, 10)] + \
+    [build('CMD_STATUS', '\x05\x00\x00')]
+STREAM = ''.join(FRAMES)
+
+
+class ChunkSocket(object):
+    ''' recv_into returns the chunks one by one, then 0 as a closed peer '''
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, view, nbytes=0):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        size = min(len(chunk), nbytes or len(view))
+        view[:size] = chunk[:size]
+        if chunk[size:]:
+            self.chunks.insert(0, chunk[size:])
+        return size
+
+
+def read_all(reader):
+    ''' @return: list of the frames until the peer closes '''
+    frames = list()
+    with pytest.raises(error):
+        while True:
+            frames.append(reader.read_frame())
+    return frames
+
+
+def test_one_chunk_holds_many_frames():
+    reader = FrameReader(ChunkSocket([STREAM]))
+    assert read_all(reader) == FRAMES
+    assert reader.pending() == 0
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 21, 23])
+def test_frames_split_over_chunks(size):
+    chunks = [STREAM[i:i+size] for i in range(0, len(STREAM), size)]
+    assert read_all(FrameReader(ChunkSocket(chunks))) == FRAMES
+
+
+def test_frames_split_at_random_over_a_small_buffer():
+    rand = Random(201)
+    for _ in range(200):
+        cuts = sorted(rand.sample(range(1, len(STREAM)), 12))
+        chunks = [STREAM[i:j] for i, j in zip([0] + cuts,
+                                              cuts + [len(STREAM)])]
+        # Small enough that partial frames are moved to the front.
+        reader = FrameReader(ChunkSocket(chunks), size=48)
+        assert read_all(reader) == FRAMES
+
+
+def test_resync_on_garbage():
+    status = FRAMES[-1]
+    # Bytes that are no STX, and STX with a length no packet has.
+    stream = '\xff\x00' + FRAMES[0] + '\x02\x01\x02\x17' + status + \
+        'xyz\x02\x02\x02' + encode('CMD_CLOSED')
+    assert read_all(FrameReader(ChunkSocket(stream))) == \
+        [FRAMES[0], status, encode('CMD_CLOSED')]
+
+
+def test_next_frame_does_not_touch_the_socket():
+    reader = FrameReader(ChunkSocket([FRAMES[0], FRAMES[1][:10],
+                                      FRAMES[1][10:]]))
+    assert reader.next_frame() is None
+    reader.fill()
+    assert reader.next_frame() == FRAMES[0]
+    reader.fill()
+    assert reader.next_frame() is None and reader.pending() == 10
+    reader.fill()
+    assert reader.next_frame() == FRAMES[1]
@@ -0,0 +1,70 @@
+'''
+Tests of VM201Gateway, against the simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import pytest
+
+from conftest import PASSWORD, USERNAME
+from VM201Gateway import GatewayClient, VM201Gateway
+
+
+@pytest.fixture
+def client(card):
+    gateway = VM201Gateway(port=0)
+    gateway.add_card('garden', '127.0.0.1', card.port, USERNAME, PASSWORD,
+                     timeout=2.0)
+    gateway.start()
+    client = GatewayClient(port=gateway.port)
+    yield client
+    client.close()
+    gateway.stop()
+
+
+def test_set(client, card):
+    answer = client.request('set', card='garden', cmd='CMD_ON',
+                            channels=[1, 2])
+    assert answer['ok']
+    assert answer['output'] == 0b11
+    assert card.output == 0b11
+
+
+def test_pulse_as_in_the_docstring(client, card):
+    # The unit arrives as unicode from JSON.
+    answer = client.request('pulse', card='garden', channels=[3], time=5,
+                            unit='s')
+    assert answer['ok']
+    assert answer['output'] == 0b100
+    assert card.output == 0b100
+
+
+def test_pulse_bad_unit(client):
+    answer = client.request('pulse', card='garden', channels=[3], time=5,
+                            unit='d')
+    assert not answer['ok']
+    assert 'unit' in answer['error']
+
+    # The connection is still served.
+    assert client.request('cards') == {'ok': True, 'cards': ['garden']}
+
+
+def test_unknown_card(client):
+    answer = client.request('status', card='shed')
+    assert not answer['ok']
+
+
+@pytest.mark.parametrize('channels', [[0], [9]])
+def test_set_channel_out_of_range(client, card, channels):
+    answer = client.request('set', card='garden', cmd='CMD_ON',
+                            channels=channels)
+    assert not answer['ok']
+    assert '1...8' in answer['error']
+    assert card.output == 0
+
+    # The connection is still served.
+    assert client.request('set', card='garden', cmd='CMD_ON',
+                          channels=[1])['ok']
+    assert card.output == 0b1
@@ -0,0 +1,46 @@
+'''
+Tests of Metrics, on its own and attached to a VM201RelayCard.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from conftest import PASSWORD, USERNAME
+from Metrics import Metrics
+from VM201RelayCard import VM201RelayCard
+
+
+def test_histogram_quantiles():
+    metrics = Metrics()
+    for i in range(1, 101):
+        metrics.observe('vm201_command_seconds', (), i / 1000.0)
+    histogram = metrics.snapshot()['histograms']['vm201_command_seconds']
+    assert histogram['count'] == 100
+    assert abs(histogram['mean'] - 0.0505) < 1e-9
+    assert histogram['p50'] <= histogram['p90'] <= histogram['p99']
+
+
+def test_prometheus_counters():
+    metrics = Metrics()
+    metrics.increment('vm201_timeouts_total', (('card', 'a:1'),), 2)
+    text = metrics.prometheus()
+    assert '# TYPE vm201_timeouts_total counter' in text
+    assert 'vm201_timeouts_total{card="a:1"} 2' in text
+
+
+def test_timed_with_cmd_by_name(card):
+    metrics = Metrics()
+    relay_card = VM201RelayCard('127.0.0.1', card.port, USERNAME, PASSWORD,
+                                verbose=False, metrics=metrics)
+    relay_card.connect()
+    try:
+        relay_card.set_channels(cmd='CMD_ON', channel_ids=[1])
+        relay_card.set_channels('CMD_OFF', [1])
+    finally:
+        relay_card.disconnect()
+
+    histograms = metrics.snapshot()['histograms']
+    commands = set(key.split('command="')[1].split('"')[0]
+                   for key in histograms if 'command="' in key)
+    assert set(['CMD_ON', 'CMD_OFF']) <= commands
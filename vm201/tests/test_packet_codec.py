@@ -0,0 +1,95 @@
+'''
+Tests of PacketCodec.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import pytest
+
+import PacketCodec
+from PacketCodec import (COMMANDS, MASK_COMMANDS, PacketError, build,
+                         checksum_is_valid, checksum_is_valid_from, decode,
+                         decode_from, decode_many, encode, encode_mask,
+                         pulse_data)
+
+
+MESSAGES = [
+    PacketCodec.Control('CMD_AUTH'),
+    PacketCodec.Control('CMD_STATUS_REQ'),
+    PacketCodec.Credentials('CMD_USERNAME', 'user\x00\x00\x00\x00\x00'),
+    PacketCodec.Name('CMD_NAME', 3, 'Pump'.ljust(16, '\x00')),
+    PacketCodec.Status('CMD_STATUS', 0b101, 0b10, 1),
+    PacketCodec.Switch('CMD_TOGGLE', 0b10000001),
+    PacketCodec.Pulse('CMD_PULSE', 0b100, 30, 'm'),
+]
+
+
+def packet_of(message):
+    ''' The packet of a decoded message, built field by field '''
+    cmd = message.cmd
+    if cmd == 'CMD_NAME':
+        return build(cmd, chr(message.channel) + message.raw)
+    if cmd == 'CMD_STATUS':
+        return build(cmd, chr(message.output) + chr(message.timer) +
+                     chr(message.input))
+    if cmd == 'CMD_PULSE':
+        return build(cmd, chr(message.channels) +
+                     pulse_data(message.time, message.unit))
+    if cmd in MASK_COMMANDS:
+        return build(cmd, chr(message.channels))
+    return build(cmd, ''.join(message[1:]))
+
+
+@pytest.mark.parametrize('message', MESSAGES)
+def test_decode_round_trip(message):
+    packet = packet_of(message)
+    assert len(packet) == COMMANDS['LEN_' + message.cmd]
+    assert checksum_is_valid(packet)
+    assert decode(packet) == message
+    buffer = bytearray('junk' + packet)
+    assert checksum_is_valid_from(buffer, 4)
+    assert decode_from(buffer, 4) == message
+    assert decode_from(memoryview(buffer), 4) == message
+
+
+def test_prebuilt_frames_equal_built_ones():
+    for cmd in MASK_COMMANDS:
+        for mask in (0, 1, 0x80, 0xFF):
+            assert encode(cmd, chr(mask)) == build(cmd, chr(mask))
+            assert encode_mask(cmd, mask) == build(cmd, chr(mask))
+    assert encode('CMD_CLOSED') == build('CMD_CLOSED')
+    assert encode('CMD_PASSWORD', u'pass') == \
+        build('CMD_PASSWORD', 'pass' + 5 * '\x00')
+
+
+def test_name_keeps_letters_only():
+    name = decode(build('CMD_NAME',
+                        '\x01' + 'Pu mp\x7f1'.ljust(16, '\x00')))
+    assert name.name == 'Pump'
+
+
+def test_decode_errors():
+    with pytest.raises(PacketError):
+        decode('\x02\x05?\xb9\x03')
+    with pytest.raises(PacketError):
+        decode(encode('CMD_STATUS_REQ')[:-1])
+    with pytest.raises(PacketError):
+        decode_from('\x02\x06R\x00\xa6\x03')
+    with pytest.raises(PacketError):
+        pulse_data(100)
+    with pytest.raises(PacketError):
+        pulse_data(1, 'd')
+
+
+def test_decode_many_skips_garbage_and_bad_checksums():
+    packets = [packet_of(message) for message in MESSAGES]
+    bad = bytearray(packets[4])
+    bad[-2] ^= 0xFF
+    buffer = bytearray('\xff\x00' + packets[0] + str(bad) + 'xyz' +
+                       ''.join(packets[1:]) + packets[0][:3])
+
+    assert list(decode_many(buffer)) == MESSAGES
+    assert list(decode_many(buffer, validate=False)) == \
+        MESSAGES[:1] + [decode(str(bad))] + MESSAGES[1:]
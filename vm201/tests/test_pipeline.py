@@ -0,0 +1,75 @@
+'''
+Tests of VM201Pipeline, against the simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import pytest
+
+from conftest import PASSWORD, USERNAME
+from VM201RelayCard import LoginError, VM201RelayCard
+
+
+@pytest.fixture
+def relay_card(card):
+    ''' VM201RelayCard with an open socket; not logged in yet '''
+    relay_card = VM201RelayCard('127.0.0.1', card.port, USERNAME, PASSWORD,
+                                verbose=False)
+    relay_card.open_socket(2.0)
+    yield relay_card
+    relay_card.disconnect()
+
+
+def test_login_and_switches_in_one_burst(card, relay_card):
+    pipeline = relay_card.pipeline()
+    pipeline.login()
+    pipeline.status()
+    pipeline.set_channels('CMD_ON', [1, 2])
+    pipeline.set_channels('CMD_ON', [2])
+    pipeline.set_channels('CMD_OFF', [1])
+    pipeline.status()
+    replies = pipeline.execute()
+
+    assert [reply and reply.cmd for reply in replies] == \
+        ['CMD_STATUS', 'CMD_STATUS', 'CMD_STATUS', None, 'CMD_STATUS',
+         'CMD_STATUS']
+    # Each answer is the status right after its own command.
+    assert [reply.output for reply in replies if reply] == \
+        [0b00, 0b00, 0b11, 0b10, 0b10]
+    assert card.output == 0b10
+    assert relay_card.names[1] == 'OutputA'
+
+
+@pytest.mark.parametrize('window', [1, 2, 8])
+def test_window_does_not_change_the_answers(card, relay_card, window):
+    pipeline = relay_card.pipeline(window)
+    pipeline.login()
+    for channel_id in range(1, 9):
+        pipeline.set_channels('CMD_ON', [channel_id])
+    pipeline.pulse([1], 5)
+    replies = pipeline.execute()
+
+    assert [reply.output for reply in replies[1:-1]] == \
+        [(1 << channel_id) - 1 for channel_id in range(1, 9)]
+    # Channel 1 is on already, so the pulse changes nothing.
+    assert replies[-1] is None
+    assert card.output == 0xff
+
+
+def test_pipelined_login_with_a_bad_password(card, relay_card):
+    relay_card.password = 'wrong'
+    pipeline = relay_card.pipeline()
+    pipeline.login()
+    pipeline.status()
+    with pytest.raises(LoginError):
+        pipeline.execute()
+
+
+def test_execute_restores_the_socket_timeout(relay_card):
+    pipeline = relay_card.pipeline()
+    pipeline.login()
+    pipeline.status()
+    pipeline.execute(1.0)
+    assert relay_card.socket.gettimeout() == 2.0
@@ -0,0 +1,77 @@
+'''
+Tests of plan() and VM201Reconciler; the latter against the simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+from random import Random
+
+from conftest import PASSWORD, USERNAME
+from ChannelState import ChannelState, apply_command
+from VM201Reconciler import DesiredState, VM201Reconciler, plan
+
+
+def random_masks(rand):
+    ''' Mostly partial masks; now and then none or all eight channels '''
+    if rand.random() < 0.25:
+        return rand.choice((0, 0xFF))
+    return rand.randrange(256)
+
+
+def test_plan_reaches_the_desired_state():
+    rand = Random(201)
+    for _ in range(5000):
+        state = ChannelState(rand.randrange(256), rand.randrange(256))
+        desired = DesiredState(random_masks(rand), rand.randrange(256),
+                               random_masks(rand), rand.randrange(256))
+        commands = plan(state, desired)
+
+        output, timer = state.output, state.timer
+        for cmd, mask in commands:
+            # Only a CMD_UPDATE to all OFF has no channel bit set.
+            assert 0 < mask <= 0xFF or cmd == 'CMD_UPDATE'
+            output, timer = apply_command(cmd, mask, output, timer)
+        after = ChannelState(output, timer)
+
+        assert desired.is_met(after), (state, desired, commands)
+        # The channels that are not given are left alone.
+        assert (output ^ state.output) & ~desired.output_mask == 0
+        assert (timer ^ state.timer) & ~desired.timer_mask == 0
+        # At most one packet of each kind; none if nothing differs.
+        cmds = [cmd for cmd, mask in commands]
+        assert len(cmds) == len(set(cmds))
+        assert not commands or not desired.is_met(state)
+
+
+def test_plan_uses_update_only_if_all_outputs_are_given():
+    desired = DesiredState(0xFF, 0b1010)
+    assert plan(ChannelState(0b0101), desired) == [('CMD_UPDATE', 0b1010)]
+    desired = DesiredState(0x7F, 0b1010)
+    assert plan(ChannelState(0b0101), desired) == [('CMD_ON', 0b1010),
+                                                   ('CMD_OFF', 0b0101)]
+
+
+def test_reconcile_sends_nothing_once_converged(card):
+    reconciler = VM201Reconciler(timeout=2.0)
+    fleet_card = reconciler.add_card('127.0.0.1', card.port, USERNAME,
+                                     PASSWORD, output={'1': True, '3': False},
+                                     timer={2: True})
+    card.output = 0b110
+
+    results = reconciler.reconcile()
+    assert results[0].ok
+    assert reconciler.sent[fleet_card] == [('CMD_ON', 0b001),
+                                           ('CMD_OFF', 0b100),
+                                           ('CMD_TMR_ENA', 0b010)]
+    assert (card.output, card.timer) == (0b011, 0b010)
+
+    results = reconciler.reconcile()
+    assert results[0].ok and reconciler.sent[fleet_card] == []
+
+    # A manual switch is undone at the next pass.
+    card.output = 0b010
+    reconciler.reconcile()
+    assert reconciler.sent[fleet_card] == [('CMD_ON', 0b001)]
+    assert card.output == 0b011
@@ -0,0 +1,64 @@
+'''
+Tests of VM201RelayCard, against the simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import pytest
+
+from conftest import PASSWORD, USERNAME
+from Metrics import Metrics
+from VM201RelayCard import VM201RelayCard
+
+
+@pytest.fixture
+def metrics():
+    return Metrics()
+
+
+@pytest.fixture
+def relay_card(card, metrics):
+    relay_card = VM201RelayCard('127.0.0.1', card.port, USERNAME, PASSWORD,
+                                verbose=False, metrics=metrics)
+    relay_card.connect()
+    yield relay_card
+    relay_card.disconnect()
+
+
+def received(metrics, relay_card):
+    ''' @return: tuple (packets, bytes) received by relay_card '''
+    labels = relay_card.labels + (('direction', 'rx'),)
+    return (metrics.counters.get(('vm201_packets_total', labels), 0),
+            metrics.counters.get(('vm201_bytes_total', labels), 0))
+
+
+def test_status_poll_does_not_decode_the_names(card, relay_card, metrics):
+    assert relay_card.names[1] == 'OutputA'
+    card.names[0] = 'Pump'
+    card.output = 0b101
+
+    before = received(metrics, relay_card)
+    assert relay_card.status(2.0).output == 0b101
+    after = received(metrics, relay_card)
+
+    # As the firmware: nine CMD_NAME of 22 bytes, then the CMD_STATUS.
+    assert (after[0] - before[0], after[1] - before[1]) == (10, 9 * 22 + 8)
+    # The names are known since connect(); the new one is read then.
+    assert relay_card.names[1] == 'OutputA'
+    relay_card.disconnect()
+    relay_card.connect()
+    assert relay_card.names[1] == 'Pump'
+
+
+def test_wait_for_restores_the_socket_timeout(relay_card):
+    relay_card.socket.settimeout(5.0)
+    relay_card.status(1.0)
+    assert relay_card.socket.gettimeout() == 5.0
+
+
+def test_drain_restores_the_socket_timeout(relay_card):
+    relay_card.socket.settimeout(5.0)
+    relay_card.drain()
+    assert relay_card.socket.gettimeout() == 5.0
@@ -0,0 +1,96 @@
+'''
+Tests of VM201Scheduler, against the simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import socket
+from time import sleep, time
+
+import pytest
+
+from conftest import PASSWORD, USERNAME
+from VM201Scheduler import VM201Scheduler, merge
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = VM201Scheduler(timeout=2.0)
+    yield scheduler
+    scheduler.close()
+
+
+def free_port():
+    ''' A port on which nothing listens '''
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_merge_keeps_the_order_of_conflicting_packets():
+    commands = list()
+    merge(commands, 'CMD_ON', 0b001)
+    merge(commands, 'CMD_ON', 0b100)
+    assert commands == [['CMD_ON', 0b101, '']]
+    merge(commands, 'CMD_OFF', 0b001)
+    merge(commands, 'CMD_ON', 0b001)
+    assert commands == [['CMD_ON', 0b101, ''], ['CMD_OFF', 0b001, ''],
+                        ['CMD_ON', 0b001, '']]
+
+
+def test_batches_share_one_session(card, scheduler):
+    fleet_card = scheduler.add_card('127.0.0.1', card.port, USERNAME,
+                                    PASSWORD)
+    now = time()
+    scheduler.on(now, fleet_card, [1])
+    scheduler.on(now, fleet_card, [3])
+    results = scheduler.run_due(now)
+    assert [result.ok for result in results] == [True]
+    assert results[0].state.output == 0b101
+    sock = scheduler.sessions[fleet_card].card.socket
+
+    scheduler.toggle(now, fleet_card, [1, 2])
+    scheduler.pulse(now, fleet_card, [4], 5)
+    results = scheduler.run_due(now)
+    assert results[0].ok
+    assert card.output == 0b1110
+
+    # No new connect and login for the second batch.
+    assert scheduler.sessions[fleet_card].card.socket is sock
+    assert len(card.clients) == 1
+
+
+def test_card_that_is_down_does_not_hold_up_the_others(card, scheduler):
+    up = scheduler.add_card('127.0.0.1', card.port, USERNAME, PASSWORD)
+    down = scheduler.add_card('127.0.0.1', free_port(), USERNAME, PASSWORD)
+    now = time()
+    scheduler.on(now, down, [1])
+    scheduler.on(now, up, [2])
+
+    start = time()
+    results = scheduler.run_due(now)
+    assert time() - start < scheduler.timeout
+    assert [result.card for result in results] == [down, up]
+    assert not results[0].ok and results[0].error
+    assert results[1].ok and card.output == 0b10
+
+
+def test_serve_forever_sends_when_due(card, scheduler):
+    fleet_card = scheduler.add_card('127.0.0.1', card.port, USERNAME,
+                                    PASSWORD)
+    batches = list()
+    scheduler.on_results = batches.append
+    scheduler.start()
+    scheduler.on(time() + 0.1, fleet_card, [8])
+    cancelled = scheduler.off(time() + 0.1, fleet_card, [8])
+    scheduler.cancel(cancelled)
+
+    deadline = time() + 2.0
+    while not batches and time() < deadline:
+        sleep(0.02)
+    assert len(batches) == 1 and batches[0][0].ok
+    assert card.output == 0b10000000
@@ -0,0 +1,129 @@
+'''
+Tests of VM201ShardedFleet, against the simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import os
+import signal
+from time import sleep, time
+
+import pytest
+
+from VM201Fleet import VM201Fleet
+from VM201ShardedFleet import VM201ShardedFleet
+
+
+CARDS = 12
+
+
+@pytest.fixture
+def cards(simulator):
+    # A port per card, so the cards are spread over the shards.
+    cards = [simulator.add_card(username='card{0}'.format(i),
+                                password='pass')
+             for i in range(CARDS)]
+    simulator.start()
+    return cards
+
+
+@pytest.fixture
+def fleet(cards):
+    fleet = VM201ShardedFleet(shards=3, timeout=2.0, poll=0.2)
+    for card in cards:
+        fleet.add_card('127.0.0.1', card.port, card.username, 'pass')
+    fleet.start()
+    yield fleet
+    fleet.stop()
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time() + timeout
+    while not condition() and time() < deadline:
+        sleep(0.02)
+    return condition()
+
+
+def test_same_results_as_one_fleet(cards, fleet):
+    single = VM201Fleet(timeout=2.0)
+    for card in cards:
+        single.add_card('127.0.0.1', card.port, card.username, 'pass')
+
+    expected = [result.state for result in
+                single.on_off_toggle('CMD_TOGGLE', [1, 3])]
+    single.on_off_toggle('CMD_TOGGLE', [1, 3])
+
+    results = fleet.on_off_toggle('CMD_TOGGLE', [1, 3])
+    assert all(result.ok for result in results)
+    assert [result.state for result in results] == expected
+    assert [card.output for card in cards] == [0b101] * CARDS
+
+
+def test_sessions_stay_open(cards, fleet):
+    assert wait_until(lambda: all(len(card.clients) == 1 for card in cards))
+    for i in range(3):
+        fleet.on_off_toggle('CMD_TOGGLE', [2])
+        fleet.status()
+    # No new login per job: still one client per card.
+    assert all(len(card.clients) == 1 for card in cards)
+
+    fleet.stop()
+    assert wait_until(lambda: not any(card.clients for card in cards))
+
+
+def test_unasked_status_reaches_shared_memory(cards, fleet):
+    assert wait_until(lambda: fleet.state(4)[0] is not None)
+    cards[4].input = 1
+    cards[4].push_status()
+    assert wait_until(lambda: fleet.state(4)[0].input == 1)
+
+
+def test_failed_card_has_no_state(simulator, cards):
+    fleet = VM201ShardedFleet(shards=2, timeout=1.0)
+    fleet.add_card('127.0.0.1', cards[0].port, cards[0].username, 'pass')
+    fleet.add_card('127.0.0.1', cards[1].port, cards[1].username, 'wrong')
+    fleet.start()
+    try:
+        results = fleet.on_off_toggle('CMD_ON', [1])
+    finally:
+        fleet.stop()
+    assert results[0].ok and results[0].state.output == 0b1
+    assert not results[1].ok
+    assert results[1].state is None
+
+
+def test_dead_worker_is_restarted(cards, fleet):
+    # The other workers have to keep answering.
+    assert len(set(card.shard for card in fleet.cards)) > 1
+    fleet.status()
+    shard = fleet.cards[0].shard
+    os.kill(fleet.processes[shard].pid, signal.SIGKILL)
+    fleet.processes[shard].join()
+
+    # No shards: nothing to check, not all of them.
+    assert fleet.restart_dead_workers([]) == []
+    assert fleet.restarts == 0
+
+    start = time()
+    results = fleet.on_off_toggle('CMD_ON', [4])
+    assert time() - start < fleet.timeout
+    assert fleet.restarts == 1
+    assert all(result.ok for result in results)
+    assert all(card.output & 0b1000 for card in cards)
+
+
+def test_restarted_worker_has_no_state_yet(simulator, cards, fleet):
+    fleet.status()
+    shard = fleet.cards[0].shard
+    others = [card.index for card in fleet.cards if card.shard != shard]
+    # The new worker cannot read the cards again.
+    simulator.stop()
+    os.kill(fleet.processes[shard].pid, signal.SIGKILL)
+    fleet.processes[shard].join()
+
+    assert fleet.restart_dead_workers() == [shard]
+    assert all(fleet.state(card.index) == (None, None)
+               for card in fleet.cards if card.shard == shard)
+    assert all(fleet.state(index)[0] is not None for index in others)
@@ -0,0 +1,223 @@
+'''
+Tests of StateHistory against a plain list of every record.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import os
+import random
+from time import time
+
+import pytest
+
+import StateHistory as history_module
+from ChannelState import ChannelState
+from StateHistory import StateHistory
+
+
+CARDS = ['a', 'b', 'c', 'd']
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('history.vm201his'))
+
+
+@pytest.fixture
+def small_index(monkeypatch):
+    ''' Blocks of 8 records, so the queries cross many of them '''
+    monkeypatch.setattr(history_module, 'INDEX_EVERY', 8)
+
+
+def fill(history, records=600, seed=1):
+    '''
+    Record random states of CARDS, a few per timestamp.
+
+    @return: list of (timestamp, card, ChannelState) of the changes, in
+             order; what the history should hold.
+    '''
+
+    rng = random.Random(seed)
+    changes = list()
+    last = dict()
+    timestamp = 1000.0
+    for i in range(records):
+        timestamp += rng.choice([0, 0.5, 1, 3])
+        card = rng.choice(CARDS[:1 + i * len(CARDS) // records])
+        # Few states, so many records repeat the last one.
+        state = ChannelState(rng.choice([0, 1, 5]), rng.choice([0, 2]),
+                             rng.choice([0, 1]))
+        history.record(card, state, timestamp)
+        if last.get(card) != state:
+            last[card] = state
+            changes.append((timestamp, card, state))
+        if rng.random() < 0.05:
+            history.flush()
+    return changes
+
+
+def state_at(changes, card, timestamp):
+    state = None
+    for change_time, change_card, change_state in changes:
+        if change_time > timestamp:
+            break
+        if change_card == card:
+            state = change_state
+    return state
+
+
+def duty_cycle(changes, card, start, end):
+    ''' On-time per channel by summing the time between samples '''
+    on = [0.0] * 8
+    known = 0.0
+    points = sorted(set([start, end] + [t for t, c, s in changes
+                                        if c == card and start < t < end]))
+    for begin, finish in zip(points, points[1:]):
+        state = state_at(changes, card, begin)
+        if state is None:
+            continue
+        known += finish - begin
+        for channel in range(8):
+            if state.output >> channel & 1:
+                on[channel] += finish - begin
+    if not known:
+        return None
+    return [seconds / known for seconds in on]
+
+
+def check(history, changes):
+    rng = random.Random(2)
+    first, last = changes[0][0], changes[-1][0]
+    times = [first - 1, last + 1] + [t for t, c, s in changes[::7]] + \
+        [rng.uniform(first - 1, last + 1) for i in range(100)]
+
+    for card in CARDS + ['unknown']:
+        for timestamp in times:
+            assert history.state_at(card, timestamp) == \
+                state_at(changes, card, timestamp), (card, timestamp)
+
+    assert list(history.transitions()) == changes
+    for i in range(50):
+        start, end = sorted(rng.choice(times) for j in range(2))
+        card = rng.choice(CARDS + [None])
+        assert list(history.transitions(start, end, card)) == \
+            [change for change in changes if start <= change[0] < end and
+             card in (None, change[1])]
+
+        card = rng.choice(CARDS)
+        expected = duty_cycle(changes, card, start, end)
+        duty = history.duty_cycle(card, start, end)
+        if expected is None:
+            assert duty is None
+        else:
+            assert duty == pytest.approx(expected)
+
+
+def test_queries_match_the_records(path, small_index):
+    history = StateHistory(path, keyframe=16)
+    changes = fill(history)
+    check(history, changes)
+    history.close()
+
+    # And the same after loading the file again.
+    history = StateHistory(path, keyframe=16)
+    check(history, changes)
+    history.close()
+
+
+def test_background_thread_writes_in_order(path, small_index):
+    history = StateHistory(path, interval=0.01, keyframe=16).start()
+    changes = fill(history)
+    history.close()
+
+    history = StateHistory(path, readonly=True)
+    check(history, changes)
+    history.close()
+
+
+def test_torn_record_is_cut_off(path):
+    history = StateHistory(path)
+    history.record('a', ChannelState(1), 100.0)
+    history.close()
+    with open(path, 'ab') as f:
+        f.write('\x00' * 5)
+
+    history = StateHistory(path)
+    history.record('a', ChannelState(3), 200.0)
+    history.close()
+
+    history = StateHistory(path, readonly=True)
+    assert history.state_at('a', 150.0) == ChannelState(1)
+    assert history.state_at('a', 250.0) == ChannelState(3)
+    assert [state for timestamp, card, state in history.transitions()] == \
+        [ChannelState(1), ChannelState(3)]
+    history.close()
+
+
+def test_readonly_changes_nothing(path):
+    with pytest.raises(IOError):
+        StateHistory(path, readonly=True)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.cards')
+
+    history = StateHistory(path)
+    history.record('a', ChannelState(1), 100.0)
+    history.close()
+    with open(path, 'ab') as f:
+        f.write('\x00' * 5)
+    size = os.path.getsize(path)
+
+    history = StateHistory(path, readonly=True)
+    assert history.state_at('a', 150.0) == ChannelState(1)
+    with pytest.raises(RuntimeError):
+        history.record('a', ChannelState(2), 200.0)
+    history.close()
+    assert os.path.getsize(path) == size
+
+
+@pytest.mark.parametrize('torn', ['', 'VM201'])
+def test_torn_header_is_written_again(path, torn):
+    with open(path, 'wb') as f:
+        f.write(torn)
+
+    history = StateHistory(path, readonly=True)
+    assert history.state_at('a', 100.0) is None
+    assert list(history.transitions()) == []
+    history.close()
+
+    history = StateHistory(path)
+    history.record('a', ChannelState(1), 100.0)
+    history.close()
+
+    history = StateHistory(path, readonly=True)
+    assert history.state_at('a', 150.0) == ChannelState(1)
+    history.close()
+
+
+def test_bad_magic_without_records(path):
+    with open(path, 'wb') as f:
+        f.write('NOTAHIST\x01')
+    with pytest.raises(ValueError):
+        StateHistory(path, readonly=True)
+    with pytest.raises(ValueError):
+        StateHistory(path)
+
+
+class FakeCard(object):
+    host, port = '192.168.1.100', 9760
+    on_status = None
+
+
+def test_watch_chains_to_the_callback_before(path):
+    seen = list()
+    card = FakeCard()
+    card.on_status = lambda card, old_state, new_state: seen.append(new_state)
+    history = StateHistory(path)
+    history.watch(card)
+
+    card.on_status(card, None, ChannelState(3))
+    assert seen == [ChannelState(3)]
+    assert history.state_at('192.168.1.100:9760', time()) == ChannelState(3)
+    history.close()
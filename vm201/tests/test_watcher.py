@@ -0,0 +1,76 @@
+'''
+Tests of VM201Watcher, against the simulator.
+
+Author: Timo Halbesma
+Date: October 18th, 2026
+Version: 1.0: implemented
+'''
+
+import os
+import signal
+import subprocess
+import sys
+from time import sleep, time
+
+import pytest
+
+from conftest import PASSWORD, USERNAME
+from VM201Session import VM201Session
+from VM201Watcher import VM201Watcher
+
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def watcher(card):
+    session = VM201Session('127.0.0.1', card.port, USERNAME, PASSWORD,
+                           timeout=1.0)
+    watcher = VM201Watcher(session, debounce=0.05, min_interval=0.2,
+                           max_interval=1.0).start()
+    yield watcher
+    watcher.stop()
+
+
+def test_debounced_input_edges(simulator, card, watcher):
+    rising = list()
+    watcher.subscribe(rising.append, channels=[9], falling=False)
+
+    # Bounces within the debounce time, then stable; and back OFF later.
+    for i, level in enumerate([1, 0, 1]):
+        simulator.set_input(card, level, 0.01 * i)
+    simulator.set_input(card, 0, 0.5)
+
+    edges = [(edge.channel, edge.rising)
+             for edge in watcher.events(channels=[9], timeout=1.5)]
+    assert edges == [(9, True), (9, False)]
+    assert [(edge.channel, edge.rising) for edge in rising] == [(9, True)]
+
+
+def test_relay_edges(watcher):
+    watcher.session.set_channels('CMD_ON', [2, 3])
+    edges = sorted((edge.channel, edge.rising)
+                   for edge in watcher.events(timeout=0.5))
+    assert edges == [(2, True), (3, True)]
+
+
+def test_events_timeout(watcher):
+    start = time()
+    assert list(watcher.events(timeout=0.3)) == []
+    assert time() - start < 1.0
+
+
+def test_cli_stops_on_ctrl_c(card):
+    # A quiet input; Ctrl-C has to end the CLI without waiting for an edge.
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'VM201Watcher.py'), '127.0.0.1',
+         str(card.port), USERNAME, PASSWORD],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    sleep(1.0)
+    process.send_signal(signal.SIGINT)
+    deadline = time() + 3.0
+    while process.poll() is None and time() < deadline:
+        sleep(0.05)
+    if process.poll() is None:
+        process.kill()
+        pytest.fail('The watcher CLI ignored Ctrl-C')